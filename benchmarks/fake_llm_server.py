@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the OpenAI chat-completions API, for load tests.
+
+Serves POST /v1/chat/completions (streamed and non-streamed) with a
+configurable delay before the first token, streaming chunk rate and
+error injection. Requests with a json_schema response_format get a JSON
+object built from the schema (strings filled with text, booleans true), so
+the validators and structured reflection calls parse and pass.
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+
+Usage:
+    python benchmarks/fake_llm_server.py --port 8089 --latency 0.4 --chunk-rate 40 --error-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FILLER = (
+    "That is a thoughtful answer. Try to describe how you feel and what you need, "
+    "and invite your family member to find a solution together with you."
+).split()
+
+
+class FakeLLMServer:
+    """Threaded fake server; start() returns the base URL to hand to the SDK."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.3, chunk_rate: float = 50.0,
+                 error_rate: float = 0.0, words: int = 40, seed=None):
+        self.latency = latency
+        self.chunk_rate = chunk_rate
+        self.error_rate = error_rate
+        self.words = words
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    # -----------------------------
+    # Responses
+    # -----------------------------
+    def _text(self) -> str:
+        return " ".join(FILLER[i % len(FILLER)] for i in range(self.words))
+
+    def _content(self, request: dict) -> str:
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") != "json_schema":
+            return self._text()
+        properties = response_format["json_schema"]["schema"].get("properties", {})
+        value = {}
+        for name, spec in properties.items():
+            kind = spec.get("type")
+            value[name] = True if kind == "boolean" else 0 if kind in ("integer", "number") else self._text()
+        return json.dumps(value)
+
+    def _pieces(self, content: str, structured: bool) -> list:
+        if structured:
+            return [content[i:i + 12] for i in range(0, len(content), 12)]
+        words = content.split(" ")
+        return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                server._count("requests")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+
+                time.sleep(server.latency)
+                if server._should_fail():
+                    server._count("errors")
+                    return self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+
+                content = server._content(request)
+                model = request.get("model", "fake")
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in request.get("messages", []))
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                         "total_tokens": prompt_tokens + len(content) // 4}
+
+                if not request.get("stream"):
+                    return self._send_json(200, {
+                        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+
+                server._count("streamed")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                def event(delta: dict, finish=None, with_usage=None):
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [] if delta is None else
+                             [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                    if with_usage is not None:
+                        chunk["usage"] = with_usage
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+
+                interval = 1.0 / server.chunk_rate if server.chunk_rate > 0 else 0.0
+                self.close_connection = True
+                try:
+                    event({"role": "assistant", "content": ""})
+                    for piece in server._pieces(content, "response_format" in request):
+                        if interval:
+                            time.sleep(interval)
+                        event({"content": piece})
+                    event({}, finish="stop")
+                    if (request.get("stream_options") or {}).get("include_usage"):
+                        event(None, with_usage=usage)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up on the stream (timeout or a hedged duplicate lost)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat-completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first byte")
+    parser.add_argument("--chunk-rate", type=float, default=50.0, help="streamed chunks per second (0 = no delay)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--words", type=int, default=40, help="words per text response")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency, args.chunk_rate, args.error_rate, args.words)
+    print(f"Serving on {server.start()}  (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
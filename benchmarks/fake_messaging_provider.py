@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for a WhatsApp-style messaging provider, for the webhook channel.
+
+Serves POST <base>/messages, where channels/whatsapp.py posts its replies,
+with a configurable delay and error injection, and keeps every message it
+accepted. inbound_payload() builds the webhook body the provider would
+deliver for a trainee's message (WhatsApp Cloud API shape), and deliver()
+posts one to the channel.
+
+Point the channel at it with ZARA_PROVIDER_URL=http://127.0.0.1:<port>/v1.
+Run on its own it is a terminal phone: each line typed is delivered to the
+channel as the given user, and the replies are printed as they arrive.
+
+Usage:
+    python benchmarks/fake_messaging_provider.py --port 8090 --webhook http://127.0.0.1:8080/webhook --user 923001234567
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+
+def inbound_payload(user: str, text: str, message_id: str = None) -> dict:
+    """The webhook body for one text message from `user`."""
+    message = {"from": user, "id": message_id or f"wamid.{uuid.uuid4().hex}", "timestamp": str(int(time.time())),
+               "type": "text", "text": {"body": text}}
+    return {"object": "whatsapp_business_account", "entry": [{"id": "fake", "changes": [{"field": "messages", "value": {
+        "messaging_product": "whatsapp", "contacts": [{"wa_id": user}], "messages": [message]}}]}]}
+
+
+def deliver(webhook_url: str, user: str, text: str, message_id: str = None) -> int:
+    """Post one inbound message to the channel; returns the HTTP status."""
+    return httpx.post(webhook_url, json=inbound_payload(user, text, message_id), timeout=10).status_code
+
+
+class FakeMessagingProvider:
+    """Threaded fake messages API; start() returns the base URL to hand to the channel.
+
+    `on_message(to, text)` is called, on a server thread, for every message accepted.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+                 on_message=None, keep: bool = True, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.on_message = on_message
+        self.keep = keep
+        self.messages = []          # (to, text, received at)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "messages": 0, "errors": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-provider", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _accept(self, request: dict) -> bool:
+        with self._lock:
+            self.stats["requests"] += 1
+            if self._random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return False
+            self.stats["messages"] += 1
+            if self.keep:
+                self.messages.append((request.get("to"), (request.get("text") or {}).get("body"), time.time()))
+        return True
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/messages"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+                if provider.latency:
+                    time.sleep(provider.latency)
+                if not provider._accept(request):
+                    return self._send_json(500, {"error": {"message": "injected failure"}})
+                if provider.on_message is not None:
+                    provider.on_message(request.get("to"), (request.get("text") or {}).get("body"))
+                self._send_json(200, {"messaging_product": "whatsapp", "contacts": [{"wa_id": request.get("to")}],
+                                      "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake WhatsApp-style messaging provider.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each send is answered")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of sends answered with HTTP 500")
+    parser.add_argument("--webhook", default="http://127.0.0.1:8080/webhook", help="the channel's webhook URL")
+    parser.add_argument("--user", default="923000000001", help="phone number the typed lines come from")
+    args = parser.parse_args()
+
+    def show(to, text):
+        print(f"\n[Zara -> {to}]\n{text}\n", flush=True)
+
+    provider = FakeMessagingProvider(args.host, args.port, args.latency, args.error_rate, on_message=show)
+    print(f"Provider on {provider.start()}; type messages for {args.webhook} (Ctrl+D to stop)")
+    try:
+        for line in sys.stdin:
+            if line.strip():
+                status = deliver(args.webhook, args.user, line.strip())
+                if status != 200:
+                    print(f"(webhook answered {status})")
+    except KeyboardInterrupt:
+        pass
+    provider.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-session load test for the Streamlit app against a fake LLM server.
+
+Each simulated trainee is one Streamlit AppTest session of main.py that
+picks a tab and types a scripted conversation through it (I_WE,
+partners_interest or general_flow, round-robin). All LLM traffic, on the
+OpenAI and the Groq routes, goes to benchmarks/fake_llm_server.py, started
+in-process unless --base-url is given, so no API credits are spent.
+
+Reported:
+- throughput (turns/s and sessions/s) at the chosen concurrency;
+- per-stage turn latency (p50/p95) per flow, i.e. server time of the
+  script run that handles the turn;
+- process RSS per session (growth after all sessions ran, divided by the
+  number of sessions kept alive);
+- script runs per turn, from the flow engine's rerun_stats(): runs_per_turn
+  leaves out the reruns below, and waits_per_turn counts them separately.
+  AppTest has no fragments, so while a turn's background LLM job runs this
+  test polls it with full reruns; in the browser those polls are fragment
+  runs and cost no script pass;
+- peak thread count of the process and the LLM job counters, to check that
+  threads no longer grow with the number of calls in flight;
+- session evictions and rehydrations (set ZARA_SESSION_MEMORY_MB low to
+  exercise them);
+- fake server request and error counts.
+
+Usage:
+    python benchmarks/load_test.py --sessions 24 --concurrency 8 --latency 0.3 --chunk-rate 50 --error-rate 0.02
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import contextlib
+import importlib
+import json
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.testing.v1 import AppTest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import FakeLLMServer  # noqa: E402
+
+
+MAIN_SCRIPT = os.path.join(REPO_ROOT, "main.py")
+POLL_SECONDS = 0.05
+TESTED_STREAMLIT = ("1.65",)   # versions shared_apptest_globals() has been run against
+
+# (radio label fragment, stage key, scripted inputs); "{n}" makes each session's text unique
+# so the answer and validator caches don't turn the test into a cache benchmark.
+SCRIPTS = {
+    "I_WE": ("I We", "iwe_stage", [
+        "1",
+        "I feel worried when we argue about money, session {n}.",
+        "1",
+        "We can plan the shop hours together so the children are looked after, session {n}.",
+        "How can I say this to my mother-in-law? (session {n})",
+    ]),
+    "partners_interest": ("Partner", "partner_stage", [
+        "1",
+        "It was important to me to keep my tailoring business open, session {n}.",
+        "1",
+        "My husband was worried about what relatives would say, session {n}.",
+        "What else can I do if he still refuses? (session {n})",
+    ]),
+    "general_flow": ("General Flow", "focus_stage", [
+        "1",
+        "Why should I avoid saying 'you always'? (session {n})",
+        "1",
+        "1",
+        "Can a wife get khula if her husband does not agree? (session {n})",
+    ]),
+}
+
+
+@contextlib.contextmanager
+def shared_apptest_globals(secrets: dict):
+    """Let AppTest sessions run concurrently in one process, for the duration of the block.
+
+    AppTest installs a mock Runtime, the test secrets and the global.appTest
+    config override as process globals for the duration of each run and
+    clears them afterwards, which pulls them out from under sessions still
+    running in other threads. Inside the block secrets and the config option
+    are set once, globally, and the most recent mock Runtime stays visible
+    between runs. Script compilation is serialised: ast.parse on Python 3.11
+    fails with "recursion depth mismatch" when several threads parse at once.
+
+    This patches private Streamlit internals (Runtime.instance/exists,
+    ScriptCache.get_bytecode, st.secrets); everything is restored on exit.
+    Tested with the Streamlit versions in TESTED_STREAMLIT; run with
+    --concurrency 1 if a different version misbehaves.
+    """
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+
+    if not st.__version__.startswith(TESTED_STREAMLIT):
+        print(f"warning: concurrent AppTest sessions are tested with Streamlit {', '.join(TESTED_STREAMLIT)}, "
+              f"not {st.__version__}", file=sys.stderr)
+
+    original_secrets = st.secrets
+    original_app_test = config.get_option("global.appTest")
+    original_instance = Runtime.instance.__func__
+    original_exists = Runtime.exists.__func__
+    original_get_bytecode = ScriptCache.get_bytecode
+
+    shared = Secrets()
+    shared._secrets = dict(secrets)
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last["runtime"] = cls._instance
+            return cls._instance
+        return last.get("runtime") or original_instance(cls)
+
+    def exists(cls):
+        return cls._instance is not None or "runtime" in last
+
+    compile_lock = threading.Lock()
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            return original_get_bytecode(self, script_path)
+
+    st.secrets = shared
+    config.set_option("global.appTest", True)
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+    ScriptCache.get_bytecode = get_bytecode
+    try:
+        yield
+    finally:
+        ScriptCache.get_bytecode = original_get_bytecode
+        Runtime.exists = classmethod(original_exists)
+        Runtime.instance = classmethod(original_instance)
+        config.set_option("global.appTest", original_app_test)
+        st.secrets = original_secrets
+
+
+def llm_job_stats() -> dict:
+    from core.llm_jobs import get_job_executor  # the app's process-wide job loop
+    return get_job_executor().stats()
+
+
+def job_pending(app, flow: str) -> bool:
+    tab_name = importlib.import_module(f"tabs.{flow}").FLOW.tab_name
+    return f"_flow_job::{tab_name}" in app.session_state
+
+
+def session_memory_stats() -> dict:
+    from core.session_memory import get_session_memory  # the app's process-wide manager
+    return get_session_memory().stats()
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, on platforms without /proc
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+# -----------------------------
+# One simulated trainee
+# -----------------------------
+def run_session(number: int, flow: str, timeout: float) -> dict:
+    label, stage_key, inputs = SCRIPTS[flow]
+    app = AppTest.from_file(MAIN_SCRIPT, default_timeout=timeout)
+    app.run()
+    option = next(o for o in app.radio[0].options if label in o)
+    app.radio[0].set_value(option).run()
+
+    turns, failures = [], 0
+    for text in inputs:
+        stage = app.session_state[stage_key]
+        started = time.perf_counter()
+        app.chat_input[0].set_value(text.format(n=number)).run()
+        # A turn that calls an LLM runs as a background job; rerun like the page's poll until it ends
+        while job_pending(app, flow) and time.perf_counter() - started < timeout:
+            time.sleep(POLL_SECONDS)
+            app.run()
+        turns.append((stage, time.perf_counter() - started))
+        failures += len(app.exception)
+
+    from core.flow_engine import rerun_stats  # imported by the app's first run
+    stats = rerun_stats(app.session_state)
+    return {"flow": flow, "turns": turns, "runs": stats["runs"], "waits": stats["waits"], "flow_turns": stats["turns"],
+            "exceptions": failures, "final_stage": app.session_state[stage_key], "app": app}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=12, help="simulated trainees in total")
+    parser.add_argument("--concurrency", type=int, default=4, help="trainees active at the same time")
+    parser.add_argument("--flows", nargs="+", default=list(SCRIPTS), choices=list(SCRIPTS))
+    parser.add_argument("--base-url", help="use an already running server instead of starting the fake one")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--chunk-rate", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per script run, seconds")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        server = FakeLLMServer(latency=args.latency, chunk_rate=args.chunk_rate, error_rate=args.error_rate, seed=0)
+        base_url = server.start()
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["GROQ_BASE_URL"] = base_url.rsplit("/v1", 1)[0]  # the Groq SDK adds /openai/v1 itself
+    os.environ.setdefault("ZARA_CACHE_DIR", tempfile.mkdtemp(prefix="zara-load-"))
+    with shared_apptest_globals({"OPENAI_API_KEY": "fake-key", "GROQ_KEY": "fake-key"}):
+        # Warm-up session: imports, cached resources and the retrieval index are paid once here.
+        run_session(-1, args.flows[0], args.timeout)
+        baseline_rss = rss_bytes()
+
+        results, lock = [], threading.Lock()
+        peak_threads, sampling = [threading.active_count()], threading.Event()
+
+        def sample_threads():
+            while not sampling.wait(0.05):
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+        threading.Thread(target=sample_threads, daemon=True).start()
+
+        def worker(number: int):
+            result = run_session(number, args.flows[number % len(args.flows)], args.timeout)
+            with lock:
+                results.append(result)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="trainee") as pool:
+            list(pool.map(worker, range(args.sessions)))
+        wall = time.perf_counter() - started
+        sampling.set()
+        rss_per_session = (rss_bytes() - baseline_rss) / max(len(results), 1)  # sessions are still referenced here
+
+    by_stage = defaultdict(list)
+    for result in results:
+        for stage, seconds in result["turns"]:
+            by_stage[(result["flow"], stage)].append(seconds)
+    total_turns = sum(len(r["turns"]) for r in results)
+    flow_turns = sum(r["flow_turns"] for r in results)
+    report = {
+        "sessions": len(results),
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 2),
+        "turns_per_second": round(total_turns / wall, 2),
+        "sessions_per_second": round(len(results) / wall, 3),
+        "rss_per_session_kb": round(rss_per_session / 1024, 1),
+        # Full runs that did work per turn; the poll reruns AppTest needs instead of fragments are counted apart
+        "runs_per_turn": round(sum(r["runs"] - r["waits"] for r in results) / max(flow_turns, 1), 2),
+        "waits_per_turn": round(sum(r["waits"] for r in results) / max(flow_turns, 1), 2),
+        "script_exceptions": sum(r["exceptions"] for r in results),
+        "incomplete_sessions": sum(r["final_stage"] < 4 for r in results),
+        "server": dict(server.stats) if server else None,
+        "session_memory": session_memory_stats(),
+        "peak_threads": peak_threads[0],
+        "llm_jobs": llm_job_stats(),
+        "stages": {
+            f"{flow}:{stage}": {"turns": len(values), "p50_ms": round(percentile(values, 50) * 1000, 1),
+                                "p95_ms": round(percentile(values, 95) * 1000, 1)}
+            for (flow, stage), values in sorted(by_stage.items())
+        },
+    }
+
+    print(f"{report['sessions']} sessions x {args.concurrency} concurrent in {report['wall_seconds']} s: "
+          f"{report['turns_per_second']} turns/s, {report['rss_per_session_kb']} KB RSS/session, "
+          f"{report['runs_per_turn']} runs/turn (+{report['waits_per_turn']} poll reruns), "
+          f"{report['script_exceptions']} exceptions, "
+          f"{report['incomplete_sessions']} incomplete")
+    if server:
+        print(f"fake server: {server.stats}")
+    print(f"session memory: {report['session_memory']}")
+    print(f"peak threads: {report['peak_threads']}, llm jobs: {report['llm_jobs']}")
+    print(f"\n{'flow:stage':<22} {'turns':>6} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, row in report["stages"].items():
+        print(f"{name:<22} {row['turns']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if server:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
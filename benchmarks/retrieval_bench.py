@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retrieval quality and latency against gold case labels.
+
+Questions and their relevant judgments are in evaluation/retrieval_gold.json
+(the evalDataset.txt questions plus extra ones about topics the dataset does
+not cover). For every chunking strategy x retriever the benchmark reports,
+at the case level (several chunks of one judgment count once):
+
+- recall@k, MRR and nDCG@k over questions that have relevant judgments;
+- grounded: share of questions with relevant judgments whose top results
+  pass rag.retriever.grounded, i.e. that reach the prompt at all;
+- false grounding: share of questions with no relevant judgment whose top
+  results still pass it (the gate's constants are calibrated on these two);
+- per-query latency (p50/p95, query embedding included) and index memory.
+
+Everything runs offline on CPU. Embedders missing from the local Hugging
+Face cache (or without sentence-transformers installed) are skipped, so
+the BM25 rows are always available.
+
+Usage:
+    python benchmarks/retrieval_bench.py --k 3 5 --embedders sentence-transformers/all-MiniLM-L6-v2
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import json
+import math
+import re
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from core.embeddings import DEFAULT_MODEL, embed_texts, get_embedder  # noqa: E402
+from rag import retriever as retriever_module  # noqa: E402
+from rag.corpus import Chunk, load_chunks  # noqa: E402
+from rag.retriever import HybridRetriever, grounded  # noqa: E402
+from rag.vector_index import VectorIndex  # noqa: E402
+
+
+GOLD_PATH = os.path.join(REPO_ROOT, "evaluation", "retrieval_gold.json")
+SEARCH_DEPTH = 20   # chunks fetched per query before collapsing to cases
+GATE_DEPTH = 3      # passages retrieve_for_question gates on (its default top_k)
+
+
+# -----------------------------
+# Chunking strategies
+# -----------------------------
+def chunk_by_case(chunks: list) -> list:
+    """The production chunking: one chunk per judgment bullet."""
+    return chunks
+
+
+def _windows(units: list, size: int, stride: int) -> list:
+    if len(units) <= size:
+        return [units]
+    return [units[i:i + size] for i in range(0, len(units) - size + stride, stride)]
+
+
+def chunk_by_sentences(chunks: list, size: int = 3, stride: int = 2) -> list:
+    out = []
+    for chunk in chunks:
+        sentences = re.split(r"(?<=[.!?)])\s+", chunk.text)
+        for i, window in enumerate(_windows(sentences, size, stride)):
+            out.append(Chunk(f"{chunk.id}#s{i}", chunk.section, chunk.case_name, " ".join(window)))
+    return out
+
+
+def chunk_by_words(chunks: list, size: int = 60, stride: int = 45) -> list:
+    out = []
+    for chunk in chunks:
+        for i, window in enumerate(_windows(chunk.text.split(), size, stride)):
+            out.append(Chunk(f"{chunk.id}#w{i}", chunk.section, chunk.case_name, " ".join(window)))
+    return out
+
+
+CHUNKERS = {"case": chunk_by_case, "sentences": chunk_by_sentences, "words": chunk_by_words}
+
+
+# -----------------------------
+# Metrics
+# -----------------------------
+def ranked_cases(chunks: list) -> list:
+    cases = []
+    for chunk in chunks:
+        if chunk.parties not in cases:
+            cases.append(chunk.parties)
+    return cases
+
+
+def recall_at_k(ranked: list, gold: set, k: int) -> float:
+    return len(set(ranked[:k]) & gold) / len(gold)
+
+
+def reciprocal_rank(ranked: list, gold: set) -> float:
+    for rank, case in enumerate(ranked, 1):
+        if case in gold:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(ranked: list, gold: set, k: int) -> float:
+    dcg = sum(1.0 / math.log2(i + 2) for i, case in enumerate(ranked[:k]) if case in gold)
+    ideal = sum(1.0 / math.log2(i + 2) for i in range(min(len(gold), k)))
+    return dcg / ideal
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+# -----------------------------
+# Retrievers
+# -----------------------------
+def _traced(build):
+    """(result, bytes still allocated by build())"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def build_retrievers(chunks: list, embedders: list) -> dict:
+    """{name: (search(question) -> [(Chunk, Passage or None)], index bytes)}"""
+    bm25, bm25_bytes = _traced(lambda: HybridRetriever(chunks))
+    retrievers = {
+        "bm25": (lambda q: [(p.chunk, p) for p in bm25.search(q, SEARCH_DEPTH)], bm25_bytes),
+    }
+    for model_name in embedders:
+        if get_embedder(model_name) is None:
+            print(f"  skipping {model_name}: not available offline", file=sys.stderr)
+            continue
+        vectors = embed_texts([c.embedding_text for c in chunks], model_name)
+        index = VectorIndex(vectors, chunks, {"model": model_name, "corpus_hash": ""})
+        hybrid = HybridRetriever(chunks, index)
+        short = model_name.rsplit("/", 1)[-1]
+        retrievers[f"dense:{short}"] = (
+            lambda q, index=index: [(c, None) for _, c in index.search_text(q, SEARCH_DEPTH)], int(vectors.nbytes)
+        )
+        retrievers[f"hybrid:{short}"] = (
+            lambda q, hybrid=hybrid: [(p.chunk, p) for p in hybrid.search(q, SEARCH_DEPTH)],
+            bm25_bytes + int(vectors.nbytes),
+        )
+    return retrievers
+
+
+def evaluate(search, questions: list, ks: list) -> dict:
+    retriever_module._query_vector.cache_clear()  # time query embedding too
+    scores = {f"recall@{k}": [] for k in ks}
+    scores.update({f"ndcg@{k}": [] for k in ks})
+    scores["mrr"] = []
+    latencies, kept, false_grounding = [], [], []
+    for item in questions:
+        started = time.perf_counter()
+        results = search(item["question"])
+        latencies.append((time.perf_counter() - started) * 1000)
+        gold = set(item["cases"])
+        passages = [p for _, p in results[:GATE_DEPTH] if p is not None]
+        if passages:
+            (kept if gold else false_grounding).append(grounded(passages))
+        if not gold:
+            continue
+        ranked = ranked_cases([chunk for chunk, _ in results])
+        for k in ks:
+            scores[f"recall@{k}"].append(recall_at_k(ranked, gold, k))
+            scores[f"ndcg@{k}"].append(ndcg_at_k(ranked, gold, k))
+        scores["mrr"].append(reciprocal_rank(ranked, gold))
+    row = {name: sum(values) / len(values) for name, values in scores.items() if values}
+    row["grounded"] = sum(kept) / len(kept) if kept else None
+    row["false_grounding"] = sum(false_grounding) / len(false_grounding) if false_grounding else None
+    row["p50_ms"] = percentile(latencies, 50)
+    row["p95_ms"] = percentile(latencies, 95)
+    return row
+
+
+def load_gold(path: str, chunks: list) -> list:
+    with open(path, encoding="utf-8") as f:
+        questions = json.load(f)["questions"]
+    known = {chunk.parties for chunk in chunks}
+    unknown = {case for item in questions for case in item["cases"]} - known
+    if unknown:
+        raise ValueError(f"Gold labels name cases not in the corpus: {sorted(unknown)}")
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gold", default=GOLD_PATH)
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5])
+    parser.add_argument("--chunkers", nargs="+", default=list(CHUNKERS), choices=list(CHUNKERS))
+    parser.add_argument("--embedders", nargs="*", default=[DEFAULT_MODEL])
+    parser.add_argument("--source", choices=["all", "evalDataset", "extra"], default="all")
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    base = load_chunks()
+    questions = load_gold(args.gold, base)
+    if args.source != "all":
+        questions = [q for q in questions if q["source"] == args.source]
+    labelled = sum(bool(q["cases"]) for q in questions)
+    print(f"{len(questions)} questions ({labelled} with relevant judgments), corpus of {len(base)} judgments\n")
+
+    metric_names = [f"recall@{k}" for k in args.k] + ["mrr"] + [f"ndcg@{k}" for k in args.k]
+    header = f"{'chunker':<10} {'retriever':<26} {'chunks':>6} " + " ".join(f"{m:>9}" for m in metric_names)
+    print(header + f" {'grounded':>9} {'false gr.':>9} {'p50 ms':>7} {'p95 ms':>7} {'index KB':>9}")
+
+    rows = []
+    for chunker_name in args.chunkers:
+        chunks = CHUNKERS[chunker_name](base)
+        for retriever_name, (search, index_bytes) in build_retrievers(chunks, args.embedders).items():
+            row = evaluate(search, questions, args.k)
+            row.update({"chunker": chunker_name, "retriever": retriever_name, "chunks": len(chunks), "index_bytes": index_bytes})
+            rows.append(row)
+            kept, false_grounding = ("-" if row[m] is None else f"{row[m]:.2f}" for m in ("grounded", "false_grounding"))
+            print(f"{chunker_name:<10} {retriever_name:<26} {len(chunks):>6} "
+                  + " ".join(f"{row.get(m, 0.0):>9.3f}" for m in metric_names)
+                  + f" {kept:>9} {false_grounding:>9} {row['p50_ms']:>7.2f} {row['p95_ms']:>7.2f} {index_bytes / 1024:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
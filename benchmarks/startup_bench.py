@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold-start benchmark: import time and RSS per module.
+
+Each module is imported in a fresh interpreter that has already imported
+streamlit (every pod pays for that anyway), so the numbers are what the
+module itself adds to a cold start: main.py's own imports, each tab module
+(what load_tab() pays on first use) and the heavy third-party stacks in
+the deployment image. Modules that are not installed are reported as
+missing, not as failures.
+
+Optionally (--app) the first AppTest run of main.py is timed as well, i.e.
+what the first trainee on a new pod waits for before the page draws.
+
+With --budget-seconds / --budget-mb the script exits non-zero when main.py's
+startup imports exceed the budget, so it can gate an image build.
+
+Usage:
+    python benchmarks/startup_bench.py --app --budget-seconds 3 --budget-mb 150
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_SCRIPT = os.path.join(REPO_ROOT, "main.py")
+
+# What main.py imports at module load; their sum is the startup budget.
+STARTUP_MODULES = ["tabs", "core.feedback_library", "core.llm_gateway", "core.llm_jobs", "core.llm_router",
+                   "core.session_memory", "core.session_store", "core.telemetry", "core.warmup"]
+TAB_MODULES = ["tabs.partners_interest", "tabs.I_WE", "tabs.general_flow"]
+HEAVY_MODULES = ["langchain_community", "chromadb", "sentence_transformers", "pypdf", "docx"]
+
+# Runs in the child interpreter: baseline, then the import under test.
+_PROBE = r"""
+import json, sys, time
+import resource
+import streamlit
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+name = sys.argv[1]
+before_mods, before_rss = len(sys.modules), rss_mb()
+started = time.perf_counter()
+try:
+    __import__(name)
+    status, error = "ok", None
+except ModuleNotFoundError as e:
+    status, error = ("missing" if e.name and name.startswith(e.name) else "error"), str(e)
+except Exception as e:
+    status, error = "error", f"{type(e).__name__}: {e}"
+print(json.dumps({"module": name, "status": status, "error": error,
+                  "seconds": round(time.perf_counter() - started, 3),
+                  "rss_mb": round(rss_mb() - before_rss, 1),
+                  "modules_loaded": len(sys.modules) - before_mods}))
+"""
+
+
+def probe(module: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run([sys.executable, "-c", _PROBE, module], cwd=REPO_ROOT, env=env,
+                          capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode or not lines:
+        return {"module": module, "status": "error", "error": proc.stderr.strip()[-300:]}
+    return json.loads(lines[-1])
+
+
+def first_app_run() -> dict:
+    """Seconds for the first AppTest run of main.py in this (already warm-interpreter) process."""
+    from streamlit.testing.v1 import AppTest
+
+    sys.path.insert(0, REPO_ROOT)
+    at = AppTest.from_file(MAIN_SCRIPT, default_timeout=120)
+    at.secrets["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY", "sk-bench")
+    at.secrets["GROQ_KEY"] = os.getenv("GROQ_KEY", "gsk-bench")
+    started = time.perf_counter()
+    at.run()
+    return {"seconds": round(time.perf_counter() - started, 3), "exceptions": len(at.exception)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", action="store_true", help="also time the first AppTest run of main.py")
+    parser.add_argument("--budget-seconds", type=float, help="fail if main.py's startup imports take longer")
+    parser.add_argument("--budget-mb", type=float, help="fail if main.py's startup imports add more RSS")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = {"startup": [probe(m) for m in STARTUP_MODULES],
+              "tabs": [probe(m) for m in TAB_MODULES],
+              "heavy": [probe(m) for m in HEAVY_MODULES]}
+    # Each child imports independently, so shared dependencies are counted per module; the
+    # whole startup set imported together is the figure the budget applies to.
+    report["startup_total"] = probe("main")
+    if args.app:
+        report["first_app_run"] = first_app_run()
+
+    total = report["startup_total"]
+    over = []
+    if args.budget_seconds is not None and total.get("seconds", 0) > args.budget_seconds:
+        over.append(f"startup imports took {total['seconds']}s > {args.budget_seconds}s")
+    if args.budget_mb is not None and total.get("rss_mb", 0) > args.budget_mb:
+        over.append(f"startup imports added {total['rss_mb']} MB > {args.budget_mb} MB")
+    report["over_budget"] = over
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for group in ("startup", "tabs", "heavy"):
+            print(f"{group}:")
+            for row in report[group]:
+                if row["status"] == "ok":
+                    print(f"  {row['module']:<24} {row['seconds']:>7.3f}s  {row['rss_mb']:>7.1f} MB  "
+                          f"{row['modules_loaded']:>5} modules")
+                else:
+                    print(f"  {row['module']:<24} {row['status']}: {row['error']}")
+        if total["status"] == "ok":
+            print(f"main.py imports: {total['seconds']:.3f}s, {total['rss_mb']:.1f} MB")
+        else:
+            print(f"main.py imports: {total['status']}: {total['error']}")
+        if args.app:
+            print(f"first app run: {report['first_app_run']['seconds']:.3f}s, "
+                  f"{report['first_app_run']['exceptions']} exceptions")
+        for line in over:
+            print(f"OVER BUDGET: {line}")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Server CPU per turn against history length: full repaint vs windowed transcript.
+
+Runs a minimal app through Streamlit's AppTest with a seeded history of N
+messages and times script reruns with time.process_time(). "full" is the old
+behaviour (whole history rendered, twice on a stage transition); "windowed"
+uses core/transcript.py.
+
+Usage:
+    python benchmarks/transcript_bench.py --lengths 10 50 200 500 --turns 5
+"""
+
+import argparse
+import os
+import time
+
+from streamlit.testing.v1 import AppTest
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_TEMPLATE = """
+import sys
+sys.path.insert(0, {root!r})
+import streamlit as st
+from core.transcript import render_history, render_new
+
+tab = "bench"
+if "messages" not in st.session_state:
+    st.session_state.messages = {{tab: [{{"role": "system", "content": "system"}}] + [
+        {{"role": "user" if i % 2 else "assistant", "content": f"Message **{{i}}** " + "lorem ipsum " * 20}}
+        for i in range({length})
+    ]}}
+
+st.session_state.messages[tab].append({{"role": "user", "content": "new turn"}})
+st.session_state.messages[tab].append({{"role": "assistant", "content": "reply"}})
+
+if {mode!r} == "full":
+    for _ in range(2):  # top-of-run render plus the repaint after the stage transition
+        for msg in st.session_state.messages[tab]:
+            if msg["role"] != "system":
+                with st.chat_message(msg["role"]):
+                    st.markdown(msg["content"])
+else:
+    render_history(tab)
+    render_new(tab)
+"""
+
+
+def cpu_per_turn(mode: str, length: int, turns: int) -> float:
+    app = AppTest.from_string(APP_TEMPLATE.format(root=REPO_ROOT, mode=mode, length=length), default_timeout=60)
+    app.run()  # warm-up: imports and session seeding
+    started = time.process_time()
+    for _ in range(turns):
+        app.run()
+    return (time.process_time() - started) / turns * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'history':>8} {'full ms/turn':>14} {'windowed ms/turn':>18} {'speedup':>8}")
+    for length in args.lengths:
+        full = cpu_per_turn("full", length, args.turns)
+        windowed = cpu_per_turn("windowed", length, args.turns)
+        print(f"{length:>8} {full:>14.1f} {windowed:>18.1f} {full / windowed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
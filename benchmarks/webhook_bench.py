@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark for the headless webhook channel (channels/whatsapp.py).
+
+Starts the fake LLM server and the fake messaging provider in this process
+and the channel as a uvicorn subprocess pointed at both, then has --users
+simulated trainees message it at the same time: "hi", the menu number of
+their topic, then the load test's scripted conversation for their flow
+(I_WE, partners_interest or general_flow, round-robin). A trainee sends
+their next message --think seconds after the first reply to the previous
+one reached the provider. One trainee per flow goes through first to warm
+the channel up and is not counted.
+
+Reported:
+- messages handled per second, and per CPU-second of the channel process
+  (its event loop runs on one core, so this is messages/s per core);
+- reply latency, from posting a message to the webhook to its first reply
+  at the provider (p50/p95), per flow;
+- the channel's counters (failed turns, send errors, stored bytes per
+  user) and trainees that did not reach the end of their script;
+- fake LLM server and provider counts.
+
+Usage:
+    python benchmarks/webhook_bench.py --users 200 --latency 0.3 --chunk-rate 0
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import asyncio
+import json
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm_server import FakeLLMServer  # noqa: E402
+from fake_messaging_provider import FakeMessagingProvider, inbound_payload  # noqa: E402
+from load_test import SCRIPTS, percentile  # noqa: E402
+from tabs import TABS  # noqa: E402
+
+
+STARTUP_TIMEOUT = 120.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def menu_number(flow: str) -> str:
+    """The menu option the channel shows for a flow, found by the load test's label fragment."""
+    fragment = SCRIPTS[flow][0]
+    return str(next(number for number, tab in enumerate(TABS, start=1) if fragment in tab.label))
+
+
+def start_channel(port: int, env: dict) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, "-m", "channels.whatsapp", "--port", str(port)], cwd=REPO_ROOT, env=env)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"The channel exited with code {process.returncode} during startup.")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/healthz", timeout=1).status_code == 200:
+                return process
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    sys.exit("The channel did not start in time.")
+
+
+class Trainees:
+    """Drives simulated trainees and matches the provider's replies to them."""
+
+    def __init__(self, webhook_url: str, think: float, timeout: float):
+        self.webhook_url = webhook_url
+        self.think = think
+        self.timeout = timeout
+        self.loop = None
+        self._arrived = {}          # user -> asyncio.Event, set when a reply reaches the provider
+        self.latencies = defaultdict(list)
+        self.timeouts = 0
+
+    def on_message(self, to: str, text: str):
+        """Provider callback, on one of its server threads."""
+        self.loop.call_soon_threadsafe(self._reply_arrived, to)
+
+    def _reply_arrived(self, to: str):
+        event = self._arrived.get(to)
+        if event is not None:
+            event.set()
+
+    async def converse(self, http: httpx.AsyncClient, number: int, flow: str, record: bool = True):
+        user = f"92300{number + 1000000:07d}"
+        arrived = self._arrived[user] = asyncio.Event()
+        texts = ["hi", menu_number(flow)] + [text.format(n=number) for text in SCRIPTS[flow][2]]
+        for i, text in enumerate(texts):
+            arrived.clear()
+            sent = time.perf_counter()
+            payload = inbound_payload(user, text, f"wamid.bench.{number}.{i}")
+            for attempt in range(3):
+                # A kept-alive connection the server just closed fails; the redelivery is dropped as a duplicate if it got through.
+                try:
+                    response = await http.post(self.webhook_url, json=payload)
+                    break
+                except httpx.TransportError:
+                    if attempt == 2:
+                        raise
+            response.raise_for_status()
+            try:
+                await asyncio.wait_for(arrived.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return user
+            if record:
+                self.latencies[flow].append(time.perf_counter() - sent)
+            await asyncio.sleep(self.think)  # read the rest of the replies, then answer
+        return user
+
+
+async def channel_stats(http: httpx.AsyncClient, base: str) -> dict:
+    return (await http.get(f"{base}/stats")).json()
+
+
+async def run(args, channel_base: str, trainees: Trainees) -> dict:
+    trainees.loop = asyncio.get_running_loop()
+    limits = httpx.Limits(max_connections=max(args.users, 10), max_keepalive_connections=max(args.users, 10))
+    async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+        # Warm-up: imports, caches and the retrieval index are paid once here.
+        await asyncio.gather(*(trainees.converse(http, -1 - i, flow, record=False) for i, flow in enumerate(args.flows)))
+        before = await channel_stats(http, channel_base)
+
+        started = time.perf_counter()
+        users = await asyncio.gather(*(trainees.converse(http, number, args.flows[number % len(args.flows)])
+                                       for number in range(args.users)))
+        while (stats := await channel_stats(http, channel_base))["pending"]:
+            await asyncio.sleep(0.05)
+        wall = time.perf_counter() - started
+    return {"users": users, "before": before, "after": stats, "wall": wall}
+
+
+def incomplete_users(store_path: str, users: list, flows: list) -> int:
+    """Trainees whose stored record is not at the end of their script (stage 4)."""
+    from channels.whatsapp import ChannelStore
+    store = ChannelStore(store_path)
+    incomplete = 0
+    for number, user in enumerate(users):
+        record = store.load(user) or {"flows": {}}
+        stage_key = SCRIPTS[flows[number % len(flows)]][1]
+        stages = [saved["state"].get(stage_key, 0) for saved in record["flows"].values()]
+        incomplete += not stages or max(stages) < 4
+    store.close()
+    return incomplete
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="simulated trainees, all active at the same time")
+    parser.add_argument("--flows", nargs="+", default=list(SCRIPTS), choices=list(SCRIPTS))
+    parser.add_argument("--think", type=float, default=0.2, help="seconds between a reply and the next message")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--chunk-rate", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--provider-latency", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, help="ZARA_CHANNEL_CONCURRENCY for the channel")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per message, seconds")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="zara-webhook-")
+    store_path = os.path.join(cache_dir, "channel_users.sqlite3")
+    llm = FakeLLMServer(latency=args.latency, chunk_rate=args.chunk_rate, error_rate=args.error_rate, seed=0)
+    llm_url = llm.start()
+    port = free_port()
+    trainees = Trainees(f"http://127.0.0.1:{port}/webhook", args.think, args.timeout)
+    provider = FakeMessagingProvider(latency=args.provider_latency, on_message=trainees.on_message, keep=False)
+    env = dict(os.environ, OPENAI_API_KEY="fake-key", GROQ_API_KEY="fake-key", OPENAI_BASE_URL=llm_url,
+               GROQ_BASE_URL=llm_url.rsplit("/v1", 1)[0], ZARA_PROVIDER_URL=provider.start(), ZARA_CACHE_DIR=cache_dir,
+               ZARA_CHANNEL_STORE=store_path)
+    if args.concurrency:
+        env["ZARA_CHANNEL_CONCURRENCY"] = str(args.concurrency)
+    channel = start_channel(port, env)
+    try:
+        result = asyncio.run(run(args, f"http://127.0.0.1:{port}", trainees))
+    finally:
+        channel.send_signal(signal.SIGINT)
+        channel.wait(timeout=30)
+
+    before, after = result["before"], result["after"]
+    handled = after["handled"] - before["handled"]
+    cpu = after["cpu_seconds"] - before["cpu_seconds"]
+    report = {
+        "users": args.users,
+        "messages": handled,
+        "wall_seconds": round(result["wall"], 2),
+        "messages_per_second": round(handled / result["wall"], 1),
+        "channel_cpu_seconds": round(cpu, 2),
+        "messages_per_cpu_second": round(handled / cpu, 1) if cpu else None,
+        "failed": after["failed"] - before["failed"],
+        "send_errors": after["send_errors"] - before["send_errors"],
+        "reply_timeouts": trainees.timeouts,
+        "incomplete_users": incomplete_users(store_path, result["users"], args.flows),
+        "store_bytes_per_user": after["store"]["bytes_per_user"],
+        "channel_threads": after["threads"],
+        "llm_server": dict(llm.stats),
+        "provider": dict(provider.stats),
+        "reply_latency": {
+            flow: {"messages": len(values), "p50_ms": round(percentile(values, 50) * 1000, 1),
+                   "p95_ms": round(percentile(values, 95) * 1000, 1)}
+            for flow, values in sorted(trainees.latencies.items())
+        },
+    }
+
+    print(f"{report['users']} trainees, {report['messages']} messages in {report['wall_seconds']} s: "
+          f"{report['messages_per_second']} msgs/s, {report['messages_per_cpu_second']} msgs per CPU-second "
+          f"({report['channel_cpu_seconds']} s CPU in the channel)")
+    print(f"failed: {report['failed']}, send errors: {report['send_errors']}, reply timeouts: {report['reply_timeouts']}, "
+          f"incomplete: {report['incomplete_users']}, store: {report['store_bytes_per_user']} B/user, "
+          f"channel threads: {report['channel_threads']}")
+    print(f"fake LLM server: {report['llm_server']}, provider: {report['provider']}")
+    print(f"\n{'flow':<20} {'msgs':>6} {'p50 ms':>9} {'p95 ms':>9}")
+    for flow, row in report["reply_latency"].items():
+        print(f"{flow:<20} {row['messages']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    provider.stop()
+    llm.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+Messaging channels that run the training flows without the Streamlit app.
+"""
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Headless WhatsApp-style channel for the training flows.
+
+The Streamlit app keeps a websocket, a script thread and the whole session
+state in memory for every open browser, which does not scale to thousands
+of trainees who answer a few times a day from their phones. This module
+serves the same flows (each tab's FLOW, run by core/flow_engine.py) as a
+plain ASGI app behind a messaging provider's webhook:
+
+- POST /webhook takes inbound messages in the WhatsApp Cloud API shape and
+  answers 200 straight away; the messages are handled afterwards on the
+  event loop, in arrival order per user and at most TURN_CONCURRENCY turns
+  at a time. When more than MAX_PENDING messages are waiting it answers
+  503, and the provider delivers them again later;
+- a turn loads the user's record, runs compiled.adispatch() on a
+  ChannelTurn (hooks and LLM calls take the router's asyncio path, as the
+  app's background jobs do), saves the record and posts the replies to the
+  provider's messages API;
+- a user's record holds the current topic and, per flow, its state keys,
+  rolling summary and transcript (scripted messages as content-pack
+  references). It is one zlib-compressed JSON row in SQLite (ChannelStore),
+  so nothing about a user stays in memory between their messages;
+- GET /webhook answers the provider's subscription check; GET /stats and
+  GET /metrics report counters and the Prometheus metrics.
+
+A new user, or one who sends "menu", gets the topics of the tabs registry
+and picks one by number.
+
+Settings: ZARA_PROVIDER_URL (messages API base; without it replies are only
+counted), ZARA_PROVIDER_TOKEN, ZARA_WEBHOOK_VERIFY_TOKEN,
+ZARA_WEBHOOK_APP_SECRET (checks X-Hub-Signature-256 when set),
+ZARA_CHANNEL_STORE, ZARA_CHANNEL_CONCURRENCY, ZARA_CHANNEL_MAX_PENDING,
+ZARA_CHANNEL_MODEL, plus OPENAI_API_KEY and GROQ_API_KEY.
+
+Usage:
+    python -m channels.whatsapp --port 8080
+    uvicorn channels.whatsapp:create_app --factory --port 8080
+
+benchmarks/fake_messaging_provider.py stands in for the provider locally.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import httpx
+
+from core.content_pack import MessageLog
+from core.context_budget import summary_record
+from core.feedback_library import get_feedback_library
+from core.flow_engine import compile_flow, normalize_answer
+from core.llm_gateway import LLMGateway
+from core.llm_router import LLMRouter
+from core.paths import CACHE_DIR
+from core.telemetry import get_telemetry
+from core.warmup import WARMUP_ENABLED, Warmup
+from tabs import TABS, load_tab, warm_targets
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+STORE_PATH = os.getenv("ZARA_CHANNEL_STORE", os.path.join(CACHE_DIR, "channel_users.sqlite3"))
+PROVIDER_URL = os.getenv("ZARA_PROVIDER_URL", "").rstrip("/")
+PROVIDER_TOKEN = os.getenv("ZARA_PROVIDER_TOKEN", "")
+VERIFY_TOKEN = os.getenv("ZARA_WEBHOOK_VERIFY_TOKEN", "")
+APP_SECRET = os.getenv("ZARA_WEBHOOK_APP_SECRET", "")
+MODEL = os.getenv("ZARA_CHANNEL_MODEL", "o4-mini-2025-04-16")
+
+TURN_CONCURRENCY = int(os.getenv("ZARA_CHANNEL_CONCURRENCY", "256"))
+MAX_PENDING = int(os.getenv("ZARA_CHANNEL_MAX_PENDING", "10000"))
+MAX_BODY_BYTES = 1024 * 1024
+SEEN_MESSAGE_IDS = 10000       # recent message ids kept to drop the provider's redeliveries
+SEND_ATTEMPTS = 3
+SEND_BACKOFF = 0.5             # seconds, doubled per attempt
+SEND_TIMEOUT = 15.0
+SUMMARY_WAIT = 30.0            # seconds to wait for a rolling summary so it is saved with the record
+SHUTDOWN_WAIT = 10.0
+LATENCY_SAMPLES = 10000
+
+MENU_WORD = "menu"
+MENU_TEXT = (
+    "Assalam o Alaikum! I'm Zara 👋\n"
+    "Which topic do you want to try?\n\n"
+    + "\n".join(f"{number} - {tab.label.strip()}" for number, tab in enumerate(TABS, start=1))
+    + f"\n\nSend *{MENU_WORD}* at any time to pick another topic."
+)
+NOT_TEXT_REPLY = "Sorry, I can only read text messages for now. Please type your answer. ✍️"
+FAILED_REPLY = "⚠️ Sorry, I couldn't process your message right now. Please send it again!"
+
+_MODULES = {tab.module: tab for tab in TABS}
+
+
+# -----------------------------
+# User records
+# -----------------------------
+class ChannelStore:
+    """One row per user in SQLite: a zlib-compressed JSON record of their topic and progress."""
+
+    def __init__(self, path: str = STORE_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS channel_users (user TEXT PRIMARY KEY, body BLOB NOT NULL, updated REAL NOT NULL)")
+        self._lock = threading.Lock()
+        # Each call is short but blocking: they run next to the event loop, one at a time, in call order.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="channel-store")
+        self.counters = {"loads": 0, "saves": 0}
+
+    def load(self, user: str):
+        """The user's record, or None for a user seen for the first time."""
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM channel_users WHERE user = ?", (user,)).fetchone()
+            self.counters["loads"] += 1
+        return None if row is None else json.loads(zlib.decompress(row[0]))
+
+    def save(self, user: str, record: dict):
+        body = zlib.compress(json.dumps(record, separators=(",", ":")).encode("utf-8"), 6)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO channel_users VALUES (?, ?, ?)", (user, body, time.time()))
+            self.counters["saves"] += 1
+
+    async def aload(self, user: str):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.load, user)
+
+    async def asave(self, user: str, record: dict):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.save, user, record)
+
+    def stats(self) -> dict:
+        with self._lock:
+            users, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM channel_users").fetchone()
+        return dict(self.counters, users=users, bytes=total, bytes_per_user=round(total / users) if users else 0)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+def _new_record() -> dict:
+    return {"topic": None, "flows": {}}
+
+
+# -----------------------------
+# Turn context
+# -----------------------------
+class ChannelTurn:
+    """Turn context for one inbound message: a flow's saved progress plus the replies the turn produces."""
+
+    def __init__(self, compiled, client, model: str, saved: dict = None):
+        saved = saved or {}
+        self.compiled = compiled
+        self.flow = compiled.flow
+        self.tab_name = compiled.flow.tab_name
+        self.client = client
+        self.model = model
+        self.state = {self.flow.stage_key: min(self.flow.stages), **self.flow.state_defaults, **saved.get("state", {})}
+        summary = saved.get("summary") or {"summary": "", "summarized_upto": 0}
+        self.state["context_state"] = {self.tab_name: dict(summary, pending=None, pending_upto=0)}
+        self.messages = MessageLog(compiled.content, [{"role": "system", "content": self.flow.system_prompt}])
+        for record in saved.get("messages", ()):
+            self.messages.append_record(record)
+        self.replies = []
+        self.errors = []
+
+    @property
+    def stage(self) -> int:
+        return self.state[self.flow.stage_key]
+
+    @stage.setter
+    def stage(self, value: int):
+        self.state[self.flow.stage_key] = value
+
+    def say(self, content: str, role: str = "assistant", shown: bool = False):
+        self.messages.append({"role": role, "content": content})
+        if role == "assistant":
+            self.replies.append(content)
+
+    async def stream(self, chunks) -> str:
+        """A chat message cannot grow as text arrives: collect the whole reply."""
+        parts = []
+        async for text in chunks:
+            parts.append(text)
+        return "".join(parts)
+
+    def error(self, message: str):
+        # Not sent: the hooks also say a fallback text, which is what the trainee gets.
+        self.errors.append(message)
+
+    def start(self):
+        """First visit to the flow: say its intro."""
+        for content in self.flow.intro:
+            self.say(content)
+        if self.flow.intro_to is not None:
+            self.stage = self.flow.intro_to
+
+    def last_reply(self):
+        for i in range(len(self.messages) - 1, 0, -1):
+            if self.messages[i]["role"] == "assistant":
+                return self.messages[i]["content"]
+        return None
+
+    def pending_summary(self):
+        """The rolling summary this turn started in the background, if it is still being written."""
+        future = self.state["context_state"][self.tab_name]["pending"]
+        return None if future is None or future.done() else future
+
+    def record(self) -> dict:
+        return {
+            "state": {key: self.state[key] for key in self.compiled.state_keys if key in self.state},
+            "summary": summary_record(self.state["context_state"][self.tab_name]),
+            "messages": [self.messages.record(i) for i in range(1, len(self.messages))],  # the system prompt is not stored
+        }
+
+
+# -----------------------------
+# Webhook payloads
+# -----------------------------
+def _inbound_messages(payload: dict):
+    """(sender, message id, text or None) for each message in a Cloud API webhook payload; statuses are skipped."""
+    for entry in payload.get("entry") or ():
+        for change in entry.get("changes") or ():
+            for message in (change.get("value") or {}).get("messages") or ():
+                text = (message.get("text") or {}).get("body") if message.get("type") == "text" else None
+                if message.get("from"):
+                    yield str(message["from"]), message.get("id"), text
+
+
+def _signature_ok(secret: str, body: bytes, signature: str) -> bool:
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers") or ():
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def _read_body(receive):
+    """The request body, or None when it is larger than MAX_BODY_BYTES."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status: int, body, content_type: str = "application/json"):
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body)
+    payload = body.encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode("latin-1")),
+                            (b"content-length", str(len(payload)).encode("latin-1"))]})
+    await send({"type": "http.response.body", "body": payload})
+
+
+# -----------------------------
+# Channel
+# -----------------------------
+class WhatsAppChannel:
+    """ASGI app: webhook in, flows on the event loop, replies out through the provider's messages API."""
+
+    def __init__(self, client, store: ChannelStore, provider_url: str = PROVIDER_URL, provider_token: str = PROVIDER_TOKEN,
+                 verify_token: str = VERIFY_TOKEN, app_secret: str = APP_SECRET, model: str = MODEL,
+                 concurrency: int = TURN_CONCURRENCY, max_pending: int = MAX_PENDING):
+        self.client = client
+        self.store = store
+        self.provider_url = provider_url
+        self.provider_token = provider_token
+        self.verify_token = verify_token
+        self.app_secret = app_secret
+        self.model = model
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inboxes = {}          # user -> deque of texts; present while the user's worker runs
+        self._seen = OrderedDict()  # recent message ids
+        self._tasks = set()
+        self._pending = 0
+        self._http = None
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._cpu_started = time.process_time()
+        self.counters = {"received": 0, "handled": 0, "failed": 0, "duplicates": 0, "rejected": 0, "sent": 0,
+                         "send_errors": 0}
+
+    # -----------------------------
+    # ASGI
+    # -----------------------------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"]
+        if path == "/webhook" and method == "POST":
+            body = await _read_body(receive)
+            if body is None:
+                return await _respond(send, 413, {"error": "payload too large"})
+            status, reply = self.receive_webhook(body, _header(scope, b"x-hub-signature-256"))
+            return await _respond(send, status, reply)
+        if path == "/webhook" and method == "GET":
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            challenge = self.verify(query.get("hub.mode", [""])[0], query.get("hub.verify_token", [""])[0],
+                                    query.get("hub.challenge", [""])[0])
+            if challenge is None:
+                return await _respond(send, 403, {"error": "verification failed"})
+            return await _respond(send, 200, challenge, "text/plain")
+        if path == "/stats" and method == "GET":
+            return await _respond(send, 200, self.stats())
+        if path == "/metrics" and method == "GET":
+            return await _respond(send, 200, get_telemetry().metrics.render(), "text/plain; version=0.0.4; charset=utf-8")
+        if path == "/healthz":
+            return await _respond(send, 200, {"ok": True})
+        await _respond(send, 404, {"error": "not found"})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def start(self):
+        self._http = httpx.AsyncClient(timeout=SEND_TIMEOUT)
+        # Import every flow and load the feedback library and the tabs' warm-up targets (tokenizer, citation
+        # index, retriever, embedder) now, rather than on some user's first message with the loop blocked.
+        await asyncio.to_thread(lambda: [compile_flow(load_tab(tab.label).FLOW) for tab in TABS])
+        await asyncio.to_thread(get_feedback_library)
+        warmup = Warmup(warm_targets() if WARMUP_ENABLED else ()).start()
+        await asyncio.to_thread(warmup.join)
+        for target, status in warmup.status.items():
+            if status["state"] == "failed":
+                logging.getLogger("zara.channel").warning("Warm-up of %s failed: %s", target, status["error"])
+
+    async def stop(self):
+        """Let queued messages finish (up to SHUTDOWN_WAIT), then close the provider connection and the store."""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=SHUTDOWN_WAIT)
+        if self._http is not None:
+            await self._http.aclose()
+        await asyncio.to_thread(self.store.close)
+
+    # -----------------------------
+    # Inbound
+    # -----------------------------
+    def verify(self, mode: str, token: str, challenge: str):
+        """The challenge to echo for the provider's subscription check, or None to refuse it."""
+        if mode == "subscribe" and self.verify_token and hmac.compare_digest(token, self.verify_token):
+            return challenge
+        return None
+
+    def receive_webhook(self, body: bytes, signature: str = ""):
+        """Queue the messages of one webhook delivery; returns (HTTP status, response body)."""
+        if self.app_secret and not _signature_ok(self.app_secret, body, signature):
+            return 401, {"error": "bad signature"}
+        try:
+            messages = list(_inbound_messages(json.loads(body)))
+        except (ValueError, AttributeError, TypeError):
+            return 400, {"error": "malformed payload"}
+        if self._pending + len(messages) > self.max_pending:
+            self._count("rejected", len(messages))
+            return 503, {"error": "busy"}
+        for user, message_id, text in messages:
+            if message_id is not None:
+                if message_id in self._seen:
+                    self._count("duplicates")
+                    continue
+                self._seen[message_id] = None
+                if len(self._seen) > SEEN_MESSAGE_IDS:
+                    self._seen.popitem(last=False)
+            self._enqueue(user, text)
+        return 200, {"ok": True}
+
+    def _enqueue(self, user: str, text):
+        self.counters["received"] += 1
+        self._pending += 1
+        get_telemetry().metrics.set("zara_channel_pending", {}, self._pending)
+        inbox = self._inboxes.get(user)
+        if inbox is not None:
+            inbox.append((text, time.perf_counter()))  # the user's worker is running and will get to it
+            return
+        self._inboxes[user] = deque([(text, time.perf_counter())])
+        task = asyncio.get_running_loop().create_task(self._drain(user))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, user: str):
+        """Handle a user's messages one after another, so their turns never overlap."""
+        inbox = self._inboxes[user]
+        try:
+            while inbox:
+                text, queued = inbox.popleft()
+                async with self._semaphore:
+                    record, turn = await self._handle(user, text, queued)
+                # Outside the turn slot: a rolling summary started by this turn is saved with the record.
+                if turn is not None and turn.pending_summary() is not None:
+                    await self._save_summary(user, record, turn)
+        finally:
+            del self._inboxes[user]
+
+    async def _handle(self, user: str, text, queued: float):
+        record, turn = None, None
+        try:
+            record = await self.store.aload(user) or _new_record()
+            replies, turn = await self._reply(record, text)
+            await self.store.asave(user, record)
+            for reply in replies:
+                await self._send(user, reply)
+            outcome = "handled"
+        except Exception:
+            logging.getLogger("zara.channel").exception("Failed to handle a message from %s", user)
+            outcome = "failed"
+            # The record was not saved, so the trainee can simply send the message again
+            try:
+                await self._send(user, FAILED_REPLY)
+            except Exception:
+                logging.getLogger("zara.channel").exception("Failed to send the fallback reply to %s", user)
+        seconds = time.perf_counter() - queued
+        self._latencies.append(seconds)
+        self._pending -= 1
+        self._count(outcome)
+        metrics = get_telemetry().metrics
+        metrics.set("zara_channel_pending", {}, self._pending)
+        metrics.observe("zara_channel_message_seconds", {"outcome": outcome}, seconds)
+        return record, turn
+
+    async def _reply(self, record: dict, text):
+        """Apply one message to the user's record; returns (replies, ChannelTurn or None for a menu step)."""
+        if text is None:
+            return [NOT_TEXT_REPLY], None
+        answer = normalize_answer(text)
+        if answer == MENU_WORD:
+            record["topic"] = None
+            return [MENU_TEXT], None
+
+        resumed = record["topic"] is None
+        if resumed:
+            tab = TABS[int(answer) - 1] if answer.isdigit() and 1 <= int(answer) <= len(TABS) else None
+            if tab is None:
+                return [MENU_TEXT], None
+            record["topic"] = tab.module
+        compiled = compile_flow(load_tab(_MODULES[record["topic"]].label).FLOW)
+        turn = ChannelTurn(compiled, self.client, self.model, record["flows"].get(compiled.flow.tab_name))
+        if len(turn.messages) == 1:
+            turn.start()
+        elif resumed:
+            turn.replies.append(turn.last_reply() or MENU_TEXT)  # back to a topic: repeat where it stopped
+        else:
+            await compiled.adispatch(turn, text)
+        record["flows"][compiled.flow.tab_name] = turn.record()
+        return turn.replies, turn
+
+    async def _save_summary(self, user: str, record: dict, turn: ChannelTurn):
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(turn.pending_summary()), SUMMARY_WAIT)
+        except Exception:
+            return  # the next turn that needs it starts it again
+        record["flows"][turn.tab_name] = turn.record()
+        await self.store.asave(user, record)
+
+    # -----------------------------
+    # Outbound
+    # -----------------------------
+    async def _send(self, user: str, text: str):
+        """Post one text message to the user; transient failures are retried, a rejection is not."""
+        if not self.provider_url:
+            self._count("sent")
+            return
+        payload = {"messaging_product": "whatsapp", "recipient_type": "individual", "to": user, "type": "text",
+                   "text": {"body": text}}
+        headers = {"Authorization": f"Bearer {self.provider_token}"} if self.provider_token else {}
+        metrics = get_telemetry().metrics
+        for attempt in range(SEND_ATTEMPTS):
+            try:
+                response = await self._http.post(f"{self.provider_url}/messages", json=payload, headers=headers)
+            except httpx.TransportError:
+                response = None
+            if response is not None and response.status_code < 400:
+                self._count("sent")
+                metrics.inc("zara_channel_sends_total", {"outcome": "ok"})
+                return
+            if response is not None and response.status_code < 500 and response.status_code != 429:
+                break
+            await asyncio.sleep(SEND_BACKOFF * 2 ** attempt)
+        self._count("send_errors")
+        metrics.inc("zara_channel_sends_total", {"outcome": "error"})
+
+    # -----------------------------
+    # Reporting
+    # -----------------------------
+    def _count(self, key: str, value: int = 1):
+        self.counters[key] += value
+        if key in ("handled", "failed", "duplicates", "rejected"):
+            outcome = "duplicate" if key == "duplicates" else key
+            get_telemetry().metrics.inc("zara_channel_messages_total", {"outcome": outcome}, value)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 1) if latencies else None
+
+        return dict(self.counters, pending=self._pending, users_active=len(self._inboxes), concurrency=self.concurrency,
+                    latency_p50_ms=percentile(50), latency_p95_ms=percentile(95),
+                    cpu_seconds=round(time.process_time() - self._cpu_started, 3), threads=threading.active_count(),
+                    store=self.store.stats(), feedback_library=get_feedback_library().stats())
+
+
+def build_client() -> LLMRouter:
+    """The app's routing and call policy; without GROQ_API_KEY every route uses OpenAI."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set.")
+    return LLMRouter(LLMGateway({"openai": api_key, "groq": os.getenv("GROQ_API_KEY", "")}))
+
+
+def create_app() -> WhatsAppChannel:
+    """App factory for ASGI servers: `uvicorn channels.whatsapp:create_app --factory`."""
+    logging.getLogger("streamlit").setLevel(logging.ERROR)  # bare-mode cache warnings
+    return WhatsAppChannel(build_client(), ChannelStore())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless WhatsApp-style webhook channel for the training flows.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
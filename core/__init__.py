@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+Shared infrastructure used by the training tabs (LLM access, caching, state).
+"""
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Semantic answer cache for off-script questions.
+
+Most questions asked in general_flow are the same few dozen ("what is an
+I-statement", "what if my husband says no"). Answers are cached per
+(tab, training stage) and matched on the normalised question first, then by
+embedding similarity with a local CPU sentence-transformers model. Entries
+expire after a TTL, are evicted LRU-first under an entry and memory cap, and
+a tab's entries are dropped when its system prompt changes.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from core.embeddings import DEFAULT_MODEL, get_embedder
+
+try:
+    import numpy as np
+except ImportError:  # numpy comes with sentence-transformers; without it only exact matches are served
+    np = None
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+EMBEDDING_MODEL = DEFAULT_MODEL
+SIMILARITY_THRESHOLD = 0.90
+TTL_SECONDS = 6 * 60 * 60
+MAX_ENTRIES = 2000
+MAX_BYTES = 32 * 1024 * 1024
+
+
+def normalize_question(text: str) -> str:
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def prompt_version(prompt: str) -> str:
+    """Short stable hash of a system prompt, used to invalidate cached answers."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class _Entry:
+    __slots__ = ("namespace", "question", "vector", "answer", "created", "size")
+
+    def __init__(self, namespace, question, vector, answer):
+        self.namespace = namespace
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.created = time.monotonic()
+        self.size = len(question.encode("utf-8")) + len(answer.encode("utf-8")) + (vector.nbytes if vector is not None else 0)
+
+
+class SemanticAnswerCache:
+    """Process-wide LRU+TTL answer cache with exact and embedding-based lookup."""
+
+    def __init__(self, embedder=None, threshold: float = SIMILARITY_THRESHOLD, ttl_seconds: float = TTL_SECONDS,
+                 max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self._embedder = embedder
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()      # (namespace, question) -> _Entry, oldest first
+        self._prompt_versions = {}         # tab -> prompt version the cached answers were made with
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    # -----------------------------
+    # Internals (call with the lock held)
+    # -----------------------------
+    def _check_prompt_version(self, tab: str, version: str):
+        if self._prompt_versions.get(tab, version) != version:
+            for key in [k for k in self._entries if k[0][0] == tab]:
+                self._remove(key)
+            self.counters["invalidations"] += 1
+        self._prompt_versions[tab] = version
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.monotonic() - entry.created > self.ttl_seconds
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _embed(self, text: str):
+        if self._embedder is None or np is None:
+            return None
+        try:
+            return np.asarray(self._embedder.encode(text, normalize_embeddings=True), dtype=np.float32)
+        except Exception:
+            return None
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def get(self, tab: str, stage: int, question: str, version: str):
+        namespace = (tab, stage)
+        normalized = normalize_question(question)
+        key = (namespace, normalized)
+        with self._lock:
+            self._check_prompt_version(tab, version)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry.answer
+            candidates = [(k, e) for k, e in self._entries.items() if k[0] == namespace and e.vector is not None]
+
+        vector = self._embed(normalized) if candidates else None
+        if vector is not None:
+            matrix = np.stack([e.vector for _, e in candidates])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                best_key, best_entry = candidates[best]
+                with self._lock:
+                    if best_key in self._entries and not self._expired(best_entry):
+                        self._entries.move_to_end(best_key)
+                        self.counters["hits"] += 1
+                        self.counters["semantic_hits"] += 1
+                        return best_entry.answer
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, tab: str, stage: int, question: str, version: str, answer: str):
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        entry = _Entry((tab, stage), normalized, self._embed(normalized), answer)
+        key = (entry.namespace, normalized)
+        with self._lock:
+            self._check_prompt_version(tab, version)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes,
+                        hit_rate=round(self.counters["hits"] / lookups, 3) if lookups else 0.0)
+
+
+# -----------------------------
+# Process-wide singleton
+# -----------------------------
+@st.cache_resource(show_spinner=False)
+def get_answer_cache() -> SemanticAnswerCache:
+    return SemanticAnswerCache(embedder=get_embedder(EMBEDDING_MODEL))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deadlines, retries and hedging for LLM calls.
+
+The router (core/llm_router.py) applies one CallPolicy per route:
+
+- deadline         total time a call may take, retries included; each
+                   attempt gets the remaining time as its SDK timeout;
+- max_attempts     attempts across providers, with full-jitter exponential
+                   backoff before retrying a provider that already failed;
+- hedge            after the provider's recent p95 (floored at
+                   hedge_min_delay) a second identical request is sent and
+                   the first response wins;
+- stream_idle      longest gap between streamed chunks, and stream_deadline
+                   for the whole streamed call, counted from its start; a
+                   stream that stalls or overruns after text has been shown
+                   raises StreamStalled to the reader instead of hanging the
+                   script, so a cut-off answer is never taken for a whole one.
+
+Retries and hedges draw from a process-wide RetryBudget, so an upstream
+outage can't multiply the load on it.
+"""
+
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    deadline: float
+    max_attempts: int = 3
+    backoff_base: float = 0.25
+    backoff_cap: float = 2.0
+    hedge: bool = False
+    hedge_min_delay: float = 1.0
+    stream_idle: float = 15.0
+    stream_deadline: Optional[float] = None
+
+
+_HEDGE_CHAT = os.getenv("ZARA_HEDGE_CHAT") == "1"
+
+# One policy per route, i.e. per kind of stage: validator checks, summaries, chat, reflections
+ROUTE_POLICIES = {
+    "validation": CallPolicy(deadline=8.0, hedge=True, stream_idle=6.0, stream_deadline=20.0),
+    "summary": CallPolicy(deadline=30.0, max_attempts=2),
+    # Reasoning models can think for a while before the first token, hence the longer idle limit
+    "chat": CallPolicy(deadline=30.0, hedge=_HEDGE_CHAT, hedge_min_delay=3.0, stream_idle=20.0, stream_deadline=90.0),
+    "reflection": CallPolicy(deadline=30.0, hedge=_HEDGE_CHAT, hedge_min_delay=3.0, stream_idle=20.0, stream_deadline=90.0),
+}
+DEFAULT_POLICY = CallPolicy(deadline=25.0)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call's deadline passed before any provider answered."""
+
+
+class StreamStalled(TimeoutError):
+    """A stream went quiet, or ran past its deadline, before it finished."""
+
+
+# -----------------------------
+# Retry budget
+# -----------------------------
+class RetryBudget:
+    """Token bucket: every call earns `ratio` tokens, every retry or hedge spends one."""
+
+    def __init__(self, ratio: float = 0.2, minimum_per_second: float = 1.0, cap: float = 20.0):
+        self.ratio = ratio
+        self.minimum_per_second = minimum_per_second
+        self.cap = cap
+        self._tokens = cap
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.spent = 0
+        self.refused = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.cap, self._tokens + (now - self._updated) * self.minimum_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.cap, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.spent += 1
+                return True
+            self.refused += 1
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill()
+            return {"tokens": round(self._tokens, 2), "spent": self.spent, "refused": self.refused}
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+_RETRYABLE_NAMES = {"APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "ConnectTimeout",
+                    "RemoteProtocolError", "StreamStalled"}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection failures, 408/409/429 and 5xx are worth another attempt; 4xx are not."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return any(cls.__name__ in _RETRYABLE_NAMES for cls in type(error).__mro__)
+
+
+def backoff_delay(policy: CallPolicy, retry: int) -> float:
+    """Full jitter: uniform in [0, min(cap, base * 2**retry)]."""
+    return random.uniform(0, min(policy.backoff_cap, policy.backoff_base * (2 ** retry)))
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run independent completion streams concurrently and render them in order.
+
+The hooks that use this run as background LLM jobs on the job loop
+(core/llm_jobs.py). Each stream is consumed by its own asyncio task into a
+StreamBuffer; the hook then hands the buffers to ctx.stream one after
+another: the first is shown live, and the later ones have usually finished
+(or caught up) by the time it is their turn.
+
+A request cancelled before it finished closes its buffers with
+StreamCancelled, so a reader of a sibling buffer (the fields of a merged
+request share one task) gets an error rather than waiting forever.
+
+Each stage's timing is published as zara_stage_saved_seconds and shown in
+the ZARA_DEBUG sidebar.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+
+from core.structured_feedback import FeedbackStreamParser
+from core.telemetry import get_telemetry
+
+
+# Recent timings of concurrent stages, newest last.
+STAGE_TIMINGS = deque(maxlen=500)
+_timings_lock = threading.Lock()
+
+
+class StreamCancelled(Exception):
+    """The request feeding a buffer was cancelled before the buffer's text was complete."""
+
+
+class StreamBuffer:
+    """Text deltas produced by a task on the job loop; iterate it with `async for`."""
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.error = None
+        self.task = None
+
+    def put(self, text: str):
+        self._queue.put_nowait(text)
+
+    def close(self, error: Exception = None):
+        if self.finished is not None:
+            return
+        self.error = error
+        self.finished = time.perf_counter()
+        self._queue.put_nowait(None)
+
+    def cancel(self):
+        """Stop the producing task, e.g. when the job is cancelled before this buffer was read."""
+        if self.task is not None:
+            self.task.cancel()
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    async def __aiter__(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+
+async def aiter_text(stream, outcome: dict = None):
+    """Text deltas from an OpenAI-style asyncio chat completion stream.
+
+    `outcome`, if given, receives the stream's "finish_reason" ("stop" for a complete answer).
+    """
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        if outcome is not None and chunk.choices[0].finish_reason:
+            outcome["finish_reason"] = chunk.choices[0].finish_reason
+        if chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def start_stream(create_stream) -> StreamBuffer:
+    """Start awaiting `create_stream()` (a coroutine returning a completion stream) in a task."""
+    buffer = StreamBuffer()
+
+    async def run():
+        try:
+            async for text in aiter_text(await create_stream()):
+                buffer.put(text)
+            buffer.close()
+        except asyncio.CancelledError:
+            buffer.close(StreamCancelled("request cancelled"))
+            raise
+        except Exception as e:
+            buffer.close(e)
+
+    buffer.task = asyncio.ensure_future(run())
+    return buffer
+
+
+def start_structured_stream(create_stream, fields) -> list:
+    """
+    Start one JSON-mode request whose object has a string value per field and
+    return one StreamBuffer per field, in order. Each buffer closes as soon as
+    its field's closing quote arrives.
+    """
+    buffers = [StreamBuffer() for _ in fields]
+    parsers = [FeedbackStreamParser(field) for field in fields]
+
+    async def run():
+        try:
+            async for delta in aiter_text(await create_stream()):
+                for parser, buffer in zip(parsers, buffers):
+                    if buffer.finished is not None:
+                        continue
+                    text = parser.feed(delta)
+                    if text:
+                        buffer.put(text)
+                    if parser.closed:
+                        buffer.close()
+            for field, buffer in zip(fields, buffers):
+                buffer.close(ValueError(f"Reply ended before '{field}' was complete."))
+        except asyncio.CancelledError:
+            for buffer in buffers:
+                buffer.close(StreamCancelled("request cancelled"))
+            raise
+        except Exception as e:
+            for buffer in buffers:
+                buffer.close(e)
+
+    task = asyncio.ensure_future(run())
+    for buffer in buffers:
+        buffer.task = task
+    return buffers
+
+
+# -----------------------------
+# Latency accounting
+# -----------------------------
+def record_stage_timing(stage: str, mode: str, wall_started: float, buffers: list) -> dict:
+    """
+    Record how long a concurrent stage took. For separate requests the saving
+    is the sequential cost (sum of request durations) minus the wall time.
+    """
+    wall = time.perf_counter() - wall_started
+    sequential = sum(b.duration for b in buffers) if mode == "parallel" else wall
+    timing = {
+        "stage": stage,
+        "mode": mode,
+        "wall_seconds": round(wall, 3),
+        "sequential_seconds": round(sequential, 3),
+        "saved_seconds": round(max(0.0, sequential - wall), 3),
+        "at": time.time(),
+    }
+    with _timings_lock:
+        STAGE_TIMINGS.append(timing)
+    get_telemetry().metrics.observe("zara_stage_saved_seconds", {"stage": stage, "mode": mode},
+                                    timing["saved_seconds"])
+    return timing
+
+
+def timing_summary(stage: str = None) -> dict:
+    with _timings_lock:
+        rows = [t for t in STAGE_TIMINGS if stage is None or t["stage"] == stage]
+    if not rows:
+        return {"count": 0}
+    return {
+        "count": len(rows),
+        "mean_wall_seconds": round(sum(t["wall_seconds"] for t in rows) / len(rows), 3),
+        "mean_saved_seconds": round(sum(t["saved_seconds"] for t in rows) / len(rows), 3),
+        "total_saved_seconds": round(sum(t["saved_seconds"] for t in rows), 3),
+    }
+
+
+def render_stage_timings():
+    """Wall time and time saved per concurrent stage, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    with _timings_lock:
+        stages = sorted({t["stage"] for t in STAGE_TIMINGS})
+    with st.sidebar.expander("Concurrent stages"):
+        st.json({stage: timing_summary(stage) for stage in stages})
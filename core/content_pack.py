@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared scripted content and compact per-session transcripts.
+
+Every session used to hold its tab transcripts as lists of
+{"role", "content"} dicts, one dict per scripted message, system prompt
+included, and restored sessions got their own copies of every text. A
+ContentPack holds a flow's fixed texts (system prompt, intro and every
+scripted reply) once per process; it is built when the flow is compiled
+and never changes afterwards. Its version is a hash of the texts.
+
+A session's transcript is a MessageLog: two arrays (role code, text
+reference) plus a list for the texts only this session has (user input,
+LLM replies). A scripted message costs five bytes, and recognising one is a
+dict lookup on the text. Indexing a MessageLog yields ordinary message
+dicts, so the transcript, budget and LLM code read it like a list.
+
+The session store saves scripted messages as {"role", "ref"}, where ref is
+the text's content hash; a reference that no longer resolves after the
+script was edited is restored as MISSING_TEXT.
+"""
+
+import hashlib
+import sys
+from array import array
+
+
+ROLES = ("system", "user", "assistant")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+MISSING_TEXT = "…"
+
+
+def text_ref(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ContentPack:
+    """Immutable, versioned set of a flow's fixed texts."""
+
+    __slots__ = ("name", "texts", "refs", "version", "_index", "_by_ref")
+
+    def __init__(self, name: str, texts):
+        unique = tuple(dict.fromkeys(texts))
+        self.name = name
+        self.texts = unique
+        self.refs = tuple(text_ref(text) for text in unique)
+        self.version = text_ref("\x1f".join(self.refs))
+        self._index = {text: i for i, text in enumerate(unique)}
+        self._by_ref = {ref: i for i, ref in enumerate(self.refs)}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def index(self, text: str):
+        """Position of `text` in the pack, or None for text the pack does not hold."""
+        return self._index.get(text)
+
+    def resolve(self, ref: str):
+        """Position for a stored content hash, or None if the text has changed since."""
+        return self._by_ref.get(ref)
+
+    @classmethod
+    def from_flow(cls, flow) -> "ContentPack":
+        """Everything the flow can say: prompt, intro, transition texts and the texts its hooks declare."""
+        texts = [flow.system_prompt, *flow.intro]
+        pending = [t for stage in flow.stages.values() for t in [*stage.choices.values(), stage.otherwise] if t]
+        seen = set()
+        while pending:
+            transition = pending.pop()
+            if id(transition) in seen:
+                continue
+            seen.add(id(transition))
+            texts.extend(transition.say)
+            if transition.hook is not None:
+                texts.extend(getattr(transition.hook, "texts", ()))
+                pending.extend(getattr(transition.hook, "transitions", ()))
+        return cls(flow.tab_name, texts)
+
+
+class MessageLog:
+    """A tab transcript: role codes and pack references in arrays, session-only texts in a list.
+
+    refs[i] >= 0 is a position in the pack; refs[i] < 0 is -1 - position in `own`.
+    """
+
+    __slots__ = ("pack", "_roles", "_refs", "_own")
+
+    def __init__(self, pack: ContentPack, messages=()):
+        self.pack = pack
+        self._roles = array("b")
+        self._refs = array("i")
+        self._own = []
+        for message in messages:
+            self.append(message)
+
+    def _add(self, role: str, ref: int):
+        self._roles.append(_ROLE_CODES[role])
+        self._refs.append(ref)
+
+    def append(self, message: dict):
+        content = message["content"]
+        position = self.pack.index(content)
+        if position is None:
+            self._own.append(content)
+            position = -len(self._own)
+        self._add(message["role"], position)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def _message(self, i: int) -> dict:
+        ref = self._refs[i]
+        content = self.pack.texts[ref] if ref >= 0 else self._own[-1 - ref]
+        return {"role": ROLES[self._roles[i]], "content": content}
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._message(i) for i in range(*key.indices(len(self._refs)))]
+        if key < 0:
+            key += len(self._refs)
+        if not 0 <= key < len(self._refs):
+            raise IndexError("message index out of range")
+        return self._message(key)
+
+    def __iter__(self):
+        for i in range(len(self._refs)):
+            yield self._message(i)
+
+    def __add__(self, other) -> list:
+        return list(self) + list(other)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (MessageLog, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"MessageLog({self.pack.name!r}, {len(self)} messages, {len(self._own)} own texts)"
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def record(self, i: int) -> dict:
+        """The message as stored by the session store: a pack reference, or its own text."""
+        ref = self._refs[i]
+        role = ROLES[self._roles[i]]
+        if ref >= 0:
+            return {"role": role, "ref": self.pack.refs[ref]}
+        return {"role": role, "content": self._own[-1 - ref]}
+
+    def append_record(self, record: dict):
+        if "ref" not in record:
+            self.append(record)
+            return
+        position = self.pack.resolve(record["ref"])
+        if position is None:
+            self._own.append(MISSING_TEXT)
+            position = -len(self._own)
+        self._add(record["role"], position)
+
+    def nbytes(self) -> int:
+        """Memory held by this transcript alone; pack texts are shared and not counted."""
+        own = sys.getsizeof(self._own) + sum(sys.getsizeof(text) for text in self._own)
+        return sys.getsizeof(self._roles) + sys.getsizeof(self._refs) + own
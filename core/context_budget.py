@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Token-aware context budget for chat completion calls.
+
+The free-chat paths used to send the whole tab history on every turn, so the
+prompt (and latency) grew with the session. fit_messages() keeps the system
+prompt and the most recent turns inside a per-tab token budget and folds
+older turns into a rolling summary. The summary is recomputed on a
+background thread, so a turn never waits for it: until it is ready the
+previous summary is used.
+"""
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from core.llm_router import route_client
+from core.telemetry import submit_in_context
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken ships with langchain_openai, but stay usable without it
+    tiktoken = None
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+DEFAULT_TOKEN_BUDGET = 3000
+MIN_RECENT_MESSAGES = 6        # always sent verbatim, even over budget
+SUMMARY_MAX_WORDS = 120
+MESSAGE_OVERHEAD_TOKENS = 4    # role + separators per chat message
+
+SUMMARY_PROMPT = f"""
+You maintain a short running summary of a mentoring chat between Zara and a trainee.
+Update the summary with the new messages. Keep the trainee's situation, the statements
+or interests they wrote, and anything Zara promised. Use at most {SUMMARY_MAX_WORDS} words.
+Reply with the summary text only.
+"""
+
+# One small pool per process; summaries are cheap and rare compared to chat turns.
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-summary")
+
+
+# -----------------------------
+# Token counting
+# -----------------------------
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=4096)
+def count_text_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1  # rough but stable estimate for English text
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message: dict) -> int:
+    return count_text_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+# -----------------------------
+# Rolling summary
+# -----------------------------
+def make_summarizer(client, model: str):
+    """Build a callable (previous_summary, messages) -> summary for the background worker."""
+    client = route_client(client, "summary")
+
+    def summarize(previous_summary: str, messages: list) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"},
+            ],
+            stream=False,
+        )
+        return response.choices[0].message.content.strip()
+    return summarize
+
+
+def _context_state(tab_name: str, state=None) -> dict:
+    state = st.session_state if state is None else state
+    if "context_state" not in state:
+        state["context_state"] = {}
+    return state["context_state"].setdefault(
+        tab_name, {"summary": "", "summarized_upto": 0, "pending": None, "pending_upto": 0}
+    )
+
+
+def _collect_finished_summary(state: dict):
+    future = state["pending"]
+    if future is None or not future.done():
+        return
+    state["pending"] = None
+    try:
+        state["summary"] = future.result()
+        state["summarized_upto"] = state["pending_upto"]
+    except Exception:
+        pass  # keep the previous summary; the next turn will try again
+
+
+def summary_record(state: dict) -> dict:
+    """A tab's rolling summary as plain data for an external store; a summary still being written is left out."""
+    _collect_finished_summary(state)
+    return {"summary": state["summary"], "summarized_upto": state["summarized_upto"]}
+
+
+# -----------------------------
+# Budget fitting
+# -----------------------------
+def fit_messages(tab_name: str, messages: list, summarizer=None, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 state=None) -> list:
+    """
+    Return the messages to send for this turn.
+
+    `messages` is the full history for the tab with the new user turn last.
+    The leading system prompt and the last MIN_RECENT_MESSAGES are always kept;
+    older turns that do not fit are replaced by the rolling summary. The summary
+    lives in `state` (default st.session_state; background jobs pass ctx.state).
+    """
+    if messages and messages[0]["role"] == "system":
+        system, turns = messages[:1], messages[1:]
+    else:
+        system, turns = [], messages
+
+    state = _context_state(tab_name, state)
+    _collect_finished_summary(state)
+
+    summary_message = []
+    if state["summary"]:
+        summary_message = [{"role": "system", "content": f"Summary of the earlier conversation:\n{state['summary']}"}]
+
+    remaining = token_budget - sum(count_message_tokens(m) for m in system + summary_message)
+    cut = len(turns)
+    while cut > 0:
+        cost = count_message_tokens(turns[cut - 1])
+        if len(turns) - cut >= MIN_RECENT_MESSAGES and cost > remaining:
+            break
+        remaining -= cost
+        cut -= 1
+
+    if cut == 0:
+        return list(messages)
+
+    # Older turns are dropped from this request; fold any not yet summarised in the background.
+    if summarizer is not None and state["pending"] is None and cut > state["summarized_upto"]:
+        start = state["summarized_upto"]
+        state["pending_upto"] = cut
+        state["pending"] = submit_in_context(_summary_executor, summarizer, state["summary"], turns[start:cut])
+
+    return system + summary_message + turns[cut:]
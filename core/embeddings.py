@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local CPU sentence embeddings, loaded once per process.
+
+The semantic answer cache and the judgments index share the same model, so
+it is loaded (and kept in memory) only once.
+"""
+
+import functools
+
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+BATCH_SIZE = 32
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedder(model_name: str = DEFAULT_MODEL):
+    """sentence-transformers model on CPU, or None when the package is not installed."""
+    try:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, device="cpu")
+    except Exception:
+        return None
+
+
+def embed_texts(texts: list, model_name: str = DEFAULT_MODEL, batch_size: int = BATCH_SIZE):
+    """L2-normalised float32 embeddings, one row per text."""
+    import numpy as np
+
+    embedder = get_embedder(model_name)
+    if embedder is None:
+        raise RuntimeError("sentence-transformers is required to embed text.")
+    if not texts:
+        dim = embedder.get_sentence_embedding_dimension()
+        return np.zeros((0, dim), dtype=np.float32)
+    vectors = embedder.encode(list(texts), batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
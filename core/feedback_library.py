@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed feedback for the validator and reflection stages.
+
+The I-statement and We-statement stages of I_WE and the two interest checks
+of partners_interest send a fixed prompt over a short trainee text, and
+most submissions are near-copies of the examples we show, so the model
+keeps writing the same feedback while the trainee waits. The
+library is built offline with `python -m core.feedback_library`:
+
+- it mines what trainees answered at these stages from the stored
+  conversations (the session store and the webhook channel's store),
+  working out the stage each answer was given at from the scripted message
+  before it;
+- it groups the answers by normalised text and, when the sentence embedder
+  is available, merges near-duplicates (CLUSTER_SIMILARITY);
+- it has the model write the stage's feedback for the most frequent text
+  of each group, in bulk, and vets every result (complete fields, sane
+  length, no leftover JSON). Entries that fail stay in the file with
+  "vetted": false and are never served; set the flag by hand to withdraw
+  or approve an entry. A rebuild keeps the results and flags of groups it
+  already had.
+
+The artifact is data/feedback_library/library.json plus vectors.npy
+(float16, one row per entry) and is loaded once per process. A stage's
+entries are ignored once its prompt changes. At runtime a hook asks
+consult() first:
+
+- a close match (exact normalised text, or similarity >= MATCH_SIMILARITY)
+  is served at once, without an LLM call;
+- a looser match (>= FALLBACK_SIMILARITY) is a fallback: the live call runs
+  with its first token raced against the SLO (within_slo) and the fallback
+  is served if the SLO passes first. While the route's recent p95 is over
+  the SLO and the stage's last race was lost less than PROBE_SECONDS ago,
+  the fallback is served at once instead; after that a live call races
+  again, since the p95 only moves when live calls are made;
+- fields that decide the next transition (is_valid) are only served for
+  the same normalised text. An entry borrowed from another text (a
+  similarity match or a fallback) comes without them, and the validator
+  serves its feedback but keeps the stage (core/flow_engine.py).
+
+Set ZARA_FEEDBACK_LIBRARY=0 to always call the model.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+import streamlit as st
+
+from core.content_pack import text_ref
+from core.embeddings import DEFAULT_MODEL, embed_texts, get_embedder
+from core.llm_router import LLMRouter
+from core.paths import CACHE_DIR, REPO_ROOT
+from core.telemetry import get_telemetry, record_cache_hit
+from core.validator_cache import normalize_input
+
+try:
+    import numpy as np
+except ImportError:  # numpy comes with sentence-transformers; without it only exact matches are served
+    np = None
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+LIBRARY_DIR = os.getenv("ZARA_FEEDBACK_LIBRARY_DIR", os.path.join(REPO_ROOT, "data", "feedback_library"))
+LIBRARY_FILE = "library.json"
+VECTORS_FILE = "vectors.npy"
+FORMAT_VERSION = 1
+ENABLED = os.getenv("ZARA_FEEDBACK_LIBRARY", "1") != "0"
+
+MATCH_SIMILARITY = float(os.getenv("ZARA_FEEDBACK_MATCH_SIMILARITY", "0.92"))
+FALLBACK_SIMILARITY = float(os.getenv("ZARA_FEEDBACK_FALLBACK_SIMILARITY", "0.75"))
+PROBE_SECONDS = float(os.getenv("ZARA_FEEDBACK_PROBE_SECONDS", "60"))
+CLUSTER_SIMILARITY = 0.90
+MAX_VARIANTS = 50              # normalised texts kept per entry for exact lookup
+MAX_TEXT_CHARS = 900           # longest feedback or reflection that passes vetting
+
+SESSION_STORE_PATH = os.path.join(CACHE_DIR, "sessions.sqlite3")
+CHANNEL_STORE_PATH = os.path.join(CACHE_DIR, "channel_users.sqlite3")
+
+OUTCOMES = ("match", "slo_predicted", "slo_exceeded", "live", "miss")
+DECISION_FIELDS = ("is_valid",)
+
+
+@dataclass(frozen=True)
+class LibraryStage:
+    """A hook's entry in the library.
+
+    The hook that declares it (hook.library) also provides
+    hook.precompute(client, model, *values) -> dict of `fields`, used offline.
+    """
+    name: str                   # key in the artifact
+    inputs: tuple               # session keys whose values, joined, are matched
+    fields: tuple               # what an entry holds, e.g. ("feedback", "is_valid")
+    prompt: str                 # the stage's fixed prompt; entries made with another prompt are ignored
+    route: str = "validation"   # router route the live call takes
+    slo: float = 3.0            # seconds to the live call's first token before the fallback is served
+
+    @property
+    def version(self) -> str:
+        return text_ref(self.prompt)
+
+    @property
+    def decides(self) -> bool:
+        """Whether entries hold a field that picks the next transition, which is only served for the same text."""
+        return any(field in DECISION_FIELDS for field in self.fields)
+
+    def values(self, state) -> tuple:
+        return tuple(state.get(key) or "" for key in self.inputs)
+
+
+def match_text(values) -> str:
+    return normalize_input("\n".join(values))
+
+
+class SLOExceeded(Exception):
+    """The live call produced nothing within the stage's SLO."""
+
+
+async def within_slo(chunks, seconds: float):
+    """Pass an async iterator of text through, but give up (SLOExceeded) if its first item takes longer than `seconds`."""
+    iterator = chunks.__aiter__()
+    try:
+        first = await asyncio.wait_for(iterator.__anext__(), seconds)
+    except StopAsyncIteration:
+        return
+    except asyncio.TimeoutError:
+        raise SLOExceeded(f"no text within {seconds:g}s") from None
+    yield first
+    async for text in iterator:
+        yield text
+
+
+# -----------------------------
+# Library
+# -----------------------------
+class FeedbackLibrary:
+    """Vetted entries per stage, looked up by normalised text, then by embedding similarity."""
+
+    def __init__(self, manifest: dict = None, vectors=None, embedder=None):
+        manifest = manifest or {"stages": {}}
+        self.manifest = manifest
+        self._embedder = embedder
+        self._versions = {}
+        self._exact = {}            # (stage, normalised text) -> entry
+        self._rows = {}             # stage -> (row numbers, entries)
+        for name, stage in manifest["stages"].items():
+            self._versions[name] = stage["version"]
+            rows, entries = [], []
+            for entry in stage["entries"]:
+                if not entry.get("vetted"):
+                    continue
+                for variant in [entry["text"], *entry.get("variants", ())]:
+                    self._exact.setdefault((name, variant), entry)
+                if vectors is not None and entry.get("row") is not None:
+                    rows.append(entry["row"])
+                    entries.append(entry)
+            if rows:
+                self._rows[name] = (np.asarray(vectors[rows], dtype=np.float32), entries)
+        self._lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self._last_race = {}        # stage -> (monotonic time, whether the live call beat the SLO)
+
+    def __len__(self) -> int:
+        return len({id(entry) for entry in self._exact.values()})
+
+    def best(self, stage: LibraryStage, values) -> tuple:
+        """(entry, similarity, exact) of the closest vetted entry for the stage, or (None, 0.0, False)."""
+        if self._versions.get(stage.name) != stage.version:
+            return None, 0.0, False
+        text = match_text(values)
+        entry = self._exact.get((stage.name, text))
+        if entry is not None:
+            return entry, 1.0, True
+        if stage.name not in self._rows or self._embedder is None or not text:
+            return None, 0.0, False
+        try:
+            vector = np.asarray(self._embedder.encode(text, normalize_embeddings=True), dtype=np.float32)
+        except Exception:
+            return None, 0.0, False
+        matrix, entries = self._rows[stage.name]
+        scores = matrix @ vector
+        row = int(np.argmax(scores))
+        return entries[row], float(scores[row]), False
+
+    def count(self, stage: LibraryStage, outcome: str):
+        with self._lock:
+            self.counters[(stage.name, outcome)] += 1
+            if outcome in ("live", "slo_exceeded"):
+                self._last_race[stage.name] = (time.monotonic(), outcome == "live")
+        get_telemetry().metrics.inc("zara_feedback_library_total", {"stage": stage.name, "outcome": outcome})
+
+    def race_lost_recently(self, stage: LibraryStage) -> bool:
+        """Whether the stage's last live call missed its SLO, less than PROBE_SECONDS ago."""
+        with self._lock:
+            last = self._last_race.get(stage.name)
+        return last is not None and not last[1] and time.monotonic() - last[0] < PROBE_SECONDS
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        stats = {}
+        for name, stage in self.manifest["stages"].items():
+            served = sum(counters.get((name, outcome), 0) for outcome in ("match", "slo_predicted", "slo_exceeded"))
+            looked_up = served + sum(counters.get((name, outcome), 0) for outcome in ("live", "miss"))
+            stats[name] = dict({outcome: counters.get((name, outcome), 0) for outcome in OUTCOMES},
+                               entries=sum(bool(e.get("vetted")) for e in stage["entries"]),
+                               served_rate=round(served / looked_up, 3) if looked_up else 0.0)
+        return stats
+
+
+def load_library(library_dir: str = LIBRARY_DIR) -> FeedbackLibrary:
+    """The artifact in `library_dir`, or an empty library when there is none."""
+    path = os.path.join(library_dir, LIBRARY_FILE)
+    if not os.path.exists(path):
+        return FeedbackLibrary()
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        return FeedbackLibrary()
+    vectors, embedder = None, None
+    vectors_path = os.path.join(library_dir, VECTORS_FILE)
+    if manifest.get("model") and np is not None and os.path.exists(vectors_path):
+        embedder = get_embedder(manifest["model"])
+        vectors = np.load(vectors_path) if embedder is not None else None
+    return FeedbackLibrary(manifest, vectors, embedder)
+
+
+@st.cache_resource(show_spinner=False)
+def get_feedback_library() -> FeedbackLibrary:
+    """Loaded once per process; empty when ZARA_FEEDBACK_LIBRARY=0 or the artifact has not been built."""
+    return load_library() if ENABLED else FeedbackLibrary()
+
+
+# -----------------------------
+# Runtime
+# -----------------------------
+def expected_latency(client, route: str):
+    """The route's recent p95 when `client` is the router, else None."""
+    return client.expected_latency(route) if isinstance(client, LLMRouter) else None
+
+
+async def consult(stage: LibraryStage, values, client) -> tuple:
+    """
+    (entry, serve_now) for one submission: serve_now means skip the LLM
+    call; an entry with serve_now False is the fallback to serve if the live
+    call misses the stage's SLO (see within_slo). (None, False): call the model.
+    Unless the entry was made for the same normalised text, its fields leave
+    out the decision fields.
+    """
+    library = get_feedback_library()
+    entry, score, exact = await asyncio.to_thread(library.best, stage, values)
+    if entry is None or score < FALLBACK_SIMILARITY:
+        library.count(stage, "miss")
+        return None, False
+    if stage.decides and not exact:
+        entry = dict(entry, fields={name: value for name, value in entry["fields"].items() if name not in DECISION_FIELDS})
+    if score >= MATCH_SIMILARITY:
+        served(stage, "match")
+        return entry, True
+    # The p95 only moves with live calls, so it is trusted only while the live calls keep missing the SLO
+    expected = expected_latency(client, stage.route)
+    if expected is not None and expected > stage.slo and library.race_lost_recently(stage):
+        served(stage, "slo_predicted")
+        return entry, True
+    return entry, False
+
+
+def served(stage: LibraryStage, outcome: str):
+    """Count a library answer served instead of an LLM call ("match", "slo_predicted" or "slo_exceeded")."""
+    get_feedback_library().count(stage, outcome)
+    if outcome != "slo_exceeded":  # an exceeded call was made, and is recorded as cancelled
+        record_cache_hit(stage.route, "feedback_library")
+
+
+def answered_live(stage: LibraryStage):
+    """The live call beat the SLO although a fallback was ready."""
+    get_feedback_library().count(stage, "live")
+
+
+def render_library_stats(library: FeedbackLibrary):
+    """Entries and served/live counts per stage, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    with st.sidebar.expander("Feedback library"):
+        st.json(library.stats())
+
+
+# -----------------------------
+# Offline build: stages and their answers
+# -----------------------------
+def library_hooks(flow) -> list:
+    """[(stage number, hook)] for every hook of the flow that declares a LibraryStage."""
+    found = []
+    for number, stage in flow.stages.items():
+        pending = [t for t in [*stage.choices.values(), stage.otherwise] if t]
+        seen = set()
+        while pending:
+            transition = pending.pop()
+            if id(transition) in seen:
+                continue
+            seen.add(id(transition))
+            if transition.hook is not None:
+                if getattr(transition.hook, "library", None) is not None:
+                    found.append((number, transition.hook))
+                pending.extend(getattr(transition.hook, "transitions", ()))
+    return found
+
+
+def _prompt_stages(compiled) -> dict:
+    """Content-pack position of each scripted text -> the stage the next answer is given at."""
+    flow, targets = compiled.flow, defaultdict(set)
+    if flow.intro:
+        targets[compiled.content.index(flow.intro[-1])].add(flow.intro_to if flow.intro_to is not None else min(flow.stages))
+
+    def walk(transition, stage, seen):
+        if id(transition) in seen:
+            return
+        seen = seen | {id(transition)}
+        reached = transition.to if transition.to is not None else stage
+        if transition.say:
+            targets[compiled.content.index(transition.say[-1])].add(reached)
+        for follow_up in getattr(transition.hook, "transitions", ()):
+            walk(follow_up, reached, seen)
+
+    for number, stage in flow.stages.items():
+        for transition in [*stage.choices.values(), stage.otherwise]:
+            if transition is not None:
+                walk(transition, number, frozenset())
+    # A text that leads to different stages says nothing about where the trainee is
+    return {position: stages.pop() for position, stages in targets.items() if len(stages) == 1}
+
+
+def mine_answers(compiled, transcripts) -> dict:
+    """{stage name: Counter of value tuples} from stored transcripts (lists of message records)."""
+    flow = compiled.flow
+    prompts = _prompt_stages(compiled)
+    hooks = defaultdict(list)
+    for number, hook in library_hooks(flow):
+        hooks[number].append(hook.library)
+    found = defaultdict(Counter)
+    for records in transcripts:
+        state, awaiting = {}, None
+        for record in records:
+            if "ref" in record:
+                position = compiled.content.resolve(record["ref"])
+                text = compiled.content.texts[position] if position is not None else None
+            else:
+                text = record.get("content")
+                position = compiled.content.index(text) if text is not None else None
+            if record["role"] == "assistant":
+                if position in prompts:
+                    awaiting = prompts[position]
+                continue
+            if record["role"] != "user" or awaiting is None or text is None:
+                continue
+            stage = flow.stages.get(awaiting)
+            if stage is not None and stage.store_as:
+                state[stage.store_as] = text
+            for library_stage in hooks.get(awaiting, ()):
+                values = library_stage.values(state)
+                if match_text(values):
+                    found[library_stage.name][values] += 1
+            awaiting = None
+    return found
+
+
+def session_transcripts(path: str = SESSION_STORE_PATH) -> dict:
+    """{tab name: [records, ...]} from a session store file."""
+    transcripts = defaultdict(list)
+    if not os.path.exists(path):
+        return transcripts
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        current, records = None, None
+        for token, tab, body in conn.execute("SELECT token, tab, body FROM session_messages ORDER BY token, tab, seq"):
+            if (token, tab) != current:
+                current, records = (token, tab), []
+                transcripts[tab].append(records)
+            records.append(json.loads(body))
+    finally:
+        conn.close()
+    return transcripts
+
+
+def channel_transcripts(path: str = CHANNEL_STORE_PATH) -> dict:
+    """{tab name: [records, ...]} from the webhook channel's user store (channels/whatsapp.py)."""
+    transcripts = defaultdict(list)
+    if not os.path.exists(path):
+        return transcripts
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        for (body,) in conn.execute("SELECT body FROM channel_users"):
+            for tab, saved in json.loads(zlib.decompress(body))["flows"].items():
+                transcripts[tab].append(saved.get("messages", []))
+    finally:
+        conn.close()
+    return transcripts
+
+
+# -----------------------------
+# Offline build: grouping, generation, vetting
+# -----------------------------
+def group_answers(counts: Counter, min_count: int, max_entries: int, model_name: str = None) -> list:
+    """
+    [{"text", "inputs", "variants", "count"}], most frequent first. Answers
+    are grouped by normalised text, then, with an embedding model, groups
+    within CLUSTER_SIMILARITY of a more frequent one are merged into it.
+    """
+    by_text = {}
+    for values, count in counts.most_common():
+        text = match_text(values)
+        group = by_text.setdefault(text, {"text": text, "inputs": list(values), "variants": [], "count": 0})
+        group["count"] += count
+    groups = sorted(by_text.values(), key=lambda g: -g["count"])
+
+    if model_name and groups:
+        vectors = embed_texts([g["text"] for g in groups], model_name)
+        leaders, leader_vectors = [], []
+        for group, vector in zip(groups, vectors):
+            if leader_vectors:
+                scores = np.stack(leader_vectors) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= CLUSTER_SIMILARITY:
+                    leader = leaders[best]
+                    leader["count"] += group["count"]
+                    if len(leader["variants"]) < MAX_VARIANTS:
+                        leader["variants"].append(group["text"])
+                    continue
+            leaders.append(group)
+            leader_vectors.append(vector)
+        groups = sorted(leaders, key=lambda g: -g["count"])
+
+    return [g for g in groups if g["count"] >= min_count][:max_entries]
+
+
+def vet(stage: LibraryStage, result) -> bool:
+    """Automatic checks before an entry may be served."""
+    if not isinstance(result, dict):
+        return False
+    for field in stage.fields:
+        value = result.get(field)
+        if field == "is_valid":
+            if not isinstance(value, bool):
+                return False
+            continue
+        if not isinstance(value, str) or not value.strip() or len(value) > MAX_TEXT_CHARS:
+            return False
+        if value.lstrip().startswith(("{", "```", "⚠️")):
+            return False
+    return True
+
+
+async def _generate(hooks: dict, groups: dict, client, model: str, concurrency: int) -> dict:
+    """Run each new group's stage precompute with bounded concurrency; {(stage, text): result or None}."""
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def one(name, group):
+        async with semaphore:
+            try:
+                result = await hooks[name].precompute(client, model, *group["inputs"])
+                results[(name, group["text"])] = {field: result.get(field) for field in hooks[name].library.fields}
+            except Exception:
+                results[(name, group["text"])] = None
+
+    await asyncio.gather(*(one(name, group) for name, stage_groups in groups.items() for group in stage_groups))
+    return results
+
+
+def _read_manifest(library_dir: str):
+    path = os.path.join(library_dir, LIBRARY_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("format") == FORMAT_VERSION else None
+
+
+def build_library(flows, transcripts: dict, client, model: str, library_dir: str = LIBRARY_DIR, min_count: int = 2,
+                  max_entries: int = 300, concurrency: int = 8, model_name: str = DEFAULT_MODEL) -> dict:
+    """
+    Mine, group, generate and vet; write the artifact. `transcripts` is
+    {tab name: [records, ...]}. Returns build stats.
+    """
+    from core.flow_engine import compile_flow
+
+    started = time.perf_counter()
+    model_name = model_name if get_embedder(model_name) is not None and np is not None else None
+    hooks, groups = {}, {}
+    for flow in flows:
+        compiled = compile_flow(flow)
+        for _, hook in library_hooks(flow):
+            hooks[hook.library.name] = hook
+        for name, counts in mine_answers(compiled, transcripts.get(flow.tab_name, [])).items():
+            groups[name] = group_answers(counts, min_count, max_entries, model_name)
+
+    # Groups the previous build already answered keep their result and vetting flag.
+    previous = _read_manifest(library_dir) or {"stages": {}}
+    kept = {}
+    for name, stage in previous["stages"].items():
+        if name in hooks and stage["version"] == hooks[name].library.version:
+            kept.update({(name, entry["text"]): entry for entry in stage["entries"]})
+    new = {name: [g for g in stage_groups if (name, g["text"]) not in kept] for name, stage_groups in groups.items()}
+    results = asyncio.run(_generate(hooks, new, client, model, concurrency)) if any(new.values()) else {}
+
+    stages, texts, counts = {}, [], Counter()
+    for name, hook in hooks.items():
+        entries = []
+        for group in groups.get(name, []):
+            old = kept.get((name, group["text"]))
+            if old is not None:
+                fields, vetted = old["fields"], old.get("vetted", False)
+                counts["reused"] += 1
+            else:
+                fields = results.get((name, group["text"]))
+                if fields is None:
+                    counts["failed"] += 1
+                    continue
+                vetted = vet(hook.library, fields)
+                counts["generated"] += 1
+            counts["vetted" if vetted else "rejected"] += 1
+            entry = dict(group, fields=fields, vetted=vetted, row=len(texts) if model_name else None)
+            entries.append(entry)
+            texts.append(group["text"])
+        stages[name] = {"version": hook.library.version, "fields": list(hook.library.fields), "entries": entries}
+
+    manifest = {"format": FORMAT_VERSION, "model": model_name, "llm_model": model, "built_at": time.time(),
+                "min_count": min_count, "stages": stages}
+    os.makedirs(library_dir, exist_ok=True)
+    if model_name:
+        vectors = embed_texts(texts, model_name).astype(np.float16)
+        vectors_tmp = os.path.join(library_dir, VECTORS_FILE + ".tmp")
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, vectors)
+        os.replace(vectors_tmp, os.path.join(library_dir, VECTORS_FILE))
+    manifest_tmp = os.path.join(library_dir, LIBRARY_FILE + ".tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(manifest_tmp, os.path.join(library_dir, LIBRARY_FILE))
+
+    return dict(counts, stages={name: len(stage["entries"]) for name, stage in stages.items()},
+                answers={name: sum(g["count"] for g in stage_groups) for name, stage_groups in groups.items()},
+                embeddings=model_name, seconds=round(time.perf_counter() - started, 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the precomputed feedback library from stored conversations.")
+    parser.add_argument("--sessions", default=SESSION_STORE_PATH, help="session store SQLite file to mine")
+    parser.add_argument("--channel-store", default=CHANNEL_STORE_PATH, help="webhook channel store to mine")
+    parser.add_argument("--library-dir", default=LIBRARY_DIR)
+    parser.add_argument("--min-count", type=int, default=2, help="answers a group needs to get an entry")
+    parser.add_argument("--max-entries", type=int, default=300, help="entries per stage, most frequent first")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight")
+    parser.add_argument("--model", default="o4-mini-2025-04-16", help="model asked for on each stage's route")
+    args = parser.parse_args()
+
+    from core.llm_gateway import LLMGateway
+    from tabs import TABS, load_tab
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("OPENAI_API_KEY is not set.")
+    client = LLMRouter(LLMGateway({"openai": api_key, "groq": os.getenv("GROQ_API_KEY", "")}))
+    transcripts = defaultdict(list)
+    for source in (session_transcripts(args.sessions), channel_transcripts(args.channel_store)):
+        for tab, records in source.items():
+            transcripts[tab].extend(records)
+    flows = [load_tab(tab.label).FLOW for tab in TABS]
+    stats = build_library(flows, transcripts, client, args.model, args.library_dir, args.min_count, args.max_entries,
+                          args.concurrency)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Table-driven conversation engine for the training tabs.
+
+Each tab used to hand-roll its script as an if/elif ladder over a stage
+number, with several st.rerun() and repaint calls per user turn. A tab now
+describes its script as data - stages, the scripted messages each answer
+leads to, and hooks for the LLM steps - and the engine compiles it into a
+transition table once per process.
+
+st.chat_input hands the text to an on_submit callback, so the run that
+follows processes the turn *before* the input box is drawn and the box
+already shows the new stage's placeholder. A scripted turn is done within
+that one script pass; a turn that reaches a hook takes that pass (which
+starts its job), several fragment polls while the job runs, and one final
+full rerun (see below). Dispatch is a dict lookup on the stage, then on
+the normalised answer.
+
+Hooks receive a turn context (`ctx`) instead of calling Streamlit directly:
+ctx.say() appends a message, ctx.stream() shows text as it arrives and
+ctx.error() reports a failure. That keeps the flows runnable outside
+Streamlit with a different context object.
+
+Hooks are coroutines, and a turn that reaches one runs as a background LLM
+job (core/llm_jobs.py) instead of inside the script run. The job works on
+a JobTurn - a copy of the flow's state keys plus the messages it says - and
+the page polls it from an st.fragment, drawing its streamed text; when it
+ends, a full rerun hands its messages and state to the session. Scripted
+turns (no hook) are still applied within the script pass. Switching tabs
+cancels a tab's running job.
+
+Each turn is recorded as a "turn" span and each script pass as a "run" span
+(core/telemetry.py); LLM calls made during the turn carry its tab and stage.
+
+The flow's fixed texts form its ContentPack, built once at compile time;
+session transcripts are MessageLogs that reference them instead of holding
+copies (core/content_pack.py).
+
+New messages and the flow's state keys (stage, stored answers, the retry
+flags of validator hooks) are handed to the session store after each pass
+(core/session_store.py), so a reconnecting trainee resumes where they were.
+
+Validator hooks can declare a LibraryStage: its precomputed feedback is
+served instead of the LLM call on a close match or when the call would miss
+the stage's latency SLO (core/feedback_library.py).
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import streamlit as st
+
+from core.concurrent_streams import aiter_text
+from core.content_pack import ContentPack, MessageLog
+from core.context_budget import DEFAULT_TOKEN_BUDGET, fit_messages, make_summarizer
+from core.feedback_library import LibraryStage, SLOExceeded, answered_live, consult, served, within_slo
+from core.llm_jobs import JOBS_ENABLED, POLL_SECONDS, get_job_executor
+from core.llm_router import async_route_client
+from core.session_memory import get_session_memory
+from core.session_store import restored_messages, sync_session
+from core.structured_feedback import FEEDBACK_RESPONSE_FORMAT, parse_feedback_json
+from core.telemetry import mark_turn_first_text, record_script_run, turn_span
+from core.transcript import mark_rendered, render_history, render_new
+from core.validator_cache import astream_cached_validator
+
+
+# -----------------------------
+# Flow definition
+# -----------------------------
+@dataclass(frozen=True)
+class Transition:
+    """What an answer leads to: run `hook`, append `say`, then move to stage `to`.
+
+    A hook is a coroutine function, awaited as hook(ctx, text) in a background
+    job, and may return another Transition to apply afterwards (e.g. a
+    validator choosing between "valid" and "retry").
+    Hooks declare what they may return as `hook.transitions`, fixed texts they
+    say as `hook.texts` and session keys they write as `hook.state_keys`.
+    """
+    say: tuple = ()
+    to: Optional[int] = None
+    hook: Optional[Callable] = None
+
+
+@dataclass(frozen=True)
+class Stage:
+    placeholder: str
+    choices: dict = field(default_factory=dict)   # answer ("1", "2", ...) -> Transition
+    otherwise: Optional[Transition] = None        # any other answer
+    store_as: Optional[str] = None                # session key that keeps the raw answer
+
+
+@dataclass(frozen=True)
+class Flow:
+    tab_name: str
+    header: str
+    system_prompt: str
+    stage_key: str
+    stages: dict                                  # stage number -> Stage; the highest is open-ended
+    intro: tuple = ()                             # scripted messages shown when the tab first opens
+    intro_to: Optional[int] = None                # stage after the intro, if it changes
+    state_defaults: dict = field(default_factory=dict)
+    context_budget: int = DEFAULT_TOKEN_BUDGET
+
+
+def normalize_answer(text: str) -> str:
+    return text.strip().lower()
+
+
+class CompiledFlow:
+    """A Flow checked and flattened into lookup tables."""
+
+    def __init__(self, flow: Flow):
+        if not flow.stages:
+            raise ValueError(f"Flow '{flow.tab_name}' has no stages.")
+        self.flow = flow
+        self.final_stage = max(flow.stages)
+        self.table = {}
+        # Session keys that make up the conversation's progress, persisted by the session store
+        state_keys = {flow.stage_key, *flow.state_defaults}
+        for number, stage in flow.stages.items():
+            choices = {normalize_answer(answer): transition for answer, transition in stage.choices.items()}
+            if stage.store_as:
+                state_keys.add(stage.store_as)
+            for transition in list(choices.values()) + [stage.otherwise]:
+                if transition is not None and transition.to is not None and transition.to not in flow.stages:
+                    raise ValueError(f"Flow '{flow.tab_name}' stage {number} leads to unknown stage {transition.to}.")
+                if transition is not None and transition.hook is not None:
+                    state_keys.update(getattr(transition.hook, "state_keys", ()))
+            self.table[number] = (stage, choices)
+        self.state_keys = tuple(sorted(state_keys))
+        self.content = ContentPack.from_flow(flow)
+
+    def lookup(self, stage_number: int):
+        """(Stage, choices) for a stage; anything past the last stage stays in it."""
+        return self.table.get(stage_number) or self.table[self.final_stage if stage_number > self.final_stage else min(self.table)]
+
+    def transition_for(self, stage_number: int, text: str):
+        """The transition an answer leads to from a stage, or None."""
+        stage, choices = self.lookup(stage_number)
+        return choices.get(normalize_answer(text), stage.otherwise)
+
+    def needs_job(self, stage_number: int, text: str) -> bool:
+        """Whether the turn runs a hook, and so has to run as a background job."""
+        transition = self.transition_for(stage_number, text)
+        return transition is not None and transition.hook is not None
+
+    def _begin(self, ctx, text: str):
+        stage, _ = self.lookup(ctx.stage)
+        if stage.store_as:
+            ctx.state[stage.store_as] = text
+        ctx.say(text, role="user")
+        return self.transition_for(ctx.stage, text)
+
+    @staticmethod
+    def _apply(ctx, transition: Transition):
+        for content in transition.say:
+            ctx.say(content)
+        if transition.to is not None:
+            ctx.stage = transition.to
+
+    def dispatch(self, ctx, text: str):
+        """Apply one scripted user turn (no hook) to the conversation held by `ctx`."""
+        if self.needs_job(ctx.stage, text):
+            raise ValueError(f"Flow '{self.flow.tab_name}': this turn runs a hook; await adispatch() instead.")
+        with turn_span(ctx.tab_name, ctx.stage) as span:
+            transition = self._begin(ctx, text)
+            if transition is not None:
+                self._apply(ctx, transition)
+            span["to_stage"] = ctx.stage
+
+    async def adispatch(self, ctx, text: str):
+        """Apply one user turn to the conversation held by `ctx`, awaiting its hooks."""
+        with turn_span(ctx.tab_name, ctx.stage) as span:
+            transition = self._begin(ctx, text)
+            while transition is not None:
+                follow_up = await transition.hook(ctx, text) if transition.hook else None
+                self._apply(ctx, transition)
+                transition = follow_up
+            span["to_stage"] = ctx.stage
+
+
+_compiled = {}
+
+
+def compile_flow(flow: Flow) -> CompiledFlow:
+    """Compile a flow once per process; later calls return the same tables."""
+    if flow.tab_name not in _compiled:
+        _compiled[flow.tab_name] = CompiledFlow(flow)
+    return _compiled[flow.tab_name]
+
+
+# -----------------------------
+# Reusable hooks
+# -----------------------------
+def validator(prompt: str, user_template: str, default_feedback: str, error_feedback: str,
+              on_valid: Transition, on_retry: Transition, on_give_up: Transition, retry_key: str,
+              library: LibraryStage = None) -> Callable:
+    """Hook for a JSON validator stage: stream the feedback, then branch on is_valid.
+
+    The first invalid answer gets `on_retry`; the second moves on with `on_give_up`.
+    With a `library` stage, precomputed feedback is served instead of the live
+    call on a close match, or when the call would miss the stage's SLO
+    (core/feedback_library.py). Feedback borrowed from another text carries
+    no is_valid: the stage is kept (counting as the retry), and after the
+    retry the flow moves on with `on_give_up` as it would anyway.
+    """
+    async def hook(ctx, text):
+        entry, serve_now = await consult(library, library.values(ctx.state), ctx.client) if library else (None, False)
+        try:
+            if serve_now:
+                ctx.say(entry["fields"]["feedback"])
+                is_valid = entry["fields"].get("is_valid")  # None when the entry was made for another text
+            else:
+                write_stream = ctx.stream
+                if entry is not None:
+                    write_stream = lambda chunks: ctx.stream(within_slo(chunks, library.slo))  # noqa: E731
+                result = await astream_cached_validator(async_route_client(ctx.client, "validation"), ctx.model, prompt,
+                                                        user_template.format(text=text), write_stream=write_stream)
+                if entry is not None:
+                    answered_live(library)
+                ctx.say(result.get("feedback", default_feedback), shown="feedback" in result)
+                is_valid = result.get("is_valid", False)
+        except SLOExceeded:
+            served(library, "slo_exceeded")
+            ctx.say(entry["fields"]["feedback"])
+            is_valid = entry["fields"].get("is_valid")
+        except Exception as e:
+            ctx.error(f"⚠️ Error from LLM: {e}")
+            ctx.say(error_feedback)
+            is_valid = False
+
+        if is_valid is None:
+            # Feedback written for another text must not pass or fail this one: keep the stage
+            if not ctx.state.get(retry_key, False):
+                ctx.state[retry_key] = True
+                return None
+            return on_give_up
+        if is_valid:
+            return on_valid
+        if not ctx.state.get(retry_key, False):
+            ctx.state[retry_key] = True
+            return on_retry
+        return on_give_up
+
+    async def precompute(client, model, *values):
+        """The feedback for one input, in one JSON call; used to build the library offline."""
+        response = await async_route_client(client, "validation").chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": user_template.format(text=values[-1])},
+            ],
+            response_format=FEEDBACK_RESPONSE_FORMAT,
+        )
+        return parse_feedback_json(response.choices[0].message.content or "")
+
+    hook.state_keys = (retry_key,)
+    hook.transitions = (on_valid, on_retry, on_give_up)
+    hook.texts = (error_feedback,)
+    hook.library = library
+    hook.precompute = precompute
+    return hook
+
+
+async def free_chat(ctx, text):
+    """Open-ended chat over the tab history, trimmed to the flow's token budget."""
+    try:
+        messages = fit_messages(
+            ctx.tab_name,
+            ctx.messages,
+            summarizer=make_summarizer(ctx.client, ctx.model),
+            token_budget=ctx.flow.context_budget,
+            state=ctx.state,
+        )
+        stream = await async_route_client(ctx.client, "chat").chat.completions.create(
+            model=ctx.model, messages=messages, stream=True)
+        response = await ctx.stream(aiter_text(stream))
+    except Exception as e:
+        response = f"⚠️ Error: {e}"
+        ctx.error(response)
+    ctx.say(response, shown=True)
+
+
+# -----------------------------
+# Turn contexts
+# -----------------------------
+class StreamlitTurn:
+    """Turn context for scripted turns, backed by st.session_state and the chat transcript."""
+
+    def __init__(self, compiled: CompiledFlow, client):
+        self.flow = compiled.flow
+        self.tab_name = compiled.flow.tab_name
+        self.client = client
+        self.state = st.session_state
+        self.model = st.session_state["openai_model"]
+
+    @property
+    def messages(self) -> list:
+        return self.state.messages[self.tab_name]
+
+    @property
+    def stage(self) -> int:
+        return self.state[self.flow.stage_key]
+
+    @stage.setter
+    def stage(self, value: int):
+        self.state[self.flow.stage_key] = value
+
+    def say(self, content: str, role: str = "assistant", shown: bool = False):
+        """Append a message; `shown` marks it as already drawn (streamed live)."""
+        self.messages.append({"role": role, "content": content})
+        if shown:
+            mark_rendered(self.tab_name)
+
+
+class JobTurn:
+    """Turn context for a background job; it must not touch st.session_state.
+
+    The job works on a copy of the flow's state keys and collects what it
+    says; apply() hands both to the session on the script thread once the job
+    has ended. Text being streamed is kept in `live` for the page to poll.
+    """
+
+    def __init__(self, compiled: CompiledFlow, client, state):
+        self.flow = compiled.flow
+        self.tab_name = compiled.flow.tab_name
+        self.client = client
+        self.model = state["openai_model"]
+        self.state = {key: state[key] for key in compiled.state_keys if key in state}
+        # The rolling summary is shared, not copied: the summary worker updates it in place.
+        self.state["context_state"] = state.setdefault("context_state", {})
+        self._history = state["messages"][self.tab_name]
+        self.said = []
+        self.errors = []        # (number of messages said before it, text)
+        self.live = None
+        self.job = None
+
+    @property
+    def messages(self) -> list:
+        return self._history + self.said
+
+    @property
+    def stage(self) -> int:
+        return self.state[self.flow.stage_key]
+
+    @stage.setter
+    def stage(self, value: int):
+        self.state[self.flow.stage_key] = value
+
+    def say(self, content: str, role: str = "assistant", shown: bool = False):
+        self.said.append({"role": role, "content": content})
+
+    async def stream(self, chunks) -> str:
+        """Collect an async iterator of text deltas into `live`; return the full text."""
+        self.live = ""
+        try:
+            async for text in chunks:
+                if not self.live:
+                    mark_turn_first_text()
+                self.live += text
+            return self.live
+        finally:
+            self.live = None
+
+    def error(self, message: str):
+        self.errors.append((len(self.said), message))
+
+    def apply(self, state):
+        """Hand what the job said and changed to the session (script thread only)."""
+        state["messages"][self.tab_name].extend(self.said)
+        for key, value in self.state.items():
+            state[key] = value
+
+
+# -----------------------------
+# Rendering
+# -----------------------------
+def _input_key(tab_name: str) -> str:
+    return f"_flow_input::{tab_name}"
+
+
+def _pending_key(tab_name: str) -> str:
+    return f"_flow_pending::{tab_name}"
+
+
+def _job_key(tab_name: str) -> str:
+    return f"_flow_job::{tab_name}"
+
+
+def _capture_input(tab_name: str):
+    text = st.session_state.get(_input_key(tab_name))
+    if text:
+        st.session_state[_pending_key(tab_name)] = text
+
+
+def setup_session_state(flow: Flow):
+    if "messages" not in st.session_state:
+        st.session_state.messages = {}
+    if flow.tab_name not in st.session_state.messages:
+        log = MessageLog(compile_flow(flow).content, [{"role": "system", "content": flow.system_prompt}])
+        for record in restored_messages(flow.tab_name):
+            log.append_record(record)
+        st.session_state.messages[flow.tab_name] = log
+    for key, value in {flow.stage_key: min(flow.stages), **flow.state_defaults}.items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+
+def rerun_stats(state=None) -> dict:
+    """
+    Script runs and processed turns for a session (this one by default).
+
+    `waits` are full passes that found the tab's job still running and only
+    redrew it. The page polls a job from a fragment, which is not a script
+    pass, so waits stay near 0 in the browser; a client without fragments
+    (AppTest) polls with full reruns and counts them here. runs_per_turn
+    leaves them out: close to 1 for scripted turns and 2 for turns with a
+    job (the submit pass and the one that applies the result) is the goal.
+    """
+    state = st.session_state if state is None else state
+    stats = dict({"runs": 0, "turns": 0, "waits": 0}, **state.get("_flow_stats", {}))
+    turns = stats["turns"]
+    return dict(stats, runs_per_turn=round((stats["runs"] - stats["waits"]) / turns, 2) if turns else None,
+                waits_per_turn=round(stats["waits"] / turns, 2) if turns else None)
+
+
+def _start_job(compiled: CompiledFlow, client, text: str) -> JobTurn:
+    turn = JobTurn(compiled, client, st.session_state)
+    turn.job = get_job_executor().submit(lambda job: compiled.adispatch(turn, text), name=turn.tab_name)
+    st.session_state[_job_key(turn.tab_name)] = turn
+    get_session_memory().hold(st.session_state, turn.job)
+    if not JOBS_ENABLED:
+        try:
+            turn.job.wait()
+        except (Exception, asyncio.CancelledError):
+            pass  # reported by _finish_job
+    return turn
+
+
+def _cancel_other_jobs(tab_name: str):
+    """The trainee moved to another tab: stop the jobs of the others (what they said is kept)."""
+    for key in list(st.session_state.keys()):
+        if key.startswith("_flow_job::") and key != _job_key(tab_name):
+            st.session_state[key].job.cancel()
+
+
+def _render_turn_so_far(turn: JobTurn):
+    said, errors = list(turn.said), list(turn.errors)
+    for position, message in enumerate(said + [None]):
+        for error_position, error in errors:
+            if error_position == position:
+                st.error(error)
+        if message is not None and message["role"] != "system":
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def _job_progress(tab_name: str):
+    """What the tab's running job has said and is streaming; a full rerun takes over when it ends."""
+    turn = st.session_state.get(_job_key(tab_name))
+    if turn is None:
+        return
+    if turn.job.poll().done:
+        st.rerun()
+    _render_turn_so_far(turn)
+    live = turn.live
+    with st.chat_message("assistant"):
+        if live:
+            st.markdown(live + " ▌")
+        else:
+            st.caption("Zara is typing…")
+
+
+def _finish_job(tab_name: str):
+    """Hand a finished job's messages and state to the session and draw them."""
+    turn = st.session_state.pop(_job_key(tab_name))
+    turn.apply(st.session_state)
+    render_new(tab_name)
+    for _, error in turn.errors:
+        st.error(error)
+    if turn.job.state == "failed":
+        st.error(f"⚠️ Error: {turn.job.error}")
+    elif turn.job.state == "cancelled":
+        st.info("Zara's reply was stopped when you switched topics. Send your message again if you still need it.")
+
+
+def run_flow(flow: Flow, client):
+    """Render a tab and process at most one pending user turn, in one script pass.
+
+    A turn with a hook is handed to a background job; later passes poll it
+    and apply its outcome once it has ended.
+    """
+    started = time.perf_counter()
+    compiled = compile_flow(flow)
+    st.header(flow.header)
+    setup_session_state(flow)
+
+    stats = st.session_state.setdefault("_flow_stats", {"runs": 0, "turns": 0, "waits": 0})
+    stats["runs"] += 1
+
+    render_history(flow.tab_name)
+
+    messages = st.session_state.messages[flow.tab_name]
+    if len(messages) == 1 and flow.intro:
+        for content in flow.intro:
+            messages.append({"role": "assistant", "content": content})
+        if flow.intro_to is not None:
+            st.session_state[flow.stage_key] = flow.intro_to
+
+    _cancel_other_jobs(flow.tab_name)
+    turn = st.session_state.get(_job_key(flow.tab_name))
+    waiting = turn is not None
+    text = st.session_state.pop(_pending_key(flow.tab_name), None)
+    if text and turn is None:
+        stats["turns"] += 1
+        if compiled.needs_job(st.session_state[flow.stage_key], text):
+            turn = _start_job(compiled, client, text)
+        else:
+            compiled.dispatch(StreamlitTurn(compiled, client), text)
+    if turn is not None and turn.job.done:
+        _finish_job(flow.tab_name)
+        turn = None
+    if waiting and turn is not None:
+        stats["waits"] = stats.get("waits", 0) + 1
+    render_new(flow.tab_name)
+    sync_session(flow.tab_name, compiled.state_keys)
+
+    if turn is not None:
+        _job_progress(flow.tab_name)
+        st.chat_input("Zara is replying…", key=_input_key(flow.tab_name), disabled=True)
+    else:
+        stage, _ = compiled.lookup(st.session_state[flow.stage_key])
+        st.chat_input(stage.placeholder, key=_input_key(flow.tab_name),
+                      on_submit=_capture_input, args=(flow.tab_name,))
+    record_script_run(flow.tab_name, time.perf_counter() - started, turn=bool(text))
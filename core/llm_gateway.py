@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process-wide LLM gateway for the Zara app.
+
+Streamlit re-executes main.py on every interaction, so building an OpenAI
+client inside main() threw the keep-alive connection away on each rerun and
+paid a fresh TLS handshake per turn. The gateway is created once per process
+(see get_gateway) and keeps one pooled httpx client per provider that every
+session shares.
+
+Background LLM jobs (core/llm_jobs.py) run on an asyncio loop and use the
+asyncio SDK clients from async_client(), pooled the same way; their pool
+shows up as "<provider>-async" in the stats.
+"""
+
+import importlib.util
+import os
+import threading
+
+import httpx
+import streamlit as st
+
+
+# -----------------------------
+# CONNECTION POOL SETTINGS
+# -----------------------------
+# Sized for a few dozen concurrent trainee sessions per server process.
+MAX_CONNECTIONS = int(os.getenv("ZARA_LLM_MAX_CONNECTIONS", "64"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ZARA_LLM_MAX_KEEPALIVE", "32"))
+KEEPALIVE_EXPIRY = float(os.getenv("ZARA_LLM_KEEPALIVE_EXPIRY", "120"))
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 120.0
+
+# HTTP/2 lets concurrent sessions share one TLS connection; it needs the optional `h2` package.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+PROVIDERS = ("openai", "groq")
+
+
+class LLMGateway:
+    """Holds one pooled client per provider, created lazily on first use."""
+
+    def __init__(self, api_keys: dict):
+        self._api_keys = dict(api_keys)
+        self._clients = {}
+        self._http_clients = {}
+        self._request_counts = {}
+        self._lock = threading.Lock()
+
+    def _build_http_client(self, provider: str, asynchronous: bool = False):
+        name = f"{provider}-async" if asynchronous else provider
+        self._request_counts[name] = 0
+
+        def count_request(request):
+            with self._lock:
+                self._request_counts[name] += 1
+
+        async def acount_request(request):
+            count_request(request)
+
+        client_class = httpx.AsyncClient if asynchronous else httpx.Client
+        return client_class(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            event_hooks={"request": [acount_request if asynchronous else count_request]},
+        )
+
+    def client(self, provider: str = "openai"):
+        """Return the shared SDK client for `provider`, building it on first use."""
+        with self._lock:
+            if provider in self._clients:
+                return self._clients[provider]
+
+            api_key = self._api_keys.get(provider)
+            if not api_key:
+                raise ValueError(f"{provider} API key not found.")
+
+            http_client = self._build_http_client(provider)
+            # Retries are left to the router's call policy, which keeps them inside the call deadline.
+            if provider == "openai":
+                from openai import OpenAI
+                sdk_client = OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+            elif provider == "groq":
+                from groq import Groq
+                sdk_client = Groq(api_key=api_key, http_client=http_client, max_retries=0)
+            else:
+                http_client.close()
+                raise ValueError(f"Unknown LLM provider: {provider}")
+
+            self._http_clients[provider] = http_client
+            self._clients[provider] = sdk_client
+            return sdk_client
+
+    def async_client(self, provider: str = "openai"):
+        """The asyncio SDK client for `provider`; use it from one event loop only (the LLM job loop or the webhook channel's)."""
+        name = f"{provider}-async"
+        with self._lock:
+            if name in self._clients:
+                return self._clients[name]
+
+            api_key = self._api_keys.get(provider)
+            if not api_key:
+                raise ValueError(f"{provider} API key not found.")
+
+            http_client = self._build_http_client(provider, asynchronous=True)
+            if provider == "openai":
+                from openai import AsyncOpenAI
+                sdk_client = AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+            elif provider == "groq":
+                from groq import AsyncGroq
+                sdk_client = AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+            else:
+                raise ValueError(f"Unknown LLM provider: {provider}")
+
+            self._http_clients[name] = http_client
+            self._clients[name] = sdk_client
+            return sdk_client
+
+    def has_provider(self, provider: str) -> bool:
+        return bool(self._api_keys.get(provider))
+
+    def pool_stats(self) -> dict:
+        """Connection pool utilisation per provider that has been used so far."""
+        stats = {}
+        with self._lock:
+            http_clients = dict(self._http_clients)
+            request_counts = dict(self._request_counts)
+        for provider, http_client in http_clients.items():
+            # httpx does not expose its pool publicly; read httpcore's view defensively.
+            pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+            idle = sum(1 for conn in connections if _safe_call(conn, "is_idle"))
+            stats[provider] = {
+                "requests": request_counts.get(provider, 0),
+                "connections": len(connections),
+                "active": len(connections) - idle,
+                "idle": idle,
+                "max_connections": MAX_CONNECTIONS,
+                "utilisation": round((len(connections) - idle) / MAX_CONNECTIONS, 3),
+                "http2": HTTP2_AVAILABLE,
+            }
+        return stats
+
+    def close(self):
+        with self._lock:
+            for http_client in self._http_clients.values():
+                # Async pools belong to the job loop and are closed with it.
+                if isinstance(http_client, httpx.Client):
+                    http_client.close()
+            self._http_clients.clear()
+            self._clients.clear()
+
+
+def _safe_call(obj, method: str) -> bool:
+    try:
+        return bool(getattr(obj, method)())
+    except Exception:
+        return False
+
+
+# -----------------------------
+# Process-wide singleton
+# -----------------------------
+@st.cache_resource(show_spinner=False)
+def get_gateway(openai_key: str, groq_key: str = "") -> LLMGateway:
+    """One gateway per process (and per key set), shared by every session."""
+    return LLMGateway({"openai": openai_key, "groq": groq_key})
+
+
+def render_pool_stats(gateway: LLMGateway):
+    """Small diagnostics panel, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    with st.sidebar.expander("LLM connection pool"):
+        st.json(gateway.pool_stats())
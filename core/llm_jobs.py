@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background LLM jobs on one shared asyncio loop.
+
+Turns that call an LLM used to run the call inside the Streamlit script
+run: a reasoning model thinking for several seconds held that session's
+script thread, the page could not react, and under load the server's thread
+count grew with the number of calls in flight. Such turns are now submitted
+as jobs to an LLMJobExecutor:
+
+- one daemon thread runs an asyncio loop for the whole process; jobs are
+  coroutines whose LLM calls go through the router's asyncio path, so a
+  call in flight holds a socket, not a thread;
+- at most JOB_CONCURRENCY jobs run at once; the rest wait their turn;
+- the page polls a job from an st.fragment (core/flow_engine.py) and draws
+  its streamed text; each poll marks the job as watched;
+- job.cancel() stops it (the flow engine cancels a tab's job when the
+  trainee switches tabs), and a job nobody has polled for ABANDON_SECONDS
+  (browser closed) is cancelled by the loop itself.
+
+Set ZARA_LLM_JOBS=0 to run turns inside the script run again; they still go
+through the loop, but the script thread waits for them.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import os
+import threading
+import time
+
+import streamlit as st
+
+from core.telemetry import get_telemetry
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+JOBS_ENABLED = os.getenv("ZARA_LLM_JOBS", "1") != "0"
+JOB_CONCURRENCY = int(os.getenv("ZARA_LLM_JOB_CONCURRENCY", "32"))
+ABANDON_SECONDS = float(os.getenv("ZARA_LLM_JOB_ABANDON_SECONDS", "30"))
+POLL_SECONDS = float(os.getenv("ZARA_LLM_JOB_POLL_SECONDS", "0.25"))
+REAP_SECONDS = 5.0
+
+
+class LLMJob:
+    """One submitted coroutine: its state, result or error, and a way to cancel it."""
+
+    def __init__(self, job_id: int, name: str):
+        self.id = job_id
+        self.name = name
+        self.state = "queued"       # queued -> running -> done | failed | cancelled
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.last_polled = self.submitted
+        self._future = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def poll(self) -> "LLMJob":
+        """Mark the job as still watched by its page."""
+        self.last_polled = time.monotonic()
+        return self
+
+    def cancel(self):
+        if not self.done and self._future is not None:
+            self._future.cancel()
+
+    def wait(self):
+        """Block until the job ends, keeping it marked as watched; returns its result."""
+        while not self._future.done():
+            self.poll()
+            concurrent.futures.wait([self._future], timeout=REAP_SECONDS)
+        if self.state == "cancelled":
+            raise asyncio.CancelledError()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def __repr__(self) -> str:
+        return f"LLMJob({self.id}, {self.name!r}, {self.state})"
+
+
+class LLMJobExecutor:
+    """Runs LLM jobs on a private asyncio loop with bounded concurrency."""
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, abandon_seconds: float = ABANDON_SECONDS):
+        self.concurrency = concurrency
+        self.abandon_seconds = abandon_seconds
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._jobs = {}             # id -> LLMJob, until it ends
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "done": 0, "failed": 0, "cancelled": 0, "abandoned": 0, "peak_running": 0}
+        self._running = 0
+        self._thread = threading.Thread(target=self._run_loop, name="llm-jobs", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.create_task(self._reap())
+        self._loop.run_forever()
+
+    # -----------------------------
+    # Submitting
+    # -----------------------------
+    def submit(self, fn, name: str = "") -> LLMJob:
+        """Start `fn(job)`, a coroutine function, on the loop; returns at once."""
+        job = LLMJob(next(self._ids), name)
+        with self._lock:
+            self._jobs[job.id] = job
+            self.counters["submitted"] += 1
+        job._future = asyncio.run_coroutine_threadsafe(self._run_job(job, fn), self._loop)
+        # A job cancelled before the loop started it never reaches _run_job's cleanup.
+        job._future.add_done_callback(lambda future: future.cancelled() and self._finish(job, "cancelled"))
+        self._publish()
+        return job
+
+    async def _run_job(self, job: LLMJob, fn):
+        try:
+            async with self._semaphore:
+                job.state, job.started = "running", time.monotonic()
+                self._running += 1
+                self.counters["peak_running"] = max(self.counters["peak_running"], self._running)
+                self._publish()
+                try:
+                    job.result = await fn(job)
+                finally:
+                    self._running -= 1
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            job.error = e
+            self._finish(job, "failed")
+        else:
+            self._finish(job, "done")
+
+    def _finish(self, job: LLMJob, state: str):
+        with self._lock:
+            if self._jobs.pop(job.id, None) is None:
+                return
+            job.state, job.finished = state, time.monotonic()
+            self.counters[state] += 1
+        get_telemetry().metrics.inc("zara_llm_jobs_total", {"outcome": state})
+        self._publish()
+
+    async def _reap(self):
+        """Cancel jobs whose page stopped polling them."""
+        while True:
+            await asyncio.sleep(REAP_SECONDS)
+            now = time.monotonic()
+            with self._lock:
+                abandoned = [job for job in self._jobs.values() if now - job.last_polled > self.abandon_seconds]
+                self.counters["abandoned"] += len(abandoned)
+            for job in abandoned:
+                job.cancel()
+
+    # -----------------------------
+    # Reporting
+    # -----------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._jobs)
+            counters = dict(self.counters)
+        return dict(counters, running=self._running, queued=max(0, in_flight - self._running),
+                    concurrency=self.concurrency, threads=threading.active_count())
+
+    def _publish(self):
+        stats = self.stats()
+        metrics = get_telemetry().metrics
+        metrics.set("zara_llm_jobs", {"state": "running"}, stats["running"])
+        metrics.set("zara_llm_jobs", {"state": "queued"}, stats["queued"])
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_executor() -> LLMJobExecutor:
+    """One job loop per process, shared by every session."""
+    return LLMJobExecutor()
+
+
+def render_job_stats(executor: LLMJobExecutor):
+    """Job counters and thread count, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    with st.sidebar.expander("LLM jobs"):
+        st.json(executor.stats())
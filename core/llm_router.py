@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-call-type provider routing with failover.
+
+Every call used to go to OpenAI with the session's reasoning model,
+including the small {"feedback", "is_valid"} checks. Calls are now tagged
+with a route and the router picks provider and model per route:
+
+- validation  short JSON judgments      -> Groq, then a fast OpenAI model
+- summary     rolling context summaries -> Groq, then a fast OpenAI model
+- chat        free chat and answers     -> OpenAI (session model), then Groq
+- reflection  stage-closing reflections -> OpenAI (session model), then Groq
+
+A provider that errors, or is slower than the route's SLO, several times in
+a row is skipped for a cool-down period and the next one is used. Latency
+per route and provider (time to first chunk for streams) is kept for the
+diagnostics panel.
+
+Each call also follows the route's CallPolicy (core/call_policy.py):
+deadline, retries with backoff inside a shared retry budget, optional
+hedging and stream timeouts. Streams are opened up to their first chunk
+before create() returns, so a provider that fails before producing text is
+retried or failed over like a non-streamed call.
+
+Every call is recorded as an "llm" span (core/telemetry.py) with the
+provider and model that answered, retries, hedging, time to first token
+and token usage. OpenAI streams are asked to include usage; Groq reports it
+on the last chunk. Groq does not stream structured outputs (a json_schema
+response_format), so such calls are sent to it non-streamed and the whole
+answer comes back as a one-chunk stream.
+
+Call sites keep using `client.chat.completions.create(...)`; they bind a
+route with route_client(ctx.client, "validation"). Plain SDK clients (as
+used by the evaluation scripts) pass through unchanged.
+
+Flow hooks run as background jobs on an asyncio loop (core/llm_jobs.py)
+and bind a route with async_route_client() instead: the same policy,
+failover and spans, on the gateway's asyncio SDK clients, so an in-flight
+call holds no thread.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import httpx
+import streamlit as st
+
+from core.call_policy import (DEFAULT_POLICY, ROUTE_POLICIES, DeadlineExceeded, RetryBudget, StreamStalled,
+                              backoff_delay, is_retryable)
+from core.llm_gateway import CONNECT_TIMEOUT, get_gateway
+from core.telemetry import add_usage, finish_llm_span, llm_span, mark_first_token, submit_in_context
+
+
+# -----------------------------
+# Route table
+# -----------------------------
+# None means "the model the caller asked for" (the session's openai_model).
+GROQ_FAST_MODEL = os.getenv("ZARA_GROQ_FAST_MODEL", "openai/gpt-oss-20b")
+GROQ_CHAT_MODEL = os.getenv("ZARA_GROQ_CHAT_MODEL", "llama-3.3-70b-versatile")
+OPENAI_FAST_MODEL = os.getenv("ZARA_OPENAI_FAST_MODEL", "gpt-4.1-mini")
+
+ROUTES = {
+    "validation": (("groq", GROQ_FAST_MODEL), ("openai", OPENAI_FAST_MODEL)),
+    "summary": (("groq", GROQ_FAST_MODEL), ("openai", OPENAI_FAST_MODEL)),
+    "chat": (("openai", None), ("groq", GROQ_CHAT_MODEL)),
+    "reflection": (("openai", None), ("groq", GROQ_CHAT_MODEL)),
+}
+
+# Seconds to the full response (or first chunk, for streams) before a call counts as slow
+ROUTE_SLO = {"validation": 3.0, "summary": 10.0, "chat": 8.0, "reflection": 8.0}
+
+FAILURES_TO_TRIP = 3        # consecutive errors or slow calls before a provider is skipped
+COOLDOWN_SECONDS = 30.0
+LATENCY_WINDOW = 200        # samples kept per route and provider
+MIN_HEDGE_SAMPLES = 20      # below this the p95 is too noisy to hedge on; use the policy's floor x 2
+
+# Hedged requests run here so the session thread can wait on whichever answers first.
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+
+@dataclass
+class _Health:
+    strikes: int = 0
+    skip_until: float = 0.0
+
+
+class _RouteStats:
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.slow = 0
+        self.failovers = 0
+        self.retries = 0
+        self.hedges = 0
+        self.stalled = 0
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 3) if ordered else None
+
+        return {"calls": self.calls, "errors": self.errors, "slow": self.slow, "failovers": self.failovers,
+                "retries": self.retries, "hedges": self.hedges, "stalled": self.stalled,
+                "p50": pct(0.50), "p95": pct(0.95)}
+
+    def p95(self):
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95)] if len(ordered) >= MIN_HEDGE_SAMPLES else None
+
+
+class LLMRouter:
+    """Picks provider and model per route and fails over between providers."""
+
+    def __init__(self, gateway, routes: dict = ROUTES, slo: dict = ROUTE_SLO, policies: dict = ROUTE_POLICIES):
+        self.gateway = gateway
+        self.routes = routes
+        self.slo = slo
+        self.policies = policies
+        self.budget = RetryBudget()
+        self._health = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        # Used as a plain client, the router serves the chat route.
+        self.chat = self.route("chat").chat
+
+    def route(self, name: str):
+        """A client-like object whose chat.completions.create() goes through `name`.
+
+        Its models(model) names the providers and models that may answer, for cache keys.
+        """
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: self.create(name, **kwargs)
+        )), models=lambda model: self.route_models(name, model))
+
+    def route_async(self, name: str):
+        """Like route(), but create() is a coroutine, as on an AsyncOpenAI client."""
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: self.acreate(name, **kwargs)
+        )), models=lambda model: self.route_models(name, model))
+
+    def route_models(self, name: str, model: str) -> str:
+        """The route's providers and models, in order, with `model` standing in for "the caller's model"."""
+        return "|".join(f"{provider}:{routed or model}" for provider, routed in self.routes[name])
+
+    # -----------------------------
+    # Health and stats
+    # -----------------------------
+    def _candidates(self, route: str) -> list:
+        available = [(p, m) for p, m in self.routes[route] if self.gateway.has_provider(p)]
+        now = time.monotonic()
+        with self._lock:
+            healthy = [c for c in available if self._health.get((route, c[0]), _Health()).skip_until <= now]
+        # If every provider is cooling down, try them all rather than fail outright.
+        return healthy or available
+
+    def _record(self, route: str, provider: str, seconds: float = None, error: bool = False, failover: bool = False):
+        with self._lock:
+            stats = self._stats.setdefault((route, provider), _RouteStats())
+            health = self._health.setdefault((route, provider), _Health())
+            stats.calls += 1
+            if failover:
+                stats.failovers += 1
+            slow = seconds is not None and seconds > self.slo.get(route, float("inf"))
+            if error:
+                stats.errors += 1
+            else:
+                stats.latencies.append(seconds)
+                stats.slow += slow
+            if error or slow:
+                health.strikes += 1
+                if health.strikes >= FAILURES_TO_TRIP:
+                    health.skip_until = time.monotonic() + COOLDOWN_SECONDS
+                    health.strikes = 0
+            else:
+                health.strikes = 0
+
+    def _count(self, route: str, provider: str, field: str):
+        with self._lock:
+            stats = self._stats.setdefault((route, provider), _RouteStats())
+            setattr(stats, field, getattr(stats, field) + 1)
+
+    def _hedge_delay(self, route: str, provider: str, policy) -> float:
+        with self._lock:
+            stats = self._stats.get((route, provider))
+            p95 = stats.p95() if stats else None
+        return max(policy.hedge_min_delay, p95) if p95 is not None else policy.hedge_min_delay * 2
+
+    def expected_latency(self, route: str):
+        """Recent p95 (seconds to the response, or first chunk) of the provider a call on `route` would go to first; None until known."""
+        candidates = self._candidates(route)
+        if not candidates:
+            return None
+        with self._lock:
+            stats = self._stats.get((route, candidates[0][0]))
+            return stats.p95() if stats else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {f"{route}/{provider}": s.snapshot() for (route, provider), s in sorted(self._stats.items())}
+        stats["retry_budget"] = self.budget.stats()
+        return stats
+
+    # -----------------------------
+    # Calls
+    # -----------------------------
+    def _open(self, route: str, provider: str, model, kwargs: dict, deadline: float, policy, failover: bool):
+        """One request. Streams are read up to their first chunk: returns (response, first_chunk_or_None)."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{route}: deadline passed before calling {provider}")
+        streaming = bool(kwargs.get("stream"))
+        whole = streaming and _unstreamable(provider, kwargs)
+        timeout = httpx.Timeout(remaining, connect=min(CONNECT_TIMEOUT, remaining),
+                                read=min(policy.stream_idle, remaining) if streaming and not whole else remaining)
+        started = time.perf_counter()
+        try:
+            response = self.gateway.client(provider).chat.completions.create(
+                **_provider_kwargs(provider, dict(kwargs, model=model or kwargs.get("model"), timeout=timeout,
+                                                  stream=streaming and not whole))
+            )
+            if whole:
+                response = iter([_as_chunk(response)])
+            first = next(iter(response), None) if streaming else None
+        except Exception:
+            self._record(route, provider, error=True, failover=failover)
+            raise
+        self._record(route, provider, time.perf_counter() - started, failover=failover)
+        return response, first
+
+    def _attempt(self, route: str, provider: str, model, kwargs: dict, deadline: float, policy, failover: bool,
+                 span: dict):
+        """_open(), plus a hedged duplicate when the first request is slower than the provider's p95."""
+        def call():
+            return self._open(route, provider, model, kwargs, deadline, policy, failover)
+
+        delay = self._hedge_delay(route, provider, policy) if policy.hedge else None
+        if delay is None or delay >= deadline - time.monotonic():
+            return call()
+
+        futures = [submit_in_context(_hedge_executor, call)]
+        done, _ = wait(futures, timeout=delay)
+        if not done and self.budget.withdraw():
+            self._count(route, provider, "hedges")
+            span["hedged"] = True
+            futures.append(submit_in_context(_hedge_executor, call))
+
+        error, pending = None, set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.add_done_callback(_close_quietly)
+                    return future.result()
+                error = future.exception()
+        for loser in pending:
+            loser.add_done_callback(_close_quietly)
+        raise error or DeadlineExceeded(f"{route}: no answer from {provider} within the deadline")
+
+    def _guarded_stream(self, route: str, provider: str, response, first, policy, started: float, span: dict):
+        """
+        Yield the stream. If it stalls (policy.stream_idle) or runs past
+        policy.stream_deadline, counted from the start of the call, it raises
+        StreamStalled: the text read so far is incomplete.
+        """
+        stream_deadline = started + policy.stream_deadline if policy.stream_deadline else None
+        outcome, error = "ok", None
+        try:
+            if first is not None:
+                yield first
+            for chunk in response:
+                add_usage(span, _chunk_usage(chunk))
+                yield chunk
+                if stream_deadline is not None and time.monotonic() > stream_deadline:
+                    raise StreamStalled(f"{route}: stream from {provider} ran past its deadline")
+        except Exception as e:
+            outcome, error = "error", e
+            if not is_retryable(e):
+                raise
+            # Not retried: text has been shown. The reader decides what to do with a partial answer.
+            outcome = "stalled"
+            self._count(route, provider, "stalled")
+            if isinstance(e, StreamStalled):
+                raise
+            raise StreamStalled(f"{route}: stream from {provider} stopped before it finished ({type(e).__name__})") from e
+        finally:
+            _close_quietly(response)
+            finish_llm_span(span, outcome, error)
+
+    def _begin(self, route: str):
+        """(policy, candidates, started, deadline, span) for a new call on `route`."""
+        policy = self.policies.get(route, DEFAULT_POLICY)
+        candidates = self._candidates(route)
+        if not candidates:
+            raise ValueError(f"No provider configured for route '{route}'.")
+        self.budget.deposit()
+        started = time.monotonic()
+        return policy, candidates, started, started + policy.deadline, llm_span(route)
+
+    @staticmethod
+    def _give_up(route: str, policy, deadline: float, span: dict, last_error):
+        if last_error is None or time.monotonic() >= deadline:
+            error = DeadlineExceeded(f"{route}: no answer within {policy.deadline:g}s")
+            finish_llm_span(span, "timeout", error)
+            raise error from last_error
+        finish_llm_span(span, "error", last_error)
+        raise last_error
+
+    def create(self, route: str, **kwargs):
+        """chat.completions.create under the route's policy: deadline, retries, failover, hedging."""
+        policy, candidates, started, deadline, span = self._begin(route)
+
+        queue, tried, attempts, retries, last_error = list(candidates), set(), 0, 0, None
+        while queue and attempts < policy.max_attempts:
+            provider, model = queue.pop(0)
+            if provider in tried:
+                # Retrying a provider that already failed: back off first, within the deadline and budget.
+                if not self.budget.withdraw():
+                    break
+                self._count(route, provider, "retries")
+                time.sleep(min(backoff_delay(policy, retries), max(0.0, deadline - time.monotonic())))
+                retries += 1
+            attempts += 1
+            span.update(provider=provider, model=model or kwargs.get("model"), retries=retries)
+            try:
+                response, first = self._attempt(route, provider, model, kwargs, deadline, policy,
+                                               failover=provider != candidates[0][0], span=span)
+            except Exception as e:
+                last_error = e
+                tried.add(provider)
+                if is_retryable(e):
+                    queue.append((provider, model))
+                if time.monotonic() >= deadline:
+                    break
+                continue
+            if kwargs.get("stream"):
+                mark_first_token(span)
+                add_usage(span, _chunk_usage(first))
+                return self._guarded_stream(route, provider, response, first, policy, started, span)
+            add_usage(span, getattr(response, "usage", None))
+            finish_llm_span(span, "ok")
+            return response
+
+        self._give_up(route, policy, deadline, span, last_error)
+
+    # -----------------------------
+    # Calls on the asyncio loop
+    # -----------------------------
+    async def _aopen(self, route: str, provider: str, model, kwargs: dict, deadline: float, policy, failover: bool):
+        """_open() on the provider's asyncio client."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{route}: deadline passed before calling {provider}")
+        streaming = bool(kwargs.get("stream"))
+        whole = streaming and _unstreamable(provider, kwargs)
+        timeout = httpx.Timeout(remaining, connect=min(CONNECT_TIMEOUT, remaining),
+                                read=min(policy.stream_idle, remaining) if streaming and not whole else remaining)
+        started = time.perf_counter()
+        try:
+            response = await self.gateway.async_client(provider).chat.completions.create(
+                **_provider_kwargs(provider, dict(kwargs, model=model or kwargs.get("model"), timeout=timeout,
+                                                  stream=streaming and not whole))
+            )
+            if whole:
+                response = _aiter_once(_as_chunk(response))
+            first = await anext(aiter(response), None) if streaming else None
+        except Exception:
+            self._record(route, provider, error=True, failover=failover)
+            raise
+        self._record(route, provider, time.perf_counter() - started, failover=failover)
+        return response, first
+
+    async def _aattempt(self, route: str, provider: str, model, kwargs: dict, deadline: float, policy,
+                        failover: bool, span: dict):
+        """_attempt() with tasks instead of threads; losing and abandoned requests are cancelled."""
+        def call():
+            return asyncio.ensure_future(self._aopen(route, provider, model, kwargs, deadline, policy, failover))
+
+        delay = self._hedge_delay(route, provider, policy) if policy.hedge else None
+        if delay is None or delay >= deadline - time.monotonic():
+            return await self._aopen(route, provider, model, kwargs, deadline, policy, failover)
+
+        tasks, winner = [call()], None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self.budget.withdraw():
+                self._count(route, provider, "hedges")
+                span["hedged"] = True
+                tasks.append(call())
+
+            error, pending = None, set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+                    error = task.exception()
+            raise error or DeadlineExceeded(f"{route}: no answer from {provider} within the deadline")
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(_aclose_loser)
+
+    async def _aguarded_stream(self, route: str, provider: str, response, first, policy, started: float, span: dict):
+        """_guarded_stream() as an async generator."""
+        stream_deadline = started + policy.stream_deadline if policy.stream_deadline else None
+        outcome, error = "ok", None
+        try:
+            if first is not None:
+                yield first
+            async for chunk in response:
+                add_usage(span, _chunk_usage(chunk))
+                yield chunk
+                if stream_deadline is not None and time.monotonic() > stream_deadline:
+                    raise StreamStalled(f"{route}: stream from {provider} ran past its deadline")
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome, error = "error", e
+            if not is_retryable(e):
+                raise
+            outcome = "stalled"
+            self._count(route, provider, "stalled")
+            if isinstance(e, StreamStalled):
+                raise
+            raise StreamStalled(f"{route}: stream from {provider} stopped before it finished ({type(e).__name__})") from e
+        finally:
+            await _aclose_quietly(response)
+            finish_llm_span(span, outcome, error)
+
+    async def acreate(self, route: str, **kwargs):
+        """create() for the asyncio loop; streams come back as async iterators."""
+        policy, candidates, started, deadline, span = self._begin(route)
+
+        queue, tried, attempts, retries, last_error = list(candidates), set(), 0, 0, None
+        try:
+            while queue and attempts < policy.max_attempts:
+                provider, model = queue.pop(0)
+                if provider in tried:
+                    if not self.budget.withdraw():
+                        break
+                    self._count(route, provider, "retries")
+                    await asyncio.sleep(min(backoff_delay(policy, retries), max(0.0, deadline - time.monotonic())))
+                    retries += 1
+                attempts += 1
+                span.update(provider=provider, model=model or kwargs.get("model"), retries=retries)
+                try:
+                    response, first = await self._aattempt(route, provider, model, kwargs, deadline, policy,
+                                                           failover=provider != candidates[0][0], span=span)
+                except Exception as e:
+                    last_error = e
+                    tried.add(provider)
+                    if is_retryable(e):
+                        queue.append((provider, model))
+                    if time.monotonic() >= deadline:
+                        break
+                    continue
+                if kwargs.get("stream"):
+                    mark_first_token(span)
+                    add_usage(span, _chunk_usage(first))
+                    return self._aguarded_stream(route, provider, response, first, policy, started, span)
+                add_usage(span, getattr(response, "usage", None))
+                finish_llm_span(span, "ok")
+                return response
+        except asyncio.CancelledError:
+            finish_llm_span(span, "cancelled")
+            raise
+
+        self._give_up(route, policy, deadline, span, last_error)
+
+
+def _provider_kwargs(provider: str, kwargs: dict) -> dict:
+    """Ask OpenAI streams for usage; the Groq SDK has no stream_options and sends usage anyway."""
+    if provider == "groq":
+        kwargs.pop("stream_options", None)
+    elif kwargs.get("stream") and "stream_options" not in kwargs:
+        kwargs["stream_options"] = {"include_usage": True}
+    return kwargs
+
+
+def _unstreamable(provider: str, kwargs: dict) -> bool:
+    """Groq serves structured outputs (a json_schema response_format) only as whole, non-streamed responses."""
+    return provider == "groq" and (kwargs.get("response_format") or {}).get("type") == "json_schema"
+
+
+def _as_chunk(response):
+    """A non-streamed completion as the single chunk of a stream, for callers that asked for one."""
+    choice = response.choices[0]
+    delta = SimpleNamespace(role="assistant", content=choice.message.content)
+    return SimpleNamespace(id=response.id, model=response.model, usage=getattr(response, "usage", None),
+                           choices=[SimpleNamespace(index=0, delta=delta, finish_reason=choice.finish_reason)])
+
+
+async def _aiter_once(chunk):
+    yield chunk
+
+
+def _chunk_usage(chunk):
+    """Usage carried by a stream chunk: OpenAI's `usage`, or Groq's `x_groq.usage`."""
+    if chunk is None:
+        return None
+    return getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+
+
+def _close_quietly(target):
+    """Close a losing or finished stream response (or a future holding one)."""
+    try:
+        if hasattr(target, "result"):
+            target = target.result()[0]
+        close = getattr(target, "close", None)
+        if close is not None:
+            close()
+    except Exception:
+        pass
+
+
+async def _aclose_quietly(response):
+    try:
+        close = getattr(response, "close", None)
+        if close is not None:
+            await close()
+    except Exception:
+        pass
+
+
+def _aclose_loser(task):
+    """Close the stream of a hedged request that answered but lost (or was no longer wanted)."""
+    if task.cancelled() or task.exception() is not None:
+        return
+    response, first = task.result()
+    if first is not None:  # streams only; a finished non-streamed response holds nothing open
+        asyncio.ensure_future(_aclose_quietly(response))
+
+
+def route_client(client, route: str):
+    """`client` bound to `route` when it is a router; plain SDK clients are returned unchanged."""
+    return client.route(route) if isinstance(client, LLMRouter) else client
+
+
+def async_route_client(client, route: str):
+    """route_client() for the asyncio loop; plain asyncio SDK clients are returned unchanged."""
+    return client.route_async(route) if isinstance(client, LLMRouter) else client
+
+
+@st.cache_resource(show_spinner=False)
+def get_router(openai_key: str, groq_key: str = "") -> LLMRouter:
+    """One router per gateway, so health and latency stats are shared by every session."""
+    return LLMRouter(get_gateway(openai_key, groq_key))
+
+
+def render_route_stats(router: LLMRouter):
+    """Per-route latency panel, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    with st.sidebar.expander("LLM routes"):
+        st.json(router.stats())
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Where the app keeps files it writes at runtime.
+
+Caches, session stores, snapshots and traces all live under CACHE_DIR
+(ZARA_CACHE_DIR, .cache/ in the repo by default); modules import it from
+here instead of each working it out again.
+"""
+
+import os
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("ZARA_CACHE_DIR", os.path.join(REPO_ROOT, ".cache"))
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bounded transcript memory across sessions.
+
+Streamlit keeps every open session's state in process memory until the
+browser goes away, so hundreds of idle trainees during a campaign add up
+with nothing bounding the total. The SessionMemoryManager tracks the tab
+transcripts (st.session_state.messages) of every session and spills idle
+ones to compressed snapshots on disk:
+
+- each script run (and each fragment run that reads the transcript) is
+  wrapped in running(): it enters the session, rehydrating it if it was
+  evicted, and leaves it afterwards, when its footprint is measured;
+- on leave, sessions idle for longer than IDLE_SECONDS are evicted, and
+  while the resident total is over MEMORY_BUDGET the least recently used
+  idle sessions are evicted as well;
+- a session that is running, or whose background LLM job (core/llm_jobs.py)
+  has not ended, is never evicted;
+- snapshots are compressed and written outside the manager's lock, which
+  every run of every session takes on enter and leave; a session that
+  comes back while its snapshot is being written simply stays resident.
+
+A snapshot holds each transcript's MessageLog records (scripted messages as
+content-pack references) as zlib-compressed JSON. Sessions are held through
+weak references, so a closed browser session simply drops out and its
+snapshot is deleted.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from collections import OrderedDict
+
+import streamlit as st
+
+from core.content_pack import MessageLog
+from core.paths import CACHE_DIR
+from core.telemetry import get_telemetry
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "session_snapshots")
+MEMORY_BUDGET = int(float(os.getenv("ZARA_SESSION_MEMORY_MB", "256")) * 1024 * 1024)
+IDLE_SECONDS = float(os.getenv("ZARA_SESSION_IDLE_SECONDS", "900"))
+
+_KEY = "_memory_key"
+
+
+class TabTranscripts(dict):
+    """st.session_state.messages: tab name -> MessageLog. A dict subclass so it can be weakly referenced."""
+
+
+def _footprint(transcripts: dict) -> int:
+    total = 0
+    for log in transcripts.values():
+        if isinstance(log, MessageLog):
+            total += log.nbytes()
+        else:
+            total += sum(len(m.get("content") or "") for m in log)
+    return total
+
+
+class _Entry:
+    __slots__ = ("ref", "last_seen", "bytes", "active", "evicted", "evicting", "packs", "jobs")
+
+    def __init__(self, transcripts: TabTranscripts):
+        self.ref = weakref.ref(transcripts)
+        self.last_seen = time.monotonic()
+        self.bytes = 0
+        self.active = 0
+        self.evicted = False
+        self.evicting = False
+        self.packs = {}
+        self.jobs = []   # background jobs that keep the session resident until they end
+
+
+class SessionMemoryManager:
+    """LRU of session transcripts with a global byte budget and disk snapshots."""
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR, budget: int = MEMORY_BUDGET, idle_seconds: float = IDLE_SECONDS):
+        self.snapshot_dir = snapshot_dir
+        self.budget = budget
+        self.idle_seconds = idle_seconds
+        self._entries = OrderedDict()   # key -> _Entry, least recently used first
+        self._resident_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"evictions": 0, "rehydrations": 0, "evicted_bytes": 0, "snapshot_bytes": 0, "dropped": 0,
+                         "lost": 0}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{key}.json.z")
+
+    # -----------------------------
+    # Script-run bracket
+    # -----------------------------
+    def enter(self, state) -> TabTranscripts:
+        """Mark the session as running and make sure its transcripts are in memory."""
+        transcripts = state.get("messages")
+        if not isinstance(transcripts, TabTranscripts):
+            transcripts = TabTranscripts(transcripts or {})
+            state["messages"] = transcripts
+        key = state.get(_KEY)
+        if key is None:
+            key = state[_KEY] = uuid.uuid4().hex
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.ref() is not transcripts:
+                entry = self._entries[key] = _Entry(transcripts)
+            self._entries.move_to_end(key)
+            entry.active += 1
+            entry.last_seen = time.monotonic()
+            if entry.evicted:
+                self._rehydrate(key, entry, transcripts)
+        return transcripts
+
+    def leave(self, state):
+        """The run is over: measure the session, then evict what the budget and idle limit call for."""
+        key = state.get(_KEY)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.active = max(0, entry.active - 1)
+            entry.last_seen = time.monotonic()
+            transcripts = entry.ref()
+            if transcripts is not None and not entry.evicted:
+                self._resident_bytes += _footprint(transcripts) - entry.bytes
+                entry.bytes = _footprint(transcripts)
+            victims = self._sweep()
+        for key, entry, last_seen in victims:
+            self._evict(key, entry, last_seen)
+        self._publish()
+
+    def hold(self, state, job):
+        """Keep the session resident until `job` (an LLMJob) is done, e.g. so its turn is applied in memory."""
+        with self._lock:
+            entry = self._entries.get(state.get(_KEY))
+            if entry is not None:
+                entry.jobs.append(job)
+
+    @contextlib.contextmanager
+    def running(self, state):
+        """enter() ... leave() around a script or fragment run."""
+        transcripts = self.enter(state)
+        try:
+            yield transcripts
+        finally:
+            self.leave(state)
+
+    # -----------------------------
+    # Eviction
+    # -----------------------------
+    def _sweep(self) -> list:
+        """Pick the sessions to evict (under the lock); returns [(key, entry, last_seen)] for _evict()."""
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.ref() is None:
+                self._drop(key, entry)
+        victims, resident = [], self._resident_bytes
+        for key, entry in list(self._entries.items()):
+            idle = now - entry.last_seen
+            over_budget = resident > self.budget
+            if not over_budget and idle < self.idle_seconds:
+                break  # ordered by last use: everything after this is more recent
+            entry.jobs = [job for job in entry.jobs if not job.done]
+            if entry.active or entry.evicted or entry.evicting or entry.jobs:
+                continue
+            entry.evicting = True
+            victims.append((key, entry, entry.last_seen))
+            resident -= entry.bytes
+        return victims
+
+    def _evict(self, key: str, entry: _Entry, last_seen: float):
+        """Snapshot a session picked by _sweep() without holding the lock, then commit unless it came back meanwhile."""
+        transcripts = entry.ref()
+        path = self._path(key)
+        payload = None
+        try:
+            if transcripts is not None:
+                snapshot, packs = {}, {}
+                for tab, log in list(transcripts.items()):
+                    if isinstance(log, MessageLog):
+                        snapshot[tab] = [log.record(i) for i in range(len(log))]
+                        packs[tab] = log.pack
+                    else:
+                        snapshot[tab] = list(log)
+                payload = zlib.compress(json.dumps(snapshot).encode("utf-8"), 6)
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(payload)
+                os.replace(path + ".tmp", path)
+        finally:
+            with self._lock:
+                entry.evicting = False
+                committed = payload is not None and not entry.active and entry.last_seen == last_seen
+                if committed:
+                    self._commit_eviction(entry, transcripts, packs, len(payload))
+        if payload is not None and not committed:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+        if committed:
+            get_telemetry().metrics.inc("zara_session_evictions_total", {})
+
+    def _commit_eviction(self, entry: _Entry, transcripts: TabTranscripts, packs: dict, snapshot_bytes: int):
+        transcripts.clear()
+        entry.packs = packs
+        entry.evicted = True
+        self._resident_bytes -= entry.bytes
+        self.counters["evictions"] += 1
+        self.counters["evicted_bytes"] += entry.bytes
+        self.counters["snapshot_bytes"] += snapshot_bytes
+        entry.bytes = 0
+
+    def _rehydrate(self, key: str, entry: _Entry, transcripts: TabTranscripts):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            snapshot = json.loads(zlib.decompress(payload))
+        except (OSError, ValueError, zlib.error):
+            # Snapshot lost (e.g. the cache dir was wiped): the tabs start over rather than fail.
+            entry.evicted = False
+            entry.packs = {}
+            self.counters["lost"] += 1
+            return
+        for tab, records in snapshot.items():
+            pack = entry.packs.get(tab)
+            if pack is None:
+                transcripts[tab] = records
+                continue
+            log = MessageLog(pack)
+            for record in records:
+                log.append_record(record)
+            transcripts[tab] = log
+        os.remove(path)
+        entry.evicted = False
+        entry.packs = {}
+        entry.bytes = _footprint(transcripts)
+        self._resident_bytes += entry.bytes
+        self.counters["rehydrations"] += 1
+        self.counters["snapshot_bytes"] -= len(payload)
+        get_telemetry().metrics.inc("zara_session_rehydrations_total", {})
+
+    def _drop(self, key: str, entry: _Entry):
+        """Forget a session Streamlit has discarded."""
+        del self._entries[key]
+        if entry.evicted:
+            try:
+                self.counters["snapshot_bytes"] -= os.path.getsize(self._path(key))
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        else:
+            self._resident_bytes -= entry.bytes
+        self.counters["dropped"] += 1
+
+    # -----------------------------
+    # Reporting
+    # -----------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            evicted = sum(entry.evicted for entry in self._entries.values())
+            return dict(self.counters, sessions=len(self._entries), evicted=evicted,
+                        resident=len(self._entries) - evicted, resident_bytes=self._resident_bytes, budget=self.budget)
+
+    def _publish(self):
+        stats = self.stats()
+        metrics = get_telemetry().metrics
+        metrics.set("zara_session_resident_bytes", {}, stats["resident_bytes"])
+        metrics.set("zara_sessions", {"state": "resident"}, stats["resident"])
+        metrics.set("zara_sessions", {"state": "evicted"}, stats["evicted"])
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_memory() -> SessionMemoryManager:
+    return SessionMemoryManager()
+
+
+def render_session_memory_stats(manager: SessionMemoryManager):
+    """Eviction and rehydration counters, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    with st.sidebar.expander("Session memory"):
+        st.json(manager.stats())
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Durable, resumable conversation state.
+
+Messages and flow state (stages, stored answers, retry flags) used to live
+only in st.session_state, so a restart or a dropped websocket sent the
+trainee back to the start. Each session now has a token, kept in the page
+URL as ?session=<token>; the flow engine hands every new message and every
+changed state key to the store, and a session opened with a known token is
+restored before the tabs render. Scripted messages are stored as references
+into the flow's content pack (core/content_pack.py), not as text.
+
+Writes go through WriteBehindStore: the script thread only enqueues, and a
+background thread writes batches (up to MAX_BATCH operations or
+BATCH_DELAY seconds) in one transaction each.
+
+Backends, chosen with ZARA_SESSION_STORE:
+- unset               SQLite file in the cache dir (one host, any number of processes);
+- http://host:port    a shared session server, e.g. `python -m core.session_store --port 8099`,
+                      which stands in for a shared database when several replicas serve the app;
+- off                 no persistence.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import queue
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import streamlit as st
+
+from core.content_pack import MessageLog
+from core.paths import CACHE_DIR
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+STORE_PATH = os.path.join(CACHE_DIR, "sessions.sqlite3")
+STORE_SETTING = os.getenv("ZARA_SESSION_STORE", "")
+
+MAX_BATCH = 500            # operations per transaction
+BATCH_DELAY = 0.05         # seconds to wait for more operations before writing a batch
+RETRY_DELAY = 1.0          # seconds before a failed batch is retried
+
+TOKEN_PARAM = "session"
+TOKEN_PATTERN = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+_TOKEN_KEY = "_session_token"
+_SYNCED_KEY = "_session_synced"
+_RESTORED_KEY = "_session_restored_messages"
+_MISSING = object()
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+class SQLiteSessionStore:
+    """Messages and state keys per session token in one SQLite file."""
+
+    def __init__(self, path: str = STORE_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, created REAL NOT NULL, last_seen REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS session_messages ("
+            " token TEXT NOT NULL, tab TEXT NOT NULL, seq INTEGER NOT NULL, body TEXT NOT NULL,"
+            " PRIMARY KEY (token, tab, seq));"
+            "CREATE TABLE IF NOT EXISTS session_state ("
+            " token TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (token, key));"
+        )
+        self._lock = threading.Lock()
+
+    def write(self, ops: list):
+        """Apply a batch of operations in one transaction."""
+        messages = [(op["token"], op["tab"], op["seq"], json.dumps(op["message"])) for op in ops if op["op"] == "message"]
+        state = [(op["token"], op["key"], json.dumps(op["value"])) for op in ops if op["op"] == "state"]
+        now = time.time()
+        tokens = [(token, now, now) for token in {op["token"] for op in ops}]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO sessions (token, created, last_seen) VALUES (?, ?, ?) "
+                    "ON CONFLICT(token) DO UPDATE SET last_seen = excluded.last_seen", tokens)
+                self._conn.executemany("INSERT OR REPLACE INTO session_messages VALUES (?, ?, ?, ?)", messages)
+                self._conn.executemany("INSERT OR REPLACE INTO session_state VALUES (?, ?, ?)", state)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, token: str):
+        """{"messages": {tab: [message, ...]}, "state": {key: value}} or None for an unknown token."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM sessions WHERE token = ?", (token,)).fetchone() is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT tab, body FROM session_messages WHERE token = ? ORDER BY tab, seq", (token,)).fetchall()
+            state = self._conn.execute("SELECT key, value FROM session_state WHERE token = ?", (token,)).fetchall()
+        messages = {}
+        for tab, body in rows:
+            messages.setdefault(tab, []).append(json.loads(body))
+        return {"messages": messages, "state": {key: json.loads(value) for key, value in state}}
+
+    def stats(self) -> dict:
+        with self._lock:
+            (sessions,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            (messages,) = self._conn.execute("SELECT COUNT(*) FROM session_messages").fetchone()
+        return {"sessions": sessions, "messages": messages}
+
+
+class HTTPSessionStore:
+    """Client for serve_session_store(); the same interface as SQLiteSessionStore."""
+
+    def __init__(self, base_url: str, timeout: float = 10.0):
+        self._http = httpx.Client(base_url=base_url.rstrip("/"), timeout=timeout)
+
+    def write(self, ops: list):
+        self._http.post("/ops", json={"ops": ops}).raise_for_status()
+
+    def load(self, token: str):
+        response = self._http.get(f"/sessions/{token}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    def stats(self) -> dict:
+        response = self._http.get("/stats")
+        response.raise_for_status()
+        return response.json()
+
+
+# -----------------------------
+# Write-behind queue
+# -----------------------------
+class WriteBehindStore:
+    """Queues writes for a backend and applies them in batches on a background thread."""
+
+    def __init__(self, backend, max_batch: int = MAX_BATCH, batch_delay: float = BATCH_DELAY):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self._queue = queue.Queue()
+        self._retry = []
+        self.counters = {"queued": 0, "written": 0, "batches": 0, "errors": 0}
+        self.last_batch_ms = None
+        self._thread = threading.Thread(target=self._run, name="session-store", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def append_message(self, token: str, tab: str, seq: int, message: dict):
+        self._put({"op": "message", "token": token, "tab": tab, "seq": seq, "message": message})
+
+    def set_state(self, token: str, key: str, value):
+        self._put({"op": "state", "token": token, "key": key, "value": value})
+
+    def _put(self, op: dict):
+        self.counters["queued"] += 1
+        self._queue.put(op)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued so far is written (or `timeout` passes)."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def load(self, token: str):
+        self.flush()  # a reconnect must see what the previous connection queued
+        return self.backend.load(token)
+
+    def stats(self) -> dict:
+        return dict(self.counters, pending=self._queue.qsize() + len(self._retry), last_batch_ms=self.last_batch_ms)
+
+    def _next_batch(self):
+        """(operations, flush events) - waits for the first item, then up to batch_delay for more."""
+        ops, events = self._retry, []
+        self._retry = []
+        if not ops:
+            first = self._queue.get()
+            if isinstance(first, threading.Event):
+                return ops, [first]
+            ops = [first]
+        deadline = time.monotonic() + self.batch_delay
+        while len(ops) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                events.append(item)
+                break
+            ops.append(item)
+        return ops, events
+
+    def _run(self):
+        while True:
+            ops, events = self._next_batch()
+            if ops:
+                started = time.perf_counter()
+                try:
+                    self.backend.write(ops)
+                    self.counters["written"] += len(ops)
+                    self.counters["batches"] += 1
+                    self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+                except Exception:
+                    # Keep the batch (later writes stay queued behind it) and try again.
+                    self.counters["errors"] += 1
+                    self._retry = ops
+                    # Let flush() callers go rather than hold them while the backend is down.
+                    for event in events:
+                        event.set()
+                    time.sleep(RETRY_DELAY)
+                    continue
+            for event in events:
+                event.set()
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_store():
+    """The process-wide store, or None when ZARA_SESSION_STORE=off."""
+    if STORE_SETTING == "off":
+        return None
+    if STORE_SETTING.startswith(("http://", "https://")):
+        return WriteBehindStore(HTTPSessionStore(STORE_SETTING))
+    return WriteBehindStore(SQLiteSessionStore(STORE_SETTING or STORE_PATH))
+
+
+# -----------------------------
+# Streamlit session binding
+# -----------------------------
+def resume_session(store) -> str:
+    """Bind this browser session to a token, restoring its state when the token is known.
+
+    Restored state keys go straight into st.session_state; restored messages
+    are picked up per tab by restored_messages() when the tab is first set up.
+    """
+    if store is None or _TOKEN_KEY in st.session_state:
+        return st.session_state.get(_TOKEN_KEY)
+
+    token = st.query_params.get(TOKEN_PARAM)
+    snapshot = None
+    if token and TOKEN_PATTERN.match(token):
+        try:
+            snapshot = store.load(token)
+        except Exception:
+            snapshot = None  # the backend is down: start fresh rather than block the page
+    else:
+        token = secrets.token_urlsafe(18)
+        st.query_params[TOKEN_PARAM] = token
+
+    synced = {"state": {}}
+    if snapshot:
+        for key, value in snapshot["state"].items():
+            st.session_state.setdefault(key, value)
+        synced["state"] = dict(snapshot["state"])
+        st.session_state[_RESTORED_KEY] = snapshot["messages"]
+    st.session_state[_SYNCED_KEY] = synced
+    st.session_state[_TOKEN_KEY] = token
+    return token
+
+
+def restored_messages(tab_name: str) -> list:
+    """Message records saved for this tab (system prompt excluded), consumed on first use."""
+    restored = st.session_state.get(_RESTORED_KEY) or {}
+    messages = restored.pop(tab_name, [])
+    if messages:
+        st.session_state[_SYNCED_KEY][tab_name] = len(messages) + 1
+    return messages
+
+
+def sync_session(tab_name: str, state_keys) -> int:
+    """Queue messages appended to the tab and state keys that changed; returns operations queued."""
+    token = st.session_state.get(_TOKEN_KEY)
+    store = get_session_store() if token else None
+    if store is None:
+        return 0
+    synced = st.session_state[_SYNCED_KEY]
+    messages = st.session_state.messages[tab_name]
+    start = synced.get(tab_name, 1)  # messages[0] is the tab's system prompt, which is not stored
+    for seq in range(start, len(messages)):
+        record = messages.record(seq) if isinstance(messages, MessageLog) else messages[seq]
+        store.append_message(token, tab_name, seq, record)
+    synced[tab_name] = len(messages)
+    queued = max(0, len(messages) - start)
+
+    saved = synced["state"]
+    for key in state_keys:
+        if key in st.session_state and saved.get(key, _MISSING) != st.session_state[key]:
+            saved[key] = st.session_state[key]
+            store.set_state(token, key, saved[key])
+            queued += 1
+    return queued
+
+
+
+def render_session_store_stats():
+    """Write-behind queue counters, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    store = get_session_store()
+    if store is not None:
+        with st.sidebar.expander("Session store"):
+            st.json(dict(store.stats(), token=st.session_state.get(_TOKEN_KEY)))
+
+
+# -----------------------------
+# Shared session server
+# -----------------------------
+def serve_session_store(store: SQLiteSessionStore, host: str = "127.0.0.1", port: int = 8099) -> ThreadingHTTPServer:
+    """HTTP front for one SQLite store, shared by several app replicas (POST /ops, GET /sessions/<token>)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status: int, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if self.path != "/ops":
+                return self._send_json(404, {"error": "not found"})
+            length = int(self.headers.get("Content-Length") or 0)
+            store.write(json.loads(self.rfile.read(length))["ops"])
+            self._send_json(200, {"ok": True})
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._send_json(200, store.stats())
+            token = self.path[len("/sessions/"):] if self.path.startswith("/sessions/") else ""
+            snapshot = store.load(token) if TOKEN_PATTERN.match(token) else None
+            if snapshot is None:
+                return self._send_json(404, {"error": "unknown session"})
+            self._send_json(200, snapshot)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared session store for several app replicas.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--path", default=STORE_PATH, help="SQLite file behind the server")
+    args = parser.parse_args()
+
+    server = serve_session_store(SQLiteSessionStore(args.path), args.host, args.port)
+    print(f"Session store on http://{args.host}:{server.server_address[1]} ({args.path})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streamed structured feedback for the validator stages.
+
+The validators used to block on a whole reasoning-model reply so it could be
+passed to json.loads, and failed outright when the model wrapped the JSON in
+a code fence. They now ask for a JSON-schema response ("feedback" first,
+then "is_valid") and read the stream with a small incremental parser: the
+feedback text is yielded as it is generated, and the complete object is
+parsed once the stream ends.
+"""
+
+import json
+import re
+
+
+# Structured-output schema; "feedback" comes first so it can be streamed before "is_valid" arrives.
+FEEDBACK_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "validator_feedback",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "feedback": {"type": "string"},
+                "is_valid": {"type": "boolean"},
+            },
+            "required": ["feedback", "is_valid"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_IS_VALID = re.compile(r'"is_valid"\s*:\s*(true|false)')
+
+
+def parse_feedback_json(text: str) -> dict:
+    """Parse a validator reply, tolerating code fences and stray text around the object."""
+    text = _FENCE.sub("", text.strip())
+    try:
+        return json.loads(text)
+    except ValueError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise
+        return json.loads(text[start:end + 1])
+
+
+class FeedbackStreamParser:
+    """Incrementally decode one string field (default "feedback") from a streamed JSON object."""
+
+    def __init__(self, field: str = "feedback"):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None      # index of the next undecoded character of the value
+        self._closed = False  # closing quote seen
+
+    def feed(self, chunk: str) -> str:
+        """Add raw model output; return the newly decoded part of the field's text."""
+        self._buffer += chunk
+        if self._closed:
+            return ""
+        if self._pos is None:
+            match = self._key.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf, i, out = self._buffer, self._pos, []
+        while i < len(buf):
+            char = buf[i]
+            if char == '"':
+                self._closed = True
+                i += 1
+                break
+            if char != "\\":
+                out.append(char)
+                i += 1
+                continue
+            # Escapes may be split across chunks: stop and wait for the rest.
+            if i + 1 >= len(buf):
+                break
+            escape = buf[i + 1]
+            if escape != "u":
+                out.append(_ESCAPES.get(escape, escape))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            try:
+                code = int(buf[i + 2:i + 6], 16)
+            except ValueError:
+                out.append(buf[i:i + 6])
+                i += 6
+                continue
+            if 0xD800 <= code < 0xDC00:  # surrogate pair, e.g. emoji
+                if i + 12 > len(buf):
+                    break
+                if buf[i + 6:i + 8] == "\\u":
+                    try:
+                        low = int(buf[i + 8:i + 12], 16)
+                        out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                        i += 12
+                        continue
+                    except ValueError:
+                        pass
+            out.append(chr(code))
+            i += 6
+        self._pos = i
+        return "".join(out)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def raw(self) -> str:
+        return self._buffer
+
+    def result(self) -> dict:
+        """The complete object once the stream has ended."""
+        try:
+            return parse_feedback_json(self._buffer)
+        except ValueError:
+            # Truncated or malformed JSON: salvage what was streamed if the flag made it through.
+            match = _IS_VALID.search(self._buffer)
+            if self._pos is None or match is None:
+                raise
+            feedback = FeedbackStreamParser().feed(self._buffer)
+            return {"feedback": feedback, "is_valid": match.group(1) == "true"}
+
+
+async def astream_feedback(client, model: str, system_prompt: str, user_content: str, parser: FeedbackStreamParser):
+    """Yield feedback text deltas from a JSON-mode completion on an asyncio client; read parser.result() afterwards."""
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ],
+        response_format=FEEDBACK_RESPONSE_FORMAT,
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            text = parser.feed(delta)
+            if text:
+                yield text
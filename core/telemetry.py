@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spans and metrics for LLM calls, stage transitions and script runs.
+
+Three kinds of span are recorded, each as one JSON line in a rotating trace
+file (ZARA_TRACE_PATH, under the cache dir by default) and folded into
+in-process counters and histograms:
+
+- llm   one per chat.completions call through the router, or per answer
+        served from a cache: tab, stage, route, provider, model, time to
+        first token (streams), total latency, tokens, retries, hedged,
+        cache hit and outcome;
+- turn  one per user turn handled by the flow engine: tab, stage before
+        and after, time to the first streamed text (what the trainee
+        perceives as the wait), latency;
+- run   one per Streamlit script pass of a flow: tab, latency, and whether
+        it handled a turn (runs without one are reruns).
+
+Tab and stage reach the router through a context variable set for the turn;
+work handed to a thread pool keeps them when submitted with
+submit_in_context(). With ZARA_METRICS_PORT set, the metrics are served in
+the Prometheus text format on http://127.0.0.1:<port>/metrics.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+from core.paths import CACHE_DIR
+
+
+# -----------------------------
+# Settings
+# -----------------------------
+TRACE_PATH = os.getenv("ZARA_TRACE_PATH", os.path.join(CACHE_DIR, "traces", "spans.jsonl"))
+TRACES_ENABLED = os.getenv("ZARA_TRACES", "1") != "0"
+TRACE_MAX_BYTES = int(os.getenv("ZARA_TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("ZARA_TRACE_BACKUPS", "5"))
+METRICS_HOST = os.getenv("ZARA_METRICS_HOST", "127.0.0.1")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+# name -> (type, help); only these are exported
+METRICS = {
+    "zara_llm_calls_total": ("counter", "LLM calls by outcome (ok, error, timeout, stalled, cancelled, cache_hit)."),
+    "zara_llm_latency_seconds": ("histogram", "LLM call latency, retries included; streams until the last chunk."),
+    "zara_llm_ttft_seconds": ("histogram", "Time to the first streamed chunk."),
+    "zara_llm_tokens_total": ("counter", "Tokens reported by the provider."),
+    "zara_llm_retries_total": ("counter", "Retried attempts within LLM calls."),
+    "zara_llm_hedges_total": ("counter", "LLM calls that sent a hedged duplicate request."),
+    "zara_turn_seconds": ("histogram", "Server time to handle one user turn, by the stage it started in."),
+    "zara_turn_first_text_seconds": ("histogram", "Time from a user turn starting to the first text it streams to the trainee."),
+    "zara_stage_transitions_total": ("counter", "Stage changes made by user turns."),
+    "zara_script_run_seconds": ("histogram", "Duration of a flow's script pass."),
+    "zara_script_runs_total": ("counter", "Script passes of a flow; turn=\"false\" are reruns without a user turn."),
+    "zara_session_evictions_total": ("counter", "Idle sessions whose transcripts were spilled to disk."),
+    "zara_session_rehydrations_total": ("counter", "Evicted sessions loaded back on their next interaction."),
+    "zara_session_resident_bytes": ("gauge", "Transcript memory held by sessions that are not evicted."),
+    "zara_sessions": ("gauge", "Tracked sessions by state (resident, evicted)."),
+    "zara_llm_jobs": ("gauge", "Background LLM jobs by state (queued, running)."),
+    "zara_llm_jobs_total": ("counter", "Finished background LLM jobs by outcome (done, failed, cancelled)."),
+    "zara_channel_messages_total": ("counter", "Inbound webhook messages by outcome (handled, failed, duplicate, rejected)."),
+    "zara_channel_message_seconds": ("histogram", "Time from an inbound webhook message being queued to its replies being sent."),
+    "zara_channel_sends_total": ("counter", "Replies posted to the messaging provider by outcome (ok, error)."),
+    "zara_channel_pending": ("gauge", "Inbound webhook messages queued or being handled."),
+    "zara_stage_saved_seconds": ("histogram", "Time saved by running a stage's requests concurrently rather than one after another."),
+    "zara_feedback_library_total": ("counter", "Feedback library lookups by stage and outcome (match, slo_predicted, slo_exceeded, live, miss)."),
+}
+
+
+# -----------------------------
+# Metrics registry
+# -----------------------------
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, "" if v is None else str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """Labelled counters, gauges and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, labels: dict, value: float):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, labels: dict, value: float):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h.counts), h.sum) for key, h in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            if kind in ("counter", "gauge"):
+                for (metric, labels), value in sorted((counters if kind == "counter" else gauges).items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Span sink
+# -----------------------------
+class Telemetry:
+    """Writes spans to the rotating trace file and updates the metrics."""
+
+    def __init__(self, trace_path: str = TRACE_PATH, traces: bool = TRACES_ENABLED,
+                 max_bytes: int = TRACE_MAX_BYTES, backups: int = TRACE_BACKUPS):
+        self.metrics = MetricsRegistry()
+        self.trace_path = trace_path if traces else None
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._logger = None
+        self._lock = threading.Lock()
+
+    def _trace_logger(self):
+        # Opened on the first span, so importing the module never touches the disk.
+        with self._lock:
+            if self._logger is None:
+                os.makedirs(os.path.dirname(self.trace_path), exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    self.trace_path, maxBytes=self._max_bytes, backupCount=self._backups, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger(f"zara.traces.{id(self)}")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                self._logger = logger
+            return self._logger
+
+    def emit(self, span: dict):
+        kind = span["kind"]
+        if kind == "llm":
+            self._llm_metrics(span)
+        elif kind == "turn":
+            labels = {"tab": span.get("tab"), "stage": span.get("stage")}
+            self.metrics.observe("zara_turn_seconds", labels, span["latency_s"])
+            if span.get("first_text_s") is not None:
+                self.metrics.observe("zara_turn_first_text_seconds", labels, span["first_text_s"])
+            if span.get("to_stage") != span.get("stage"):
+                self.metrics.inc("zara_stage_transitions_total",
+                                 {"tab": span.get("tab"), "from_stage": span.get("stage"), "to_stage": span.get("to_stage")})
+        elif kind == "run":
+            self.metrics.observe("zara_script_run_seconds", {"tab": span.get("tab")}, span["latency_s"])
+            self.metrics.inc("zara_script_runs_total", {"tab": span.get("tab"), "turn": str(span["turn"]).lower()})
+        if self.trace_path:
+            try:
+                self._trace_logger().info(json.dumps(span, default=str))
+            except OSError:
+                pass  # tracing must never break a turn
+
+    def _llm_metrics(self, span: dict):
+        labels = {"tab": span.get("tab"), "stage": span.get("stage"), "route": span.get("route"),
+                  "provider": span.get("provider")}
+        self.metrics.inc("zara_llm_calls_total", dict(labels, model=span.get("model"), outcome=span.get("outcome")))
+        if span.get("cache_hit"):
+            return
+        self.metrics.observe("zara_llm_latency_seconds", labels, span["latency_s"])
+        if span.get("ttft_s") is not None:
+            self.metrics.observe("zara_llm_ttft_seconds", labels, span["ttft_s"])
+        for kind in ("prompt", "completion"):
+            if span.get(f"{kind}_tokens"):
+                self.metrics.inc("zara_llm_tokens_total", dict(labels, kind=kind), span[f"{kind}_tokens"])
+        if span.get("retries"):
+            self.metrics.inc("zara_llm_retries_total", labels, span["retries"])
+        if span.get("hedged"):
+            self.metrics.inc("zara_llm_hedges_total", labels)
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> Telemetry:
+    """The process-wide sink; plain module state because spans are also emitted outside script runs."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+        return _telemetry
+
+
+# -----------------------------
+# Turn context
+# -----------------------------
+_current_turn = contextvars.ContextVar("zara_turn", default={})
+_current_turn_span = contextvars.ContextVar("zara_turn_span", default=None)   # (span, perf_counter at start)
+
+
+def current_turn() -> dict:
+    """{"tab", "stage"} of the turn being handled on this thread, or {}."""
+    return _current_turn.get()
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit() that carries the caller's turn context to the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+@contextlib.contextmanager
+def turn_span(tab: str, stage):
+    """Scope one user turn; the caller sets span["to_stage"] before leaving."""
+    span = {"kind": "turn", "ts": time.time(), "tab": tab, "stage": stage, "to_stage": stage, "first_text_s": None}
+    started = time.perf_counter()
+    token = _current_turn.set({"tab": tab, "stage": stage})
+    span_token = _current_turn_span.set((span, started))
+    try:
+        yield span
+    finally:
+        _current_turn_span.reset(span_token)
+        _current_turn.reset(token)
+        span["latency_s"] = round(time.perf_counter() - started, 4)
+        get_telemetry().emit(span)
+
+
+def mark_turn_first_text():
+    """The current turn has started streaming text to the trainee; only the first call counts."""
+    current = _current_turn_span.get()
+    if current is not None and current[0]["first_text_s"] is None:
+        span, started = current
+        span["first_text_s"] = round(time.perf_counter() - started, 4)
+
+
+# -----------------------------
+# LLM spans
+# -----------------------------
+def llm_span(route: str) -> dict:
+    """Start an LLM span for `route` in the current turn; finish it with finish_llm_span()."""
+    return {"kind": "llm", "ts": time.time(), **current_turn(), "route": route, "provider": None, "model": None,
+            "ttft_s": None, "retries": 0, "hedged": False, "cache_hit": False, "_started": time.perf_counter()}
+
+
+def mark_first_token(span: dict):
+    span["ttft_s"] = round(time.perf_counter() - span["_started"], 4)
+
+
+def add_usage(span: dict, usage):
+    """Copy prompt/completion token counts from an SDK usage object, if any."""
+    if usage is None:
+        return
+    span["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+    span["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+
+def finish_llm_span(span: dict, outcome: str, error: Exception = None):
+    if "_started" not in span:
+        return  # already finished
+    span["latency_s"] = round(time.perf_counter() - span.pop("_started"), 4)
+    span["outcome"] = outcome
+    if error is not None:
+        span["error"] = type(error).__name__
+    get_telemetry().emit(span)
+
+
+def record_cache_hit(route: str, cache: str):
+    """An answer served without an LLM call, counted against the route it replaced."""
+    span = llm_span(route)
+    span.update(provider="cache", model=cache, cache_hit=True)
+    finish_llm_span(span, "cache_hit")
+
+
+# -----------------------------
+# Script runs
+# -----------------------------
+def record_script_run(tab: str, seconds: float, turn: bool):
+    get_telemetry().emit({"kind": "run", "ts": time.time(), "tab": tab, "latency_s": round(seconds, 4), "turn": turn})
+
+
+# -----------------------------
+# Metrics endpoint
+# -----------------------------
+def _metrics_handler(telemetry: Telemetry):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server(port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serve /metrics on a daemon thread, once per process."""
+    server = ThreadingHTTPServer((host, port), _metrics_handler(get_telemetry()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="zara-metrics", daemon=True).start()
+    return server
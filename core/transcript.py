@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental chat transcript rendering.
+
+Every rerun used to repaint the whole message list, and the tabs repainted
+it a second time after stage transitions, so long sessions re-sent hundreds
+of markdown bubbles per submit. The transcript now:
+
+- renders the history once per run, showing only the last HISTORY_WINDOW
+  messages; older ones sit behind a "Show earlier messages" button inside an
+  st.fragment, so paging through them reruns only that fragment;
+- remembers how far it has rendered in this run, so messages appended later
+  in the same run are drawn with render_new() instead of a full repaint;
+- lets streamed replies that were already drawn live be skipped with
+  mark_rendered().
+"""
+
+import streamlit as st
+
+from core.session_memory import get_session_memory
+
+
+HISTORY_WINDOW = 30   # most recent messages always rendered
+PAGE_SIZE = 30        # older messages revealed per "Show earlier messages" click
+
+
+def _cursor_key(tab_name: str) -> str:
+    return f"_transcript_cursor::{tab_name}"
+
+
+def _pages_key(tab_name: str) -> str:
+    return f"_transcript_pages::{tab_name}"
+
+
+def _render_messages(messages):
+    for msg in messages:
+        if msg["role"] != "system":
+            with st.chat_message(msg["role"]):
+                st.markdown(msg["content"])
+
+
+@st.fragment
+def _earlier_messages(tab_name: str, older_count: int):
+    """Collapsed older history; clicking the button reruns only this fragment."""
+    with get_session_memory().running(st.session_state):
+        _render_earlier(tab_name, older_count)
+
+
+def _render_earlier(tab_name: str, older_count: int):
+    pages = st.session_state.get(_pages_key(tab_name), 0)
+    shown = min(older_count, pages * PAGE_SIZE)
+    if shown < older_count:
+        if st.button(f"Show earlier messages ({older_count - shown} more)", key=f"transcript_more::{tab_name}"):
+            st.session_state[_pages_key(tab_name)] = pages + 1
+            shown = min(older_count, (pages + 1) * PAGE_SIZE)
+    if shown:
+        messages = st.session_state.messages[tab_name]
+        _render_messages(messages[1 + older_count - shown:1 + older_count])
+
+
+def render_history(tab_name: str):
+    """Render the tab's transcript once at the top of the run."""
+    messages = st.session_state.messages[tab_name]
+    older_count = max(0, len(messages) - 1 - HISTORY_WINDOW)  # messages[0] is the system prompt
+    if older_count:
+        _earlier_messages(tab_name, older_count)
+    _render_messages(messages[1 + older_count:])
+    st.session_state[_cursor_key(tab_name)] = len(messages)
+
+
+def render_new(tab_name: str):
+    """Render only the messages appended since the last render in this run."""
+    messages = st.session_state.messages[tab_name]
+    start = st.session_state.get(_cursor_key(tab_name), len(messages))
+    _render_messages(messages[start:])
+    st.session_state[_cursor_key(tab_name)] = len(messages)
+
+
+def mark_rendered(tab_name: str):
+    """Mark everything appended so far as already on screen (e.g. streamed live)."""
+    st.session_state[_cursor_key(tab_name)] = len(st.session_state.messages[tab_name])
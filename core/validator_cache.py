@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exact-match result cache for the JSON validator calls.
+
+The I-statement check in I_WE and the two interest checks in
+partners_interest block on a full model reply for every submission, and
+many submissions are copies of the examples we show. Results
+({"feedback", "is_valid"}) are cached on the normalised input, keyed by the
+validator prompt hash and the model that answers (for a routed client, the
+route's providers and models), in a small SQLite file so they are shared
+across sessions and survive restarts. The least recently used rows are
+evicted once the table grows past MAX_ENTRIES.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from core.paths import CACHE_DIR
+from core.structured_feedback import FeedbackStreamParser, astream_feedback
+from core.telemetry import record_cache_hit
+
+
+# -----------------------------
+# Defaults
+# -----------------------------
+CACHE_PATH = os.path.join(CACHE_DIR, "validator_cache.sqlite3")
+MAX_ENTRIES = int(os.getenv("ZARA_VALIDATOR_CACHE_ENTRIES", "20000"))
+
+
+def normalize_input(text: str) -> str:
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def cache_key(system_prompt: str, model: str, user_content: str) -> str:
+    prompt_hash = hashlib.sha256(system_prompt.strip().encode("utf-8")).hexdigest()
+    raw = f"{prompt_hash}\x1f{model}\x1f{normalize_input(user_content)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def answering_model(client, model: str) -> str:
+    """What answers calls made through `client`: the route's models for a routed client, else `model`."""
+    models = getattr(client, "models", None)
+    return models(model) if callable(models) else model
+
+
+class ValidatorCache:
+    """SQLite-backed LRU of validator results shared by every session in the process."""
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS validator_results ("
+            " key TEXT PRIMARY KEY, feedback TEXT NOT NULL, is_valid INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_validator_last_used ON validator_results (last_used)")
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT feedback, is_valid FROM validator_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self._conn.execute("UPDATE validator_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.counters["hits"] += 1
+            return {"feedback": row[0], "is_valid": bool(row[1])}
+
+    def put(self, key: str, result: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validator_results (key, feedback, is_valid, last_used) VALUES (?, ?, ?, ?)",
+                (key, result["feedback"], int(bool(result["is_valid"])), time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM validator_results").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM validator_results WHERE key IN "
+                    "(SELECT key FROM validator_results ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.counters["evictions"] += overflow
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM validator_results").fetchone()
+            return dict(self.counters, entries=count)
+
+
+@st.cache_resource(show_spinner=False)
+def get_validator_cache() -> ValidatorCache:
+    return ValidatorCache()
+
+
+# -----------------------------
+# Cached validator calls
+# -----------------------------
+def _is_cacheable(result: dict) -> bool:
+    return isinstance(result.get("feedback"), str) and isinstance(result.get("is_valid"), bool)
+
+
+async def astream_cached_validator(client, model: str, system_prompt: str, user_content: str, write_stream) -> dict:
+    """
+    Return {"feedback", "is_valid"} for `user_content`, from the cache when possible,
+    passing the feedback text to `write_stream` as it is generated (or all at once on
+    a hit). Runs on the job loop: `client` is an asyncio client (async_route_client)
+    and `write_stream` an async function consuming an async iterator of text (ctx.stream).
+
+    Errors (API failures, unparsable JSON) propagate so the callers keep their
+    fallback messages; only successful results are cached.
+    """
+    cache = get_validator_cache()
+    key = cache_key(system_prompt, answering_model(client, model), user_content)
+    cached = cache.get(key)
+    if cached is not None:
+        record_cache_hit("validation", "validator_cache")
+        await write_stream(_once(cached["feedback"]))
+        return cached
+
+    parser = FeedbackStreamParser()
+    streamed = await write_stream(astream_feedback(client, model, system_prompt, user_content, parser))
+    result = parser.result()
+    if not streamed and result.get("feedback"):
+        await write_stream(_once(result["feedback"]))
+    if _is_cacheable(result):
+        cache.put(key, result)
+    return result
+
+
+async def _once(text: str):
+    yield text
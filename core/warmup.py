@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background warm-up of heavy per-process resources.
+
+The first trainee to open General Flow used to pay for the BM25 and vector
+index, the citation index, the embedding model and the tokenizer inside
+their script run. start_warmup() runs the loaders the tab registry lists
+(tabs/__init__.py) on one daemon thread as soon as the first session starts,
+so later calls hit their lru_cache instead. Set ZARA_WARMUP=0 to skip it.
+"""
+
+import importlib
+import os
+import threading
+import time
+
+import streamlit as st
+
+
+WARMUP_ENABLED = os.getenv("ZARA_WARMUP", "1") != "0"
+
+
+class Warmup:
+    """Runs "module:function" loaders one after another and records how each went."""
+
+    def __init__(self, targets):
+        self.targets = tuple(targets)
+        self.status = {target: {"state": "pending"} for target in self.targets}
+        self._thread = threading.Thread(target=self._run, name="zara-warmup", daemon=True)
+
+    def start(self) -> "Warmup":
+        self._thread.start()
+        return self
+
+    def join(self, timeout: float = None) -> bool:
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        for target in self.targets:
+            module_name, function_name = target.split(":")
+            self.status[target] = {"state": "running"}
+            started = time.perf_counter()
+            try:
+                getattr(importlib.import_module(module_name), function_name)()
+                state = {"state": "done"}
+            except Exception as e:
+                state = {"state": "failed", "error": f"{type(e).__name__}: {e}"}
+            self.status[target] = dict(state, seconds=round(time.perf_counter() - started, 3))
+
+
+@st.cache_resource(show_spinner=False)
+def start_warmup(targets: tuple) -> Warmup:
+    """Start warming `targets` once per process; later calls return the same Warmup."""
+    warmup = Warmup(targets if WARMUP_ENABLED else ())
+    return warmup.start()
+
+
+def render_warmup_status(warmup: Warmup, load_seconds: dict):
+    """Warm-up and tab import timings, shown only when ZARA_DEBUG is set."""
+    if not os.getenv("ZARA_DEBUG"):
+        return
+    with st.sidebar.expander("Warm-up"):
+        st.json({"resources": warmup.status, "tab_imports": load_seconds})
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch evaluation runner for evaluation/evalDataset.txt.
+
+Sends every question through the same answer path the app's turns use
+(tabs.general_flow.ahandle_user_question: answer cache, citation lookup,
+retrieval, context budget, streamed LLM call) on one asyncio loop, like the
+LLM job loop, with bounded concurrency and a request rate limit, and
+records per question:
+
+- latency and time to first token (the first streamed text delta);
+- prompt and completion tokens;
+- where the answer came from: "llm", "cache" (answer cache) or "citation".
+
+Results go to a workbook laid out like the rater sheets in
+evaluationSheet.xlsx (Query, Response, then the rating columns left blank)
+plus a Summary sheet, and one summary line per run is appended to
+evaluation/eval_history.jsonl so runs can be compared over time.
+
+Usage:
+    OPENAI_API_KEY=... python evaluation/run_eval.py --concurrency 4 --rps 2 --repeat 2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from core.llm_router import async_route_client  # noqa: E402
+from tabs.general_flow import FLOW, SYSTEM_PROMPT_VERSION, ahandle_user_question, lookup_reference  # noqa: E402
+
+
+EVAL_DIR = os.path.join(REPO_ROOT, "evaluation")
+DATASET_PATH = os.path.join(EVAL_DIR, "evalDataset.txt")
+RESULTS_DIR = os.path.join(EVAL_DIR, "results")
+HISTORY_PATH = os.path.join(EVAL_DIR, "eval_history.jsonl")
+DEFAULT_MODEL = "o4-mini-2025-04-16"
+
+# Same columns as the rater sheets in evaluationSheet.xlsx, so answers can be scored side by side
+RATING_COLUMNS = ["Accuracy", "Clarity", "Comprehensiveness", "Relevance", "Practical Guidance", "Empathy", "Overall"]
+METRIC_COLUMNS = ["Latency (s)", "TTFT (s)", "Prompt tokens", "Completion tokens", "LLM calls", "Source", "Error"]
+
+
+def load_questions(path: str = DATASET_PATH) -> list:
+    with open(path, encoding="utf-8-sig") as f:
+        return [line.strip().lstrip("*").strip() for line in f if line.strip()]
+
+
+# -----------------------------
+# Metering
+# -----------------------------
+@dataclass
+class QuestionResult:
+    index: int
+    question: str
+    answer: str = ""
+    started: float = 0.0
+    latency: float = 0.0
+    ttft: float = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_calls: int = 0
+    source: str = "llm"
+    error: bool = False
+
+
+class _MeteredCompletions:
+    def __init__(self, completions, result: QuestionResult):
+        self._completions = completions
+        self._result = result
+
+    async def create(self, **kwargs):
+        if not kwargs.get("stream"):
+            response = await self._completions.create(**kwargs)
+            self._count(getattr(response, "usage", None))
+            return response
+        stream = await self._completions.create(**{**kwargs, "stream_options": {"include_usage": True}})
+        return self._metered(stream)
+
+    async def _metered(self, stream):
+        usage = None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if self._result.ttft is None and chunk.choices and chunk.choices[0].delta.content:
+                    self._result.ttft = time.perf_counter() - self._result.started
+                yield chunk
+        finally:
+            self._count(usage)
+
+    def _count(self, usage):
+        self._result.llm_calls += 1
+        if usage is not None:
+            self._result.prompt_tokens += usage.prompt_tokens or 0
+            self._result.completion_tokens += usage.completion_tokens or 0
+
+
+class MeteredClient:
+    """The router's asyncio chat route, wrapped so one question's calls are timed and counted."""
+
+    def __init__(self, client, result: QuestionResult):
+        completions = async_route_client(client, "chat").chat.completions
+        self.chat = SimpleNamespace(completions=_MeteredCompletions(completions, result))
+
+
+class EvalTurn:
+    """Just enough of the flow engine's turn context for ahandle_user_question."""
+
+    def __init__(self, client, model: str):
+        self.flow = FLOW
+        self.tab_name = FLOW.tab_name
+        self.client = client
+        self.model = model
+        self.stage = max(FLOW.stages)  # free chat, so answers carry no training redirect
+        self.state = {}
+        self.messages = [{"role": "system", "content": FLOW.system_prompt}]
+
+    async def stream(self, chunks) -> str:
+        """Nothing to draw: collect the whole answer, like a chat channel turn."""
+        parts = []
+        async for text in chunks:
+            parts.append(text)
+        return "".join(parts)
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# -----------------------------
+# Running
+# -----------------------------
+async def evaluate_question(client, model: str, index: int, question: str, limiter: RateLimiter,
+                            slots: asyncio.Semaphore) -> QuestionResult:
+    async with slots:
+        await limiter.acquire()
+        result = QuestionResult(index=index, question=question)
+        result.started = time.perf_counter()
+        turn = EvalTurn(MeteredClient(client, result), model)
+        result.answer, _ = await ahandle_user_question(turn, question, is_during_training=False)
+        result.latency = time.perf_counter() - result.started
+    result.error = result.answer.startswith("⚠️")
+    if result.llm_calls == 0 and not result.error:
+        result.source = "citation" if lookup_reference(question) is not None else "cache"
+        result.ttft = result.latency
+    return result
+
+
+def run_batch(client, model: str, questions: list, concurrency: int = 4, rps: float = 2.0, repeat: int = 1) -> list:
+    """Evaluate `questions` `repeat` times; later passes show how much the answer cache absorbs."""
+    async def run():
+        limiter, slots = RateLimiter(rps, burst=concurrency), asyncio.Semaphore(concurrency)
+        results = []
+        for _ in range(repeat):
+            results.extend(await asyncio.gather(
+                *(evaluate_question(client, model, i, q, limiter, slots) for i, q in enumerate(questions))
+            ))
+        return results
+    return asyncio.run(run())
+
+
+def percentile(values: list, p: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(results: list, wall_seconds: float) -> dict:
+    latencies = [r.latency for r in results if not r.error]
+    ttfts = [r.ttft for r in results if not r.error and r.ttft is not None]
+    summary = {
+        "questions": len(results),
+        "errors": sum(r.error for r in results),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_qps": round(len(results) / wall_seconds, 3) if wall_seconds else None,
+        "prompt_tokens": sum(r.prompt_tokens for r in results),
+        "completion_tokens": sum(r.completion_tokens for r in results),
+        "llm_calls": sum(r.llm_calls for r in results),
+        "cache_hits": sum(r.source == "cache" for r in results),
+        "citation_hits": sum(r.source == "citation" for r in results),
+    }
+    for name, values in (("latency", latencies), ("ttft", ttfts)):
+        for p in (50, 95, 99):
+            value = percentile(values, p)
+            summary[f"{name}_p{p}"] = round(value, 3) if value is not None else None
+    return summary
+
+
+# -----------------------------
+# Output
+# -----------------------------
+def write_workbook(path: str, results: list, summary: dict, meta: dict):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Run"
+    sheet.append([None, None, meta["model"]])
+    sheet.append(["Query", "Response"] + RATING_COLUMNS + METRIC_COLUMNS)
+    for r in results:
+        sheet.append([r.question, r.answer] + [None] * len(RATING_COLUMNS) + [
+            round(r.latency, 3), round(r.ttft, 3) if r.ttft is not None else None,
+            r.prompt_tokens, r.completion_tokens, r.llm_calls, r.source, "yes" if r.error else None,
+        ])
+
+    summary_sheet = workbook.create_sheet("Summary")
+    for key, value in {**meta, **summary}.items():
+        summary_sheet.append([key, value])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    workbook.save(path)
+
+
+def append_history(path: str, record: dict):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def previous_run(path: str, dataset: str):
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("dataset") == dataset:
+                last = record
+    return last
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run evalDataset.txt through the app's answer path.")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--concurrency", type=int, default=4, help="questions in flight at once")
+    parser.add_argument("--rps", type=float, default=2.0, help="max questions started per second (0 = unlimited)")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the dataset; later passes hit the answer cache")
+    parser.add_argument("--limit", type=int, default=None, help="only the first N questions")
+    parser.add_argument("--out-dir", default=RESULTS_DIR)
+    parser.add_argument("--history", default=HISTORY_PATH)
+    args = parser.parse_args()
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)  # bare-mode session_state warnings
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        sys.exit("OPENAI_API_KEY is not set.")
+    from core.llm_gateway import LLMGateway
+    from core.llm_router import LLMRouter
+    # Same routing and call policy as the app; without GROQ_API_KEY every route uses OpenAI.
+    client = LLMRouter(LLMGateway({"openai": api_key, "groq": os.getenv("GROQ_API_KEY", "")}))
+
+    questions = load_questions(args.dataset)[:args.limit]
+    started = time.perf_counter()
+    results = run_batch(client, args.model, questions, args.concurrency, args.rps, args.repeat)
+    summary = summarize(results, time.perf_counter() - started)
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    meta = {
+        "run": stamp,
+        "dataset": os.path.relpath(args.dataset, REPO_ROOT),
+        "model": args.model,
+        "prompt_version": SYSTEM_PROMPT_VERSION,
+        "commit": _git_commit(),
+        "concurrency": args.concurrency,
+        "rps": args.rps,
+        "repeat": args.repeat,
+    }
+    workbook_path = os.path.join(args.out_dir, f"eval-{stamp}.xlsx")
+    write_workbook(workbook_path, results, summary, meta)
+
+    previous = previous_run(args.history, meta["dataset"])
+    append_history(args.history, {**meta, **summary, "workbook": os.path.relpath(workbook_path, REPO_ROOT)})
+
+    print(json.dumps(summary, indent=2))
+    if previous is not None:
+        print(f"\nChange since run {previous['run']} ({previous.get('model')}, {previous.get('commit')}):")
+        for key in ("latency_p50", "latency_p95", "ttft_p50", "prompt_tokens", "completion_tokens", "errors"):
+            if summary.get(key) is not None and previous.get(key) is not None:
+                print(f"  {key:<18} {previous[key]:>10} -> {summary[key]:<10} ({summary[key] - previous[key]:+.3f})")
+    print(f"\nWorkbook: {workbook_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,34 +7,68 @@ Customized by Bushra for Zara Entrepreneur chatbot.
 
 import os
 import streamlit as st
-from openai import OpenAI
 
-# Importing the tab-specific modules, including general_flow where the main LLM logic resides.
-from tabs import I_WE, partners_interest, general_flow
+# The tab-specific modules, including general_flow where the main LLM logic resides, are
+# listed in the tabs registry and imported only when their radio option is first chosen.
+from tabs import LOAD_SECONDS, TABS, load_tab, warm_targets
+from core.concurrent_streams import render_stage_timings
+from core.feedback_library import get_feedback_library, render_library_stats
+from core.llm_gateway import get_gateway, render_pool_stats
+from core.llm_jobs import get_job_executor, render_job_stats
+from core.llm_router import get_router, render_route_stats
+from core.session_memory import get_session_memory, render_session_memory_stats
+from core.session_store import get_session_store, render_session_store_stats, resume_session
+from core.telemetry import start_metrics_server
+from core.warmup import render_warmup_status, start_warmup
+
+def _secret(name: str):
+    """st.secrets[name], or None when there is no secrets file or no such key."""
+    try:
+        return st.secrets.get(name)
+    except Exception:
+        return None
 
 def main():
     st.set_page_config(page_title="Zara | زارا", layout="centered")
     st.title("Zara || زارا - Family Support Assistant")
 
-    # Initialize OpenAI API with secret key or environment variable
-    try:
-        api_key = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OpenAI API key not found.")
-        client = OpenAI(api_key=api_key)
-    except Exception as e:
-        st.error(f"Failed to initialize OpenAI client: {e}")
+    # Read the OpenAI API key from secrets or environment variable
+    api_key = _secret("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        st.error("Failed to initialize OpenAI client: OpenAI API key not found.")
         return
 
-    # Initialize Groq API key, if needed for specific backend logic
+    # Groq API key, if needed for specific backend logic
+    groq_key = _secret("GROQ_KEY")
+    if not groq_key:
+        st.error("Failed to set Groq API key: Groq API key not found.")
+        return
+
+    # The gateway (and its pooled HTTP connections) is built once per process,
+    # not on every rerun, so keep-alive connections survive between turns.
+    # The router on top of it sends each call type to the right provider and model.
     try:
-        groq_key = st.secrets.get("GROQ_KEY")
-        if not groq_key:
-            raise ValueError("Groq API key not found.")
-        os.environ["GROQ_API_KEY"] = groq_key
+        gateway = get_gateway(api_key, groq_key)
+        gateway.client("openai")
+        client = get_router(api_key, groq_key)
     except Exception as e:
-        st.error(f"Failed to set Groq API key: {e}")
+        st.error(f"Failed to initialize OpenAI client: {e}")
         return
+    render_pool_stats(gateway)
+    render_route_stats(client)
+    # Turns that call an LLM run on a shared background loop instead of this script thread
+    render_job_stats(get_job_executor())
+    # Precomputed validator feedback, served on close matches or when a call would miss its SLO
+    render_library_stats(get_feedback_library())
+    # Time saved by the stages that run their requests concurrently
+    render_stage_timings()
+
+    # Heavy resources (retrieval indexes, embedder, tokenizer) load in the background, once per process
+    warmup = start_warmup(warm_targets())
+
+    # Prometheus-style /metrics for LLM calls, turns and script runs, when a port is configured
+    if os.getenv("ZARA_METRICS_PORT"):
+        start_metrics_server(int(os.getenv("ZARA_METRICS_PORT")))
 
     # Set default session state if not already present
     if "openai_model" not in st.session_state:
@@ -42,20 +76,25 @@ def main():
     if "messages" not in st.session_state:
         st.session_state["messages"] = {}
 
-    # Each label corresponds to a custom conversation flow in its own file
+    # Bind the browser session to a ?session= token; a known token brings back its progress
+    resume_session(get_session_store())
+    render_session_store_stats()
+    memory = get_session_memory()
+    render_session_memory_stats(memory)
+
+    # Each label corresponds to a custom conversation flow in its own file (see tabs/__init__.py)
     # Max: The actual prompt logic lives inside these modules (e.g., general_flow.py).
-    label_map = {
-        "Understanding Your Partner’s Interests/Communication Help ": partners_interest,
-        "‘I We’ Statements ": I_WE,
-        "General Flow ": general_flow  # <- This is the one where the base prompt logic is defined
-    }
+    labels = [tab.label for tab in TABS]
 
     # UI to select which flow to run
-    choice = st.radio("Which topic do you want to try first?", list(label_map.keys()))
+    choice = st.radio("Which topic do you want to try first?", labels)
 
     # Dynamically load and run the chosen module
-    module = label_map[choice]
-    module.render(client)  # Max: This is where control passes to general_flow.py (or another tab).
+    module = load_tab(choice)
+    render_warmup_status(warmup, LOAD_SECONDS)
+    # Transcripts of idle sessions may have been spilled to disk; running() brings them back first
+    with memory.running(st.session_state):
+        module.render(client)  # Max: This is where control passes to general_flow.py (or another tab).
     # That script defines what prompt is used, how user input is handled, and what gets sent to the LLM.
 
 if __name__ == "__main__":
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+Retrieval over the family-law judgments in data/RAGdata.txt.
+"""
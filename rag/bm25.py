@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25 over the judgment chunks with a precomputed inverted index.
+
+Postings, document lengths and IDF values are computed once when the index
+is built, so scoring a query only touches the postings of its own terms.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+
+
+K1 = 1.5
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have he her his how i if in into is it
+its me my no not of on or our she so such than that the their them then there these they this to was we were
+what when where which who why will with would you your
+""".split())
+
+
+def _stem(token: str) -> str:
+    # Light plural folding is enough for this corpus ("courts" -> "court", "cases" -> "case").
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    return [_stem(t) for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index: term -> [(doc, term frequency)], with IDF precomputed."""
+
+    def __init__(self, documents: list, k1: float = K1, b: float = B):
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((doc, tf))
+        self.postings = dict(postings)
+        self.doc_count = len(documents)
+        self.avg_length = (sum(self.doc_lengths) / self.doc_count) if self.doc_count else 0.0
+        self.idf = {
+            term: math.log(1 + (self.doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        self._docs = {term: frozenset(doc for doc, _ in docs) for term, docs in self.postings.items()}
+        self._max_idf = max(self.idf.values(), default=0.0)
+        # Per-document length normalisation is constant, so fold it in up front.
+        self._norm = [k1 * (1 - b + b * length / self.avg_length) if self.avg_length else k1 for length in self.doc_lengths]
+
+    def scores(self, query: str, allowed=None) -> dict:
+        """{doc: score} for documents sharing a term with the query (restricted to `allowed`)."""
+        result = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[term]:
+                if allowed is not None and doc not in allowed:
+                    continue
+                result[doc] += idf * tf * (self.k1 + 1) / (tf + self._norm[doc])
+        return result
+
+    def top_k(self, query: str, k: int = 5, allowed=None) -> list:
+        scored = self.scores(query, allowed)
+        return sorted(scored.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def coverage(self, query: str, doc: int) -> float:
+        """
+        Share of the query's IDF mass that `doc` contains, in [0, 1]. Terms
+        the corpus never uses count at the highest IDF: a question about
+        something no judgment mentions is mostly not covered, however well
+        its generic words ("court", "family", "Pakistan") match.
+        """
+        terms = set(tokenize(query))
+        total = sum(self.idf.get(term, self._max_idf) for term in terms)
+        if not total:
+            return 0.0
+        return sum(self.idf[term] for term in terms if doc in self._docs.get(term, ())) / total
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exact citation and case-name lookup for the judgments corpus.
+
+Users often paste a citation they heard about ("2022 SCMR 2123",
+"PLD 2011 SC 657", "C.P. 1418/2023") or a case name ("Ibrahim Khan v. Mst.
+Saima Khan"). Those resolve straight to the judgment summary through
+precomputed dictionaries, with no embedding or LLM step:
+
+- citations are normalised (dots, spacing, reporter and court
+  abbreviations such as "S.C.M.R."/"SCMR" or "Lah"/"Lahore") to one key;
+- party names are normalised (honorifics like "Mst."/"Dr.", "& others",
+  "vs"/"versus") and indexed as the full "a v b" pair and per side; only
+  sides that name a single case are matched on their own, and a close
+  match (difflib) is tried when there is no exact one.
+"""
+
+import difflib
+import functools
+import re
+
+from rag.bm25 import tokenize
+from rag.corpus import load_chunks
+
+
+# -----------------------------
+# Citation normalisation
+# -----------------------------
+_COURT_ALIASES = {
+    "LAHORE": "LAH", "LHR": "LAH", "LAH": "LAH",
+    "KARACHI": "KAR", "KAR": "KAR", "SHC": "KAR",
+    "PESHAWAR": "PESH", "PESH": "PESH",
+    "QUETTA": "QUETTA", "QTA": "QUETTA",
+    "ISLAMABAD": "IHC", "ISL": "IHC", "IHC": "IHC",
+    "SC": "SC", "FSC": "FSC",
+}
+_REPORTER_FIRST = re.compile(
+    r"\b(PLD|PLJ)\s*(\d{4})\s*(%s)\s*(\d+)\b" % "|".join(sorted(_COURT_ALIASES, key=len, reverse=True))
+)
+_YEAR_FIRST = re.compile(r"\b(\d{4})\s*(SCMR|CLC|MLD|YLR|PCRLJ|PLC|CLD)\s*(\d+)\b")
+_PETITION = re.compile(r"\b(?:CP|CIVIL\s+PETITION)\s*(?:NO)?\s*(\d+)\s*(?:/|OF)\s*(\d{4})\b")
+
+
+def _citation_text(text: str) -> str:
+    # "S.C.M.R." -> "SCMR", "C.P. No. 12" -> "CP NO 12"; keep "/" for petition numbers.
+    text = text.upper().replace(".", "")
+    return re.sub(r"[^A-Z0-9/]+", " ", text)
+
+
+def extract_citations(text: str) -> list:
+    """Canonical citation keys found in `text`, in order of appearance."""
+    normalized = _citation_text(text)
+    found = []
+    for match in _REPORTER_FIRST.finditer(normalized):
+        reporter, year, court, page = match.groups()
+        found.append((match.start(), f"{reporter} {year} {_COURT_ALIASES[court]} {int(page)}"))
+    for match in _YEAR_FIRST.finditer(normalized):
+        year, reporter, page = match.groups()
+        found.append((match.start(), f"{year} {reporter} {int(page)}"))
+    for match in _PETITION.finditer(normalized):
+        number, year = match.groups()
+        found.append((match.start(), f"CP {int(number)}/{year}"))
+    keys = []
+    for _, key in sorted(found):
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+# -----------------------------
+# Party-name normalisation
+# -----------------------------
+_HONORIFICS = {"mst", "miss", "mrs", "mr", "dr", "ms", "sheikh", "syed", "the"}
+_FILLERS = re.compile(r"\b(?:and|&)\s+(?:others?|another)\b|\betc\b|\bothers?\b", re.I)
+_VERSUS = re.compile(r"\s+(?:v|vs|versus)\.?\s+", re.I)
+# Words that don't make a pasted reference into a question ("tell me about the case ...")
+_REFERENCE_WORDS = {"case", "judgment", "judgement", "tell", "about", "summary", "explain", "v", "vs", "versus", "mst", "other", "another", "etc"}
+
+
+def normalize_party(name: str) -> str:
+    name = _FILLERS.sub(" ", name.lower())
+    tokens = re.findall(r"[a-z0-9]+", name)
+    return " ".join(t for t in tokens if t not in _HONORIFICS)
+
+
+def split_parties(case_title: str):
+    parts = _VERSUS.split(case_title, maxsplit=1)
+    if len(parts) != 2:
+        return None
+    return normalize_party(parts[0]), normalize_party(parts[1])
+
+
+class CitationIndex:
+    """Precomputed citation and party-name dictionaries over the chunks."""
+
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+        self.by_citation = {}
+        self.by_pair = {}
+        side_cases = {}
+        for chunk in chunks:
+            for key in extract_citations(f"{chunk.case_name} {chunk.text}"):
+                self.by_citation.setdefault(key, chunk)
+            parties = split_parties(chunk.parties)
+            if parties:
+                self.by_pair[f"{parties[0]} v {parties[1]}"] = chunk
+                for side in parties:
+                    side_cases.setdefault(side, []).append(chunk)
+        # A side such as "federation of pakistan" names several cases; only unique sides identify one.
+        self.by_side = {side: cases[0] for side, cases in side_cases.items() if len(cases) == 1 and " " in side}
+        self._pairs = list(self.by_pair)
+
+    def lookup_citation(self, citation: str):
+        keys = extract_citations(citation)
+        return self.by_citation.get(keys[0]) if keys else None
+
+    def lookup_case_name(self, title: str, cutoff: float = 0.85):
+        """Chunk for a case title like "Ibrahim Khan v. Saima Khan", exact or close match."""
+        parties = split_parties(title)
+        if parties is None:
+            return self.by_side.get(normalize_party(title))
+        pair = f"{parties[0]} v {parties[1]}"
+        if pair in self.by_pair:
+            return self.by_pair[pair]
+        close = difflib.get_close_matches(pair, self._pairs, n=1, cutoff=cutoff)
+        return self.by_pair[close[0]] if close else None
+
+    def lookup(self, text: str) -> list:
+        """Cases referenced in free text (citations first, then case names), without duplicates."""
+        found = [self.by_citation[key] for key in extract_citations(text) if key in self.by_citation]
+
+        if _VERSUS.search(text):
+            # Try the words around each "v." as a case title.
+            words = text.split()
+            for i, word in enumerate(words):
+                if word.lower().rstrip(".") in ("v", "vs", "versus"):
+                    for width in range(5, 0, -1):
+                        title = " ".join(words[max(0, i - width):i + 1 + width]).strip("?.,!\"'")
+                        chunk = self.lookup_case_name(title)
+                        if chunk is not None:
+                            found.append(chunk)
+                            break
+
+        normalized = f" {normalize_party(text)} "
+        found.extend(chunk for side, chunk in self.by_side.items() if f" {side} " in normalized)
+
+        unique = []
+        for chunk in found:
+            if chunk not in unique:
+                unique.append(chunk)
+        return unique
+
+    def is_reference_only(self, text: str, chunk) -> bool:
+        """True when `text` is little more than `chunk`'s citation or case name, i.e. a pasted reference."""
+        leftover = _citation_text(text)
+        for pattern in (_REPORTER_FIRST, _YEAR_FIRST, _PETITION):
+            leftover = pattern.sub(" ", leftover)
+        known = set(tokenize(chunk.parties)) | _REFERENCE_WORDS
+        return len([t for t in tokenize(leftover) if t not in known]) <= 1
+
+
+@functools.lru_cache(maxsize=1)
+def get_citation_index() -> CitationIndex:
+    return CitationIndex(load_chunks())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunking of data/RAGdata.txt.
+
+The file is a list of bulleted case summaries grouped under section
+headings ("Marriage and Divorce", "Child Custody and Guardianship", ...).
+Each bullet becomes one chunk, tagged with its section, so a chunk is a
+whole judgment summary and never straddles two cases. Court, year and
+reporter citation are parsed from the case heading, e.g.
+"Raja Muhammad Owais v. Mst. Nadia Jabeen (SC 2022, 2022 SCMR 2123)".
+"""
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from functools import cached_property
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_PATH = os.path.join(REPO_ROOT, "data", "RAGdata.txt")
+
+_BULLET = re.compile(r"^\s*[*•]\s+")
+_CASE_SPLIT = re.compile(r"\s+[–—-]\s+")   # "Case v. Other (SC 2024) – The Supreme Court ..."
+_CASE_META = re.compile(r"\((?P<court>[A-Z]{2,4})\s+(?P<year>(?:19|20)\d{2})(?:\s*[,;]\s*(?P<rest>[^)]*))?\)\s*$")
+
+COURTS = {
+    "SC": "Supreme Court",
+    "FSC": "Federal Shariat Court",
+    "LHC": "Lahore High Court",
+    "IHC": "Islamabad High Court",
+    "SHC": "Sindh High Court",
+    "PHC": "Peshawar High Court",
+    "BHC": "Balochistan High Court",
+}
+
+# Short topic keys for the section headings
+TOPICS = {
+    "marriage": "Marriage and Divorce",
+    "custody": "Child Custody and Guardianship",
+    "inheritance": "Inheritance and Succession",
+    "procedure": "Family Court Procedure and Miscellaneous",
+}
+
+
+@dataclass(frozen=True)
+class Chunk:
+    id: str
+    section: str
+    case_name: str
+    text: str
+
+    @cached_property
+    def _meta(self) -> dict:
+        match = _CASE_META.search(self.case_name)
+        if not match or match.group("court") not in COURTS:
+            return {"court": None, "year": None, "citation": None, "parties": self.case_name}
+        rest = (match.group("rest") or "").strip()
+        return {
+            "court": match.group("court"),
+            "year": int(match.group("year")),
+            # "appeal pending in SC" and similar notes are not citations
+            "citation": rest if rest and any(ch.isdigit() for ch in rest) else None,
+            "parties": self.case_name[:match.start()].strip(),
+        }
+
+    @property
+    def court(self):
+        return self._meta["court"]
+
+    @property
+    def year(self):
+        return self._meta["year"]
+
+    @property
+    def citation(self):
+        return self._meta["citation"]
+
+    @property
+    def parties(self) -> str:
+        return self._meta["parties"]
+
+    @property
+    def embedding_text(self) -> str:
+        return f"{self.section}: {self.text}"
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.sha256(self.embedding_text.encode("utf-8")).hexdigest()
+
+
+def _is_heading(line: str) -> bool:
+    # Headings are short title lines; the closing note is a long paragraph.
+    return len(line) <= 80 and not line.endswith(".")
+
+
+def parse_chunks(text: str) -> list:
+    """Split the corpus text into one Chunk per case bullet."""
+    chunks, section, seen = [], "", {}
+    for number, raw in enumerate(text.lstrip("﻿").splitlines()):
+        line = raw.strip()
+        if not line:
+            continue
+        if _BULLET.match(raw):
+            body = _BULLET.sub("", raw).strip()
+            case_name = _CASE_SPLIT.split(body, maxsplit=1)[0].strip()
+            base = hashlib.sha1(f"{section}\x1f{case_name}".encode("utf-8")).hexdigest()[:12]
+            seen[base] = seen.get(base, 0) + 1
+            chunk_id = base if seen[base] == 1 else f"{base}-{seen[base]}"
+            chunks.append(Chunk(id=chunk_id, section=section, case_name=case_name, text=body))
+        elif number > 0 and _is_heading(line):
+            section = line
+    return chunks
+
+
+def load_chunks(path: str = CORPUS_PATH) -> list:
+    with open(path, encoding="utf-8-sig") as f:
+        return parse_chunks(f.read())
+
+
+def corpus_hash(path: str = CORPUS_PATH) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hybrid retrieval over the judgments: BM25 fused with dense similarity.
+
+Court, year and topic filters are applied first, from small precomputed
+metadata indexes, so both scorers only look at the allowed chunks. The two
+rankings are merged with reciprocal rank fusion. When the embedding model
+or index is unavailable the retriever falls back to BM25 alone.
+
+Questions that name a case or citation skip the search: rag.citations
+resolves them to the judgment directly.
+"""
+
+import functools
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+
+from rag.bm25 import BM25Index
+from rag.citations import get_citation_index
+from rag.corpus import COURTS, TOPICS, Chunk, load_chunks
+
+
+RRF_K = 60
+# A question is treated as about the judgments only if a retrieved chunk passes both gates. Calibrated on
+# evaluation/retrieval_gold.json (benchmarks/retrieval_bench.py): the coverage gate keeps 18 of the 20
+# questions with relevant judgments and grounds 2 of the 16 without any, against 14 of 16 with BM25 alone.
+MIN_BM25_SCORE = 3.0        # raw BM25 floor
+MIN_QUERY_COVERAGE = 0.33   # share of the question's IDF mass the chunk contains (BM25Index.coverage)
+
+_COURT_NAMES = {name.lower(): code for code, name in COURTS.items()}
+_COURT_CODE = re.compile(r"\b(%s)\b" % "|".join(COURTS))
+_YEAR = re.compile(r"\b((?:19|20)\d{2})\b")
+
+
+@dataclass
+class Passage:
+    chunk: Chunk
+    score: float          # fused score used for ranking
+    bm25: float = 0.0
+    dense: float = 0.0
+    coverage: float = 0.0  # BM25Index.coverage of the question
+
+
+def _as_set(value):
+    if value is None:
+        return None
+    return {value} if isinstance(value, str) else set(value)
+
+
+class HybridRetriever:
+    def __init__(self, chunks: list, vector_index=None, rrf_k: int = RRF_K):
+        self.chunks = chunks
+        self.vector_index = vector_index
+        self.rrf_k = rrf_k
+        self.bm25 = BM25Index([f"{c.case_name} {c.embedding_text}" for c in chunks])
+        self._by_court = defaultdict(set)
+        self._by_topic = defaultdict(set)
+        for row, chunk in enumerate(chunks):
+            self._by_court[chunk.court].add(row)
+            self._by_topic[chunk.section].add(row)
+
+    # -----------------------------
+    # Filters
+    # -----------------------------
+    def candidates(self, court=None, topic=None, year_from=None, year_to=None):
+        """Rows allowed by the filters, or None when no filter is set."""
+        allowed = None
+        courts = _as_set(court)
+        if courts:
+            allowed = set().union(*(self._by_court.get(c.upper(), set()) for c in courts))
+        topics = _as_set(topic)
+        if topics:
+            sections = {TOPICS.get(t, t) for t in topics}
+            rows = set().union(*(self._by_topic.get(s, set()) for s in sections))
+            allowed = rows if allowed is None else allowed & rows
+        if year_from is not None or year_to is not None:
+            low, high = year_from or 0, year_to or 9999
+            rows = {r for r, c in enumerate(self.chunks) if c.year is not None and low <= c.year <= high}
+            allowed = rows if allowed is None else allowed & rows
+        return allowed
+
+    # -----------------------------
+    # Search
+    # -----------------------------
+    def search(self, query: str, top_k: int = 3, court=None, topic=None, year_from=None, year_to=None) -> list:
+        allowed = self.candidates(court, topic, year_from, year_to)
+        if allowed is not None and not allowed:
+            return []
+        depth = max(top_k * 4, 10)
+
+        bm25_ranked = self.bm25.top_k(query, depth, allowed)
+        dense_ranked = []
+        if self.vector_index is not None:
+            try:
+                rows = sorted(allowed) if allowed is not None else None
+                vector = _query_vector(self.vector_index.model_name, query)
+                dense_ranked = [(self.vector_index.row_of[chunk.id], score)
+                                for score, chunk in self.vector_index.search(vector, depth, rows)]
+            except Exception:
+                dense_ranked = []
+
+        fused = defaultdict(float)
+        bm25_scores, dense_scores = dict(bm25_ranked), dict(dense_ranked)
+        for ranking in (bm25_ranked, dense_ranked):
+            for rank, (row, _) in enumerate(ranking):
+                fused[row] += 1.0 / (self.rrf_k + rank + 1)
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [Passage(self.chunks[row], score, bm25_scores.get(row, 0.0), dense_scores.get(row, 0.0),
+                        self.bm25.coverage(query, row)) for row, score in best]
+
+
+@functools.lru_cache(maxsize=1024)
+def _query_vector(model_name: str, query: str):
+    from core.embeddings import embed_texts
+    return embed_texts([query], model_name)[0]
+
+
+def infer_filters(question: str) -> dict:
+    """Court and year filters mentioned in a question ("Lahore High Court", "SC", "2021")."""
+    filters = {}
+    lowered = question.lower()
+    courts = {code for name, code in _COURT_NAMES.items() if name in lowered}
+    courts |= set(_COURT_CODE.findall(question))
+    if courts:
+        filters["court"] = courts
+    years = {int(y) for y in _YEAR.findall(question)}
+    if len(years) == 1:
+        filters["year_from"] = filters["year_to"] = years.pop()
+    return filters
+
+
+def format_context(passages: list) -> str:
+    return "\n\n".join(f"- [{p.chunk.section}] {p.chunk.text}" for p in passages)
+
+
+@functools.lru_cache(maxsize=1)
+def get_retriever() -> HybridRetriever:
+    """Process-wide retriever; dense scoring is skipped if the vector index can't be loaded."""
+    try:
+        from rag.vector_index import get_vector_index
+        index = get_vector_index()
+        return HybridRetriever(index.chunks, index)
+    except Exception:
+        return HybridRetriever(load_chunks())
+
+
+def grounded(passages: list) -> bool:
+    """Whether search results are about the question, rather than sharing a few generic words with it."""
+    return bool(passages) and max(p.bm25 for p in passages) >= MIN_BM25_SCORE \
+        and max(p.coverage for p in passages) >= MIN_QUERY_COVERAGE
+
+
+def retrieve_for_question(question: str, top_k: int = 3) -> list:
+    """Passages to ground an answer in, or [] when the question isn't about the judgments."""
+    cited = get_citation_index().lookup(question)
+    if cited:
+        return [Passage(chunk, score=1.0) for chunk in cited[:top_k]]
+
+    retriever = get_retriever()
+    filters = infer_filters(question)
+    passages = retriever.search(question, top_k, **filters) if filters else []
+    if not passages:
+        passages = retriever.search(question, top_k)
+    return passages if grounded(passages) else []
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent dense index over the judgments corpus.
+
+`python -m rag.vector_index` (or the first load after the corpus changes)
+embeds the chunks from rag.corpus in batches on CPU and writes two files to
+data/index/:
+
+- vectors.npy    float32 rows, L2-normalised, opened with mmap_mode="r" so
+                 the OS page cache is shared between processes;
+- manifest.json  embedding model, corpus hash, and each chunk's id, hash and
+                 metadata, in row order.
+
+Rebuilds are incremental: rows whose chunk hash is unchanged are copied from
+the previous artifact and only new or edited chunks are embedded. The app
+loads the artifact once per process with get_vector_index().
+"""
+
+import argparse
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.embeddings import DEFAULT_MODEL, embed_texts
+from rag.corpus import CORPUS_PATH, REPO_ROOT, Chunk, corpus_hash, load_chunks
+
+
+INDEX_DIR = os.getenv("ZARA_INDEX_DIR", os.path.join(REPO_ROOT, "data", "index"))
+VECTORS_FILE = "vectors.npy"
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+
+class VectorIndex:
+    """Memory-mapped chunk embeddings with brute-force cosine search."""
+
+    def __init__(self, vectors, chunks: list, manifest: dict):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.manifest = manifest
+        self.model_name = manifest["model"]
+        self.row_of = {chunk.id: row for row, chunk in enumerate(chunks)}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query_vector, top_k: int = 5, rows=None) -> list:
+        """[(score, Chunk)] best first; `rows` limits the search to those row numbers."""
+        if not len(self.chunks):
+            return []
+        if rows is None:
+            scores = self.vectors @ query_vector
+            candidates = np.arange(len(scores))
+        else:
+            candidates = np.asarray(rows, dtype=np.int64)
+            if not len(candidates):
+                return []
+            scores = self.vectors[candidates] @ query_vector
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), self.chunks[int(candidates[i])]) for i in best]
+
+    def search_text(self, query: str, top_k: int = 5, rows=None) -> list:
+        return self.search(embed_texts([query], self.model_name)[0], top_k, rows)
+
+    def stats(self) -> dict:
+        return {
+            "chunks": len(self.chunks),
+            "dim": int(self.vectors.shape[1]) if len(self.chunks) else 0,
+            "bytes": int(self.vectors.nbytes),
+            "model": self.model_name,
+            "corpus_hash": self.manifest["corpus_hash"],
+        }
+
+
+# -----------------------------
+# Build / load
+# -----------------------------
+def _read_manifest(index_dir: str):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("format") == FORMAT_VERSION else None
+
+
+def build_index(corpus_path: str = CORPUS_PATH, index_dir: str = INDEX_DIR, model_name: str = DEFAULT_MODEL) -> dict:
+    """(Re)build the artifact, re-embedding only chunks that changed. Returns build stats."""
+    started = time.perf_counter()
+    chunks = load_chunks(corpus_path)
+    hashes = [chunk.content_hash for chunk in chunks]
+
+    previous_rows = {}
+    previous = _read_manifest(index_dir)
+    if previous is not None and previous["model"] == model_name:
+        old_vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+        previous_rows = {entry["hash"]: old_vectors[row] for row, entry in enumerate(previous["chunks"])}
+
+    missing = [i for i, h in enumerate(hashes) if h not in previous_rows]
+    fresh = embed_texts([chunks[i].embedding_text for i in missing], model_name) if missing else None
+
+    dim = fresh.shape[1] if fresh is not None else (len(next(iter(previous_rows.values()))) if previous_rows else 0)
+    vectors = np.zeros((len(chunks), dim), dtype=np.float32)
+    for row, h in enumerate(hashes):
+        if h in previous_rows:
+            vectors[row] = previous_rows[h]
+    for position, row in enumerate(missing):
+        vectors[row] = fresh[position]
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "model": model_name,
+        "dim": int(dim),
+        "corpus_hash": corpus_hash(corpus_path),
+        "built_at": time.time(),
+        "chunks": [
+            {"id": c.id, "hash": h, "section": c.section, "case_name": c.case_name, "text": c.text}
+            for c, h in zip(chunks, hashes)
+        ],
+    }
+
+    # Write both files next to the old ones, then swap them in.
+    os.makedirs(index_dir, exist_ok=True)
+    vectors_tmp = os.path.join(index_dir, VECTORS_FILE + ".tmp")
+    manifest_tmp = os.path.join(index_dir, MANIFEST_FILE + ".tmp")
+    with open(vectors_tmp, "wb") as f:
+        np.save(f, vectors)
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(vectors_tmp, os.path.join(index_dir, VECTORS_FILE))
+    os.replace(manifest_tmp, os.path.join(index_dir, MANIFEST_FILE))
+
+    return {
+        "chunks": len(chunks),
+        "embedded": len(missing),
+        "reused": len(chunks) - len(missing),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def load_index(index_dir: str = INDEX_DIR) -> VectorIndex:
+    manifest = _read_manifest(index_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No index artifact in {index_dir}; run `python -m rag.vector_index`.")
+    vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+    chunks = [Chunk(id=e["id"], section=e["section"], case_name=e["case_name"], text=e["text"]) for e in manifest["chunks"]]
+    return VectorIndex(vectors, chunks, manifest)
+
+
+def is_stale(corpus_path: str = CORPUS_PATH, index_dir: str = INDEX_DIR, model_name: str = DEFAULT_MODEL) -> bool:
+    manifest = _read_manifest(index_dir)
+    return manifest is None or manifest["model"] != model_name or manifest["corpus_hash"] != corpus_hash(corpus_path)
+
+
+_load_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_vector_index(corpus_path: str = CORPUS_PATH, index_dir: str = INDEX_DIR, model_name: str = DEFAULT_MODEL) -> VectorIndex:
+    """The index for this process; rebuilt incrementally first if the corpus changed."""
+    with _load_lock:
+        if is_stale(corpus_path, index_dir, model_name):
+            build_index(corpus_path, index_dir, model_name)
+        return load_index(index_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the judgments vector index.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args()
+    print(json.dumps(build_index(args.corpus, args.index_dir, args.model), indent=2))
+
+
+if __name__ == "__main__":
+    main()
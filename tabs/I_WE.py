@@ -12,15 +12,45 @@ Adapted on Wed July 10 2025
 """
 
 import streamlit as st
+import os
 import time
 import json
 
+from core.concurrent_streams import StreamCancelled, record_stage_timing, start_stream, start_structured_stream
+from core.feedback_library import LibraryStage, SLOExceeded, answered_live, consult, served, within_slo
+from core.flow_engine import Flow, Stage, Transition, free_chat, run_flow, validator
+from core.llm_router import async_route_client
+
 
 # -----------------------------
 # MODEL + SYSTEM PROMPT
 # -----------------------------
 # DEFAULT_MODEL = "ft:gpt-4o-2024-08-06:iml-research:wakeel:BW4oryHJ"
 
+# Max prompt tokens per free-chat call; older turns are folded into a rolling summary.
+CONTEXT_TOKEN_BUDGET = 2500
+
+# Stage 3 sends the We-statement feedback and final reflection concurrently;
+# set ZARA_IWE_MERGE_STAGE3=1 to ask for both in one structured request instead.
+MERGE_STAGE3_CALLS = os.getenv("ZARA_IWE_MERGE_STAGE3") == "1"
+
+STAGE3_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "we_statement_feedback",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "feedback": {"type": "string"},
+                "reflection": {"type": "string"},
+            },
+            "required": ["feedback", "reflection"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 SYSTEM_PROMPT = """
 You are Zara — a warm, supportive mentor who helps low-income Pakistani women (with limited education and digital exposure) understand how to build small businesses with the support of their families. You guide them through a WhatsApp-style training focused on communication skills and family support — not technical business skills (yet).
 
@@ -77,87 +107,10 @@ msg3_reflection = (
 )
 
 # -----------------------------
-# Session Setup
-# -----------------------------
-def setup_session_state(tab_name: str):
-    # if "openai_model" not in st.session_state:
-    #     st.session_state["openai_model"] = DEFAULT_MODEL
-    if tab_name not in st.session_state.messages:
-        st.session_state.messages[tab_name] = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ]
-    if "iwe_stage" not in st.session_state:
-        st.session_state.iwe_stage = 0
-    if "iwe_i_statement" not in st.session_state:
-        st.session_state.iwe_i_statement = ""
-    if "iwe_we_statement" not in st.session_state:
-        st.session_state.iwe_we_statement = ""
-
-# -----------------------------
-# Show chat history (only from stage 2+)
-# -----------------------------
-def display_chat_history(tab_name: str):
-    for msg in st.session_state.messages[tab_name]:
-        if msg["role"] != "system":
-            with st.chat_message(msg["role"]):
-                st.markdown(msg["content"])
-
-# -----------------------------
-# Freeform LLM chat (after rule-based part is done)
-# -----------------------------
-def handle_user_prompt(client, tab_name: str):
-    if prompt := st.chat_input("Chat with Zara (I WE Statements)"):
-        st.session_state.messages[tab_name].append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        with st.chat_message("assistant"):
-            try:
-                stream = client.chat.completions.create(
-                    model=st.session_state["openai_model"],
-                    messages=st.session_state.messages[tab_name],
-                    stream=True,
-                )
-                response = st.write_stream(stream)
-            except Exception as e:
-                response = f"⚠️ Error: {e}"
-                st.error(response)
-        st.session_state.messages[tab_name].append({"role": "assistant", "content": response})
-
+# Validator prompt (stage 1)
 # -----------------------------
-# MAIN RENDER FUNCTION
-# -----------------------------
-def render(client):
-    tab_name = "I WE Statements"
-    st.header("I- and We-Statements Training")
-
-    setup_session_state(tab_name)
-    display_chat_history(tab_name)
-
-    # STAGE 0: Ask if they tried I/We statement
-    if st.session_state.iwe_stage == 0:
-        if not any(msg["content"] == msg1 for msg in st.session_state.messages[tab_name] if msg["role"] == "assistant"):
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": msg1})
-            display_chat_history(tab_name)
-
-        user_response = st.chat_input("Type 1 or 2")
-        if user_response:
-            st.session_state.messages[tab_name].append({"role": "user", "content": user_response})
-            if user_response.strip() == "1":
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg2_yes})
-            else:
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg2_no})
-            st.session_state.iwe_stage = 1
-            display_chat_history(tab_name)
-
-    # STAGE 1: Collect I-statement
-    elif st.session_state.iwe_stage == 1:
-        iwe_input = st.chat_input("Write your I-statement")
-        if iwe_input:
-            st.session_state.iwe_i_statement = iwe_input
-            st.session_state.messages[tab_name].append({"role": "user", "content": iwe_input})
-
-            # Prompt that asks for feedback AND a validity flag
-            system_prompt = """
+# Prompt that asks for feedback AND a validity flag
+I_STATEMENT_CHECK_PROMPT = """
     You are a communication coach helping users write clear I-statements.
 
     Your task is to:
@@ -170,110 +123,196 @@ def render(client):
     {"feedback": "Your I-statement is clear and well-structured!", "is_valid": true}
             """
 
-            try:
-                # Get streamed response
-                response = client.chat.completions.create(
-                    model=st.session_state["openai_model"],
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"My I-statement: {iwe_input}"}
-                    ],
-                    stream=False,  # not streaming so we can parse JSON
-                )
-                raw_feedback = response.choices[0].message.content.strip()
-                result = json.loads(raw_feedback)
-                feedback = result.get("feedback", "Thanks for your response.")
-                is_valid = result.get("is_valid", False)
-
-            except Exception as e:
-                feedback = f"⚠️ Error from LLM: {e}"
-                st.error(feedback)
-                feedback = "Sorry, something went wrong."
-                is_valid = False
-
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": feedback})
-
-            if is_valid:
-                # Move to next stage
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg3_we_intro})
-                st.session_state.iwe_stage = 2
-
-            else:
-                if not st.session_state.get("iwe_retry", False):
-                    # First invalid attempt → give another try
-                    st.session_state.iwe_retry = True
-                    st.session_state.messages[tab_name].append({
-                        "role": "assistant",
-                        "content": "Try again to write an I statement"
-                        ""
-                    })
-                else:
-                    # Second invalid attempt → move on anyway
-                    st.session_state.messages[tab_name].append({"role": "assistant", "content": msg3_we_intro})
-                    st.session_state.iwe_stage = 2
-
-            display_chat_history(tab_name)
-
-
-
-    # STAGE 2: Ask if they tried a We-statement
-    elif st.session_state.iwe_stage == 2:
-        user_response = st.chat_input("Type 1 or 2")
-        if user_response:
-            st.session_state.messages[tab_name].append({"role": "user", "content": user_response})
-            if user_response.strip() == "1":
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": "Great! Write your We-statement and I will check it."})
-            else:
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg4_we_example})
-            st.session_state.iwe_stage = 3
-            display_chat_history(tab_name)
-
-    # STAGE 3: Collect We-statement
-    elif st.session_state.iwe_stage == 3:
-        we_input = st.chat_input("Write your We-statement")
-        if we_input:
-            st.session_state.iwe_we_statement = we_input
-            st.session_state.messages[tab_name].append({"role": "user", "content": we_input})
-            try:
-                stream = client.chat.completions.create(
-                    model=st.session_state["openai_model"],
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": f"My We-statement: {we_input}"}
-                    ],
-                    stream=True,
-                )
-                feedback = st.write_stream(stream)
-            except Exception as e:
-                feedback = f"⚠️ Error from LLM: {e}"
-                st.error(feedback)
-                feedback = "Sorry, something went wrong."
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": feedback})
-
-            # Send both I and We for overall reflection
-            try:
-                reflection_prompt = f"The user shared this I-statement: {st.session_state.iwe_i_statement} and this We-statement: {st.session_state.iwe_we_statement}. Give them final encouragement and reflection."
-                stream = client.chat.completions.create(
-                    model=st.session_state["openai_model"],
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": reflection_prompt}
-                    ],
-                    stream=True,
-                )
-                final_feedback = st.write_stream(stream)
-            except Exception as e:
-                final_feedback = f"⚠️ Error from LLM: {e}"
-                st.error(final_feedback)
-                final_feedback = "Thanks for trying this out!"
-
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": final_feedback})
-            st.session_state.iwe_stage = 4
-            display_chat_history(tab_name)
-
-    # STAGE 4+: Open-ended chat
-    elif st.session_state.iwe_stage >= 4:
-        handle_user_prompt(client, tab_name)
+# Precomputed feedback for frequent I-statements (core/feedback_library.py)
+I_STATEMENT_LIBRARY = LibraryStage("iwe_i_statement", inputs=("iwe_i_statement",), fields=("feedback", "is_valid"),
+                                   prompt=I_STATEMENT_CHECK_PROMPT)
+
+# -----------------------------
+# Stage 3: We-statement feedback + final reflection
+# -----------------------------
+STAGE3_MERGED_INSTRUCTIONS = (
+    "Reply in JSON with \"feedback\" on the We-statement and \"reflection\" for the final encouragement."
+)
+
+# Feedback and reflection precomputed for frequent pairs of statements; the stage is
+# keyed by both, since the reflection is about both.
+STAGE3_LIBRARY = LibraryStage("iwe_we_statement", inputs=("iwe_i_statement", "iwe_we_statement"),
+                              fields=("feedback", "reflection"), prompt=SYSTEM_PROMPT + STAGE3_MERGED_INSTRUCTIONS,
+                              route="reflection", slo=4.0)
+
+
+def _reflection_prompt(i_statement: str, we_statement: str) -> str:
+    return f"The user shared this I-statement: {i_statement} and this We-statement: {we_statement}. Give them final encouragement and reflection."
+
+
+def _merged_prompt(we_input: str, reflection_prompt: str) -> str:
+    return f"My We-statement: {we_input}\n\n{reflection_prompt}\n\n{STAGE3_MERGED_INSTRUCTIONS}"
+
+
+async def we_statement_feedback(ctx, we_input: str):
+    # Precomputed feedback and reflection for a familiar pair of statements skip both calls.
+    entry, serve_now = await consult(STAGE3_LIBRARY, STAGE3_LIBRARY.values(ctx.state), ctx.client)
+    if serve_now:
+        ctx.say(entry["fields"]["feedback"])
+        ctx.say(entry["fields"]["reflection"])
+        return
+
+    # The feedback and the reflection over both statements don't depend on each other,
+    # so both requests start now and are rendered in order as they stream in.
+    client, model = async_route_client(ctx.client, "reflection"), ctx.model
+    reflection_prompt = _reflection_prompt(ctx.state['iwe_i_statement'], ctx.state['iwe_we_statement'])
+    started = time.perf_counter()
+    if MERGE_STAGE3_CALLS:
+        merged_prompt = _merged_prompt(we_input, reflection_prompt)
+        feedback_stream, reflection_stream = start_structured_stream(
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": merged_prompt}
+                ],
+                response_format=STAGE3_RESPONSE_FORMAT,
+                stream=True,
+            ),
+            ("feedback", "reflection"),
+        )
+    else:
+        feedback_stream = start_stream(lambda: client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"My We-statement: {we_input}"}
+            ],
+            stream=True,
+        ))
+        # Send both I and We for overall reflection
+        reflection_stream = start_stream(lambda: client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": reflection_prompt}
+            ],
+            stream=True,
+        ))
+
+    # With a fallback entry at hand, a part that has not started within the SLO (counted from
+    # the start of the stage) is served from the library.
+    def read(stream):
+        if entry is None:
+            return stream
+        return within_slo(stream, max(0.05, started + STAGE3_LIBRARY.slo - time.perf_counter()))
+
+    fell_back = False
+    try:
+        try:
+            ctx.say(await ctx.stream(read(feedback_stream)), shown=True)
+        except SLOExceeded:
+            feedback_stream.cancel()
+            ctx.say(entry["fields"]["feedback"])
+            fell_back = True
+        except Exception as e:
+            ctx.error(f"⚠️ Error from LLM: {e}")
+            ctx.say("Sorry, something went wrong.")
+
+        try:
+            ctx.say(await ctx.stream(read(reflection_stream)), shown=True)
+        # A merged request is one task: falling back on the feedback cancelled the reflection too
+        except (SLOExceeded, StreamCancelled):
+            reflection_stream.cancel()
+            ctx.say(entry["fields"]["reflection"])
+            fell_back = True
+        except Exception as e:
+            ctx.error(f"⚠️ Error from LLM: {e}")
+            ctx.say("Thanks for trying this out!")
+    finally:
+        # Cancelled mid-stage (the trainee left the tab): don't leave the other request running
+        feedback_stream.cancel()
+        reflection_stream.cancel()
+
+    if fell_back:
+        served(STAGE3_LIBRARY, "slo_exceeded")
+    elif entry is not None:
+        answered_live(STAGE3_LIBRARY)
+    record_stage_timing("iwe_stage3", "merged" if MERGE_STAGE3_CALLS else "parallel", started,
+                        [feedback_stream, reflection_stream])
+
+
+async def _precompute_stage3(client, model, i_statement: str, we_statement: str) -> dict:
+    """Feedback and reflection for one pair of statements, in one structured call; used to build the library offline."""
+    response = await async_route_client(client, "reflection").chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": _merged_prompt(we_statement, _reflection_prompt(i_statement, we_statement))}
+        ],
+        response_format=STAGE3_RESPONSE_FORMAT,
+    )
+    return json.loads(response.choices[0].message.content or "{}")
+
+# Fallback texts said above, kept in the flow's content pack
+we_statement_feedback.texts = ("Sorry, something went wrong.", "Thanks for trying this out!")
+we_statement_feedback.library = STAGE3_LIBRARY
+we_statement_feedback.precompute = _precompute_stage3
+
+# -----------------------------
+# Conversation script
+# -----------------------------
+# Stage 0: ask if they tried an I-statement   -> 1
+# Stage 1: collect + check the I-statement    -> 2 (one retry if it needs work)
+# Stage 2: ask if they tried a We-statement   -> 3
+# Stage 3: collect the We-statement, feedback + reflection -> 4
+# Stage 4+: open-ended chat
+FLOW = Flow(
+    tab_name="I WE Statements",
+    header="I- and We-Statements Training",
+    system_prompt=SYSTEM_PROMPT,
+    stage_key="iwe_stage",
+    intro=(msg1,),
+    state_defaults={"iwe_i_statement": "", "iwe_we_statement": ""},
+    context_budget=CONTEXT_TOKEN_BUDGET,
+    stages={
+        0: Stage(
+            placeholder="Type 1 or 2",
+            choices={"1": Transition(say=(msg2_yes,), to=1)},
+            otherwise=Transition(say=(msg2_no,), to=1),
+        ),
+        1: Stage(
+            placeholder="Write your I-statement",
+            store_as="iwe_i_statement",
+            otherwise=Transition(hook=validator(
+                I_STATEMENT_CHECK_PROMPT,
+                user_template="My I-statement: {text}",
+                default_feedback="Thanks for your response.",
+                error_feedback="Sorry, something went wrong.",
+                on_valid=Transition(say=(msg3_we_intro,), to=2),
+                on_retry=Transition(say=("Try again to write an I statement",)),
+                on_give_up=Transition(say=(msg3_we_intro,), to=2),
+                retry_key="iwe_retry",
+                library=I_STATEMENT_LIBRARY,
+            )),
+        ),
+        2: Stage(
+            placeholder="Type 1 or 2",
+            choices={"1": Transition(say=("Great! Write your We-statement and I will check it.",), to=3)},
+            otherwise=Transition(say=(msg4_we_example,), to=3),
+        ),
+        3: Stage(
+            placeholder="Write your We-statement",
+            store_as="iwe_we_statement",
+            otherwise=Transition(hook=we_statement_feedback, to=4),
+        ),
+        4: Stage(
+            placeholder="Chat with Zara (I WE Statements)",
+            otherwise=Transition(hook=free_chat),
+        ),
+    },
+)
+
+# -----------------------------
+# MAIN RENDER FUNCTION
+# -----------------------------
+def render(client):
+    run_flow(FLOW, client)
 
 
 
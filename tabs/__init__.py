@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed May 14 15:18:33 2025
+
+@author: amna
+
+Registry of the training tabs. main.py used to import every tab (and, via
+general_flow, the retrieval stack) before drawing anything; a tab module is
+now imported the first time its radio option is chosen. Each entry also
+names the heavy resources its tab needs ("module:function" loaders), which
+core/warmup.py builds on a background thread once per process.
+"""
+
+import importlib
+import threading
+import time
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class TabPlugin:
+    label: str                # radio option shown in main.py
+    module: str               # imported on first use; must define render(client)
+    warm: tuple = ()          # "module:function" loaders to run in the background
+
+
+TABS = (
+    TabPlugin("Understanding Your Partner’s Interests/Communication Help ", "tabs.partners_interest",
+              warm=("core.context_budget:_encoding", "core.feedback_library:get_feedback_library")),
+    TabPlugin("‘I We’ Statements ", "tabs.I_WE",
+              warm=("core.context_budget:_encoding", "core.feedback_library:get_feedback_library")),
+    # This is the one where the base prompt logic is defined; it also answers legal questions from the judgments
+    TabPlugin("General Flow ", "tabs.general_flow",
+              warm=("core.context_budget:_encoding", "rag.citations:get_citation_index", "rag.retriever:get_retriever",
+                    "core.embeddings:get_embedder")),
+)
+
+_BY_LABEL = {tab.label: tab for tab in TABS}
+_load_lock = threading.Lock()
+LOAD_SECONDS = {}             # module -> seconds its first import took in this process
+
+
+def load_tab(label: str):
+    """The tab module for a radio label, imported on first use."""
+    tab = _BY_LABEL[label]
+    with _load_lock:
+        if tab.module not in LOAD_SECONDS:
+            started = time.perf_counter()
+            importlib.import_module(tab.module)
+            LOAD_SECONDS[tab.module] = round(time.perf_counter() - started, 4)
+    return importlib.import_module(tab.module)
+
+
+def warm_targets() -> tuple:
+    """Every tab's warm-up loaders, without duplicates, in registry order."""
+    return tuple(dict.fromkeys(target for tab in TABS for target in tab.warm))
@@ -1,12 +0,0 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-Created on Wed May 14 15:18:33 2025
-
-@author: amna
-"""
-
-# tabs/__init__.py
-from .I_WE import render as I_WE
-from .partners_interest import render as partners_interest
-from .general_flow import render as general_flow
\ No newline at end of file
@@ -9,16 +9,29 @@ rather than people when resolving conflicts with family members.
 Adapted on Thu July 11 2025
 @author: amna
 """
+import asyncio
 import streamlit as st
 import time
 import json
 
+from core.answer_cache import get_answer_cache, prompt_version
+from core.concurrent_streams import aiter_text
+from core.context_budget import fit_messages, make_summarizer
+from core.flow_engine import Flow, Stage, Transition, run_flow
+from core.llm_router import async_route_client
+from core.telemetry import record_cache_hit
+from rag.citations import get_citation_index
+from rag.retriever import format_context, retrieve_for_question
+
 
 # -----------------------------
 # MODEL + SYSTEM PROMPT
 # -----------------------------
 # DEFAULT_MODEL = "ft:gpt-4o-2024-08-06:iml-research:wakeel:BW4oryHJ"
 
+# Max prompt tokens per free-chat call; older turns are folded into a rolling summary.
+CONTEXT_TOKEN_BUDGET = 3000
+
 SYSTEM_PROMPT = """
 You are acting as Zara, a warm and supportive mentor for Pakistani women entrepreneurs with limited education and digital exposure.
 
@@ -41,6 +54,19 @@ Your task:
 8. If answering during training flow, end with "Let's go back to where we left off in the training!"
 """
 
+# Cached answers are tied to the prompt they were generated with.
+SYSTEM_PROMPT_VERSION = prompt_version(SYSTEM_PROMPT)
+
+# Added for family-law questions, followed by the matching judgment summaries from data/RAGdata.txt
+GROUNDING_PROMPT = """
+The user's question may touch on Pakistani family law. Some court judgments that might be related are
+below. Use them if they are relevant to the question, name the case you rely on, and keep it short and
+simple. If they are not relevant, ignore them and answer from what you know as usual; for a legal
+question you are unsure about, suggest asking a lawyer or a free legal aid office.
+
+Judgments:
+"""
+
 # -----------------------------
 # Pre-scripted conversation messages
 # -----------------------------
@@ -76,149 +102,148 @@ msg6 = (
 )
 
 # -----------------------------
-# Session Setup
+# Handle user questions with LLM
 # -----------------------------
-def setup_session_state(tab_name: str):
-    # if "openai_model" not in st.session_state:
-    #     st.session_state["openai_model"] = DEFAULT_MODEL
-    if "messages" not in st.session_state:
-        st.session_state.messages = {}
-    if tab_name not in st.session_state.messages:
-        st.session_state.messages[tab_name] = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ]
-    if "focus_stage" not in st.session_state:
-        st.session_state.focus_stage = 0
+def lookup_reference(user_text: str):
+    """Judgment summary when the user just pasted a citation or case name, else None."""
+    index = get_citation_index()
+    cited = index.lookup(user_text)
+    if len(cited) == 1 and index.is_reference_only(user_text, cited[0]):
+        return f"Here is what I know about this case:\n\n{cited[0].text}"
+    return None
+
+def _answer_without_llm(ctx, user_text: str, is_during_training: bool):
+    """An answer from the shared cache or the judgment summaries, or None."""
+    # Repeated off-script questions are answered from the shared cache
+    cached = get_answer_cache().get(ctx.tab_name, ctx.stage, user_text, SYSTEM_PROMPT_VERSION)
+    if cached is not None:
+        record_cache_hit("chat", "answer_cache")
+        return cached
+
+    # A pasted citation or case name is answered straight from the judgment summary
+    reference = lookup_reference(user_text)
+    if reference is not None:
+        record_cache_hit("chat", "citation_index")
+        if is_during_training:
+            reference += "\n\nLet's go back to where we left off in the training!"
+        return reference
+    return None
+
+def _cache_answer(tab_name: str, stage: int, user_text: str, answer: str):
+    get_answer_cache().put(tab_name, stage, user_text, SYSTEM_PROMPT_VERSION, answer)
+
+def _question_messages(ctx, user_text: str, is_during_training: bool, passages: list) -> list:
+    """The request for an LLM answer: tab history, grounding passages and the question."""
+    # Create a simple user message with context about training stage
+    if is_during_training:
+        user_message = f"{user_text}\n\n[Note: User is currently in training flow - please end response with training redirect message]"
+    else:
+        user_message = user_text
 
-# -----------------------------
-# Show chat history
-# -----------------------------
-def display_chat_history(tab_name: str):
-    for msg in st.session_state.messages[tab_name]:
-        if msg["role"] != "system":
-            with st.chat_message(msg["role"]):
-                st.markdown(msg["content"])
+    # Ground legal questions in the judgments corpus instead of free-form generation
+    grounding = [{"role": "system", "content": GROUNDING_PROMPT + format_context(passages)}] if passages else []
 
-# -----------------------------
-# Handle user questions with LLM
-# -----------------------------
-def handle_user_question(client, tab_name: str, user_text: str, is_during_training: bool = True):
-    """Handle user questions using LLM - simplified to use only system prompt"""
+    # Use existing conversation history with system prompt, trimmed to the tab's token budget
+    return fit_messages(
+        ctx.tab_name,
+        ctx.messages + grounding + [{"role": "user", "content": user_message}],
+        summarizer=make_summarizer(ctx.client, ctx.model),
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        state=ctx.state,
+    )
+
+def _retrieve(user_text: str) -> list:
     try:
-        # Create a simple user message with context about training stage
-        if is_during_training:
-            user_message = f"{user_text}\n\n[Note: User is currently in training flow - please end response with training redirect message]"
-        else:
-            user_message = user_text
-        
-        # Use existing conversation history with system prompt
-        messages = st.session_state.messages[tab_name] + [
-            {"role": "user", "content": user_message}
-        ]
-        
-        response = client.chat.completions.create(
-            model=st.session_state["openai_model"],
+        return retrieve_for_question(user_text)
+    except Exception:
+        return []
+
+def _failure_answer(is_during_training: bool) -> str:
+    if is_during_training:
+        return f"⚠️ Sorry, I couldn't process your question right now. Let's go back to where we left off in the training!"
+    else:
+        return f"⚠️ Sorry, I couldn't process your question right now. Please try again!"
+
+async def ahandle_user_question(ctx, user_text: str, is_during_training: bool = True):
+    """Answer a question asked during the flow; an LLM answer is streamed to `ctx` as it is generated.
+
+    Returns (answer, streamed).
+    """
+    # The answer cache, citation index and retrieval are CPU work (embedding, BM25, and loading the
+    # embedder on a cold process); keep them off the job loop, which carries every session's streams
+    answer = await asyncio.to_thread(_answer_without_llm, ctx, user_text, is_during_training)
+    if answer is not None:
+        return answer, False
+    try:
+        passages = await asyncio.to_thread(_retrieve, user_text)
+        messages = _question_messages(ctx, user_text, is_during_training, passages)
+        stream = await async_route_client(ctx.client, "chat").chat.completions.create(
+            model=ctx.model,
             messages=messages,
-            stream=False,
+            stream=True,
         )
-        return response.choices[0].message.content.strip()
+        outcome = {}
+        answer = (await ctx.stream(aiter_text(stream, outcome))).strip()
+        if not answer:
+            return _failure_answer(is_during_training), False
+        # A stream cut short by a stall or its deadline raises; one cut short by the token limit ends with "length"
+        if outcome.get("finish_reason") == "stop":
+            await asyncio.to_thread(_cache_answer, ctx.tab_name, ctx.stage, user_text, answer)
+        return answer, True
     except Exception as e:
-        if is_during_training:
-            return f"⚠️ Sorry, I couldn't process your question right now. Let's go back to where we left off in the training!"
-        else:
-            return f"⚠️ Sorry, I couldn't process your question right now. Please try again!"
-
-# -----------------------------
-# Check if user input is expected training response
-# -----------------------------
-def is_training_response(user_input: str, expected_stage: int) -> bool:
-    """Check if user input matches expected training flow response"""
-    user_input = user_input.strip()
-    
-    if expected_stage == 1:  # Stage 1 expects "1" or "2"
-        return user_input in ["1", "2"]
-    elif expected_stage in [2, 3]:  # Stages 2 and 3 expect "1"
-        return user_input == "1"
-    
-    return False
-
-# -----------------------------
-# Get stage instruction text
-# -----------------------------
-def get_stage_instruction(stage: int) -> str:
-    """Get instruction text for current stage"""
-    if stage == 1:
-        return "Type 1 or 2 to continue the training, or ask any question!"
-    elif stage == 2:
-        return "Type 1 to continue the training, or ask any question!"
-    elif stage == 3:
-        return "Type 1 to continue the training, or ask any question!"
-    else:
-        return "Ask any questions about this training or chat freely!"
+        return _failure_answer(is_during_training), False
+
+async def answer_question(ctx, user_text: str):
+    # Check if we're still in training (stages 1-3) or in free chat (stage 4+).
+    # The training message the transition says next follows in the same job, right under the streamed answer.
+    answer, streamed = await ahandle_user_question(ctx, user_text, is_during_training=ctx.stage < 4)
+    ctx.say(answer, shown=streamed)
+
+# -----------------------------
+# Conversation script
+# -----------------------------
+# Each training stage expects "1" (or "2") to continue. Anything else is treated as a
+# question: it is answered by the LLM and the current training message is repeated.
+FLOW = Flow(
+    tab_name="Focus on Issues",
+    header="Focus on Issues, Not People",
+    system_prompt=SYSTEM_PROMPT,
+    stage_key="focus_stage",
+    intro=(msg1, msg2),
+    intro_to=1,
+    context_budget=CONTEXT_TOKEN_BUDGET,
+    stages={
+        1: Stage(
+            placeholder="Type 1 or 2 to continue the training, or ask any question!",
+            # Both 1 and 2 lead to same message
+            choices={
+                "1": Transition(say=(msg3, msg4), to=2),
+                "2": Transition(say=(msg3, msg4), to=2),
+            },
+            otherwise=Transition(hook=answer_question, say=(msg2,)),
+        ),
+        2: Stage(
+            placeholder="Type 1 to continue the training, or ask any question!",
+            choices={"1": Transition(say=(msg5,), to=3)},
+            otherwise=Transition(hook=answer_question, say=(msg4,)),
+        ),
+        3: Stage(
+            placeholder="Type 1 to continue the training, or ask any question!",
+            choices={"1": Transition(say=(msg6,), to=4)},
+            otherwise=Transition(hook=answer_question, say=(msg5,)),
+        ),
+        4: Stage(
+            placeholder="Ask any questions about this training or chat freely!",
+            otherwise=Transition(hook=answer_question),
+        ),
+    },
+)
 
 # -----------------------------
 # MAIN RENDER FUNCTION
 # -----------------------------
 def render(client):
-    tab_name = "Focus on Issues"
-    st.header("Focus on Issues, Not People")
-
-    setup_session_state(tab_name)
-    display_chat_history(tab_name)
-
-    # STAGE 0: Show initial messages
-    if st.session_state.focus_stage == 0:
-        if not any(msg["content"] == msg1 for msg in st.session_state.messages[tab_name] if msg["role"] == "assistant"):
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": msg1})
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": msg2})
-            st.session_state.focus_stage = 1
-            st.rerun()
-
-    # Always show chat input
-    current_instruction = get_stage_instruction(st.session_state.focus_stage)
-    user_input = st.chat_input(current_instruction)
-    
-    if user_input:
-        # Add user message to chat
-        st.session_state.messages[tab_name].append({"role": "user", "content": user_input})
-        
-        # Check if this is expected training response or a question
-        if is_training_response(user_input, st.session_state.focus_stage):
-            # Handle training flow progression
-            if st.session_state.focus_stage == 1:
-                # Both 1 and 2 lead to same message
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg3})
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg4})
-                st.session_state.focus_stage = 2
-                
-            elif st.session_state.focus_stage == 2:
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg5})
-                st.session_state.focus_stage = 3
-                
-            elif st.session_state.focus_stage == 3:
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg6})
-                st.session_state.focus_stage = 4
-        else:
-            # Handle as question/free chat using LLM
-            # Check if we're still in training (stages 1-3) or in free chat (stage 4+)
-            is_during_training = st.session_state.focus_stage < 4
-            response = handle_user_question(client, tab_name, user_input, is_during_training)
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": response})
-            
-            # If we're in training mode, repeat the current training message after answering the question
-            if is_during_training:
-                if st.session_state.focus_stage == 1:
-                    # Repeat the message that expects "1" or "2"
-                    st.session_state.messages[tab_name].append({"role": "assistant", "content": msg2})
-                elif st.session_state.focus_stage == 2:
-                    # Repeat the message that expects "1" to continue
-                    st.session_state.messages[tab_name].append({"role": "assistant", "content": msg4})
-                elif st.session_state.focus_stage == 3:
-                    # Repeat the message that expects "1" to continue
-                    st.session_state.messages[tab_name].append({"role": "assistant", "content": msg5})
-        
-        # Refresh the display
-        st.rerun()
+    run_flow(FLOW, client)
 
 # I edited this file to simplify the prompt structure. Originally, it included three separate prompts that felt redundant and overly complex. 
 # I’ve removed those and replaced them with a single, clear system prompt that does the job effectively. Since this flow doesn’t handle a specific task, the system prompt alone is enough to guide the model’s behavior. 
@@ -15,12 +15,20 @@ import streamlit as st
 import time
 import json
 
+from core.concurrent_streams import aiter_text
+from core.feedback_library import LibraryStage
+from core.flow_engine import Flow, Stage, Transition, free_chat, run_flow, validator
+from core.llm_router import async_route_client
+
 
 # -----------------------------
 # MODEL + SYSTEM PROMPT
 # -----------------------------
 # DEFAULT_MODEL = "ft:gpt-4o-2024-08-06:iml-research:wakeel:BW4oryHJ"
 
+# Max prompt tokens per free-chat call; older turns are folded into a rolling summary.
+CONTEXT_TOKEN_BUDGET = 2500
+
 SYSTEM_PROMPT = """
 You are Zara — a warm, supportive mentor who helps low-income Pakistani women (with limited education and digital exposure) understand how to build small businesses with the support of their families. You guide them through a WhatsApp-style training focused on understanding different perspectives and creating win-win solutions.
 
@@ -86,87 +94,10 @@ msg3_reflection = (
 )
 
 # -----------------------------
-# Session Setup
-# -----------------------------
-def setup_session_state(tab_name: str):
-    # if "openai_model" not in st.session_state:
-    #     st.session_state["openai_model"] = DEFAULT_MODEL
-    if tab_name not in st.session_state.messages:
-        st.session_state.messages[tab_name] = [
-            {"role": "system", "content": SYSTEM_PROMPT}
-        ]
-    if "partner_stage" not in st.session_state:
-        st.session_state.partner_stage = 0
-    if "user_interest" not in st.session_state:
-        st.session_state.user_interest = ""
-    if "partner_interest" not in st.session_state:
-        st.session_state.partner_interest = ""
-
-# -----------------------------
-# Show chat history (only from stage 2+)
-# -----------------------------
-def display_chat_history(tab_name: str):
-    for msg in st.session_state.messages[tab_name]:
-        if msg["role"] != "system":
-            with st.chat_message(msg["role"]):
-                st.markdown(msg["content"])
-
+# Validator prompts (stages 1 and 3)
 # -----------------------------
-# Freeform LLM chat (after rule-based part is done)
-# -----------------------------
-def handle_user_prompt(client, tab_name: str):
-    if prompt := st.chat_input("Chat with Zara (Understanding Partners)"):
-        st.session_state.messages[tab_name].append({"role": "user", "content": prompt})
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        with st.chat_message("assistant"):
-            try:
-                stream = client.chat.completions.create(
-                    model=st.session_state["openai_model"],
-                    messages=st.session_state.messages[tab_name],
-                    stream=True,
-                )
-                response = st.write_stream(stream)
-            except Exception as e:
-                response = f"⚠️ Error: {e}"
-                st.error(response)
-        st.session_state.messages[tab_name].append({"role": "assistant", "content": response})
-
-# -----------------------------
-# MAIN RENDER FUNCTION
-# -----------------------------
-def render(client):
-    tab_name = "Understanding Partners"
-    st.header("Understanding Your Partner's Interests")
-
-    setup_session_state(tab_name)
-    display_chat_history(tab_name)
-
-    # STAGE 0: Ask if they remember a family disagreement
-    if st.session_state.partner_stage == 0:
-        if not any(msg["content"] == msg1 for msg in st.session_state.messages[tab_name] if msg["role"] == "assistant"):
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": msg1})
-            display_chat_history(tab_name)
-
-        user_response = st.chat_input("Type 1 or 2")
-        if user_response:
-            st.session_state.messages[tab_name].append({"role": "user", "content": user_response})
-            if user_response.strip() == "1":
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg2_yes})
-            else:
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg2_no})
-            st.session_state.partner_stage = 1
-            display_chat_history(tab_name)
-
-    # STAGE 1: Collect user's interest
-    elif st.session_state.partner_stage == 1:
-        user_input = st.chat_input("What was important to you?")
-        if user_input:
-            st.session_state.user_interest = user_input
-            st.session_state.messages[tab_name].append({"role": "user", "content": user_input})
-
-            # Prompt that asks for feedback on user's interest
-            system_prompt = """
+# Prompt that asks for feedback on user's interest
+USER_INTEREST_CHECK_PROMPT = """
 You are a communication coach helping users understand their own interests in conflicts.
 
 Your task is to:
@@ -184,65 +115,8 @@ Respond ONLY in JSON format like this:
 {"feedback": "I understand that was important to you!", "is_valid": true}
             """
 
-            try:
-                response = client.chat.completions.create(
-                    model=st.session_state["openai_model"],
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"My interest was: {user_input}"}
-                    ],
-                    stream=False,
-                )
-                raw_feedback = response.choices[0].message.content.strip()
-                result = json.loads(raw_feedback)
-                feedback = result.get("feedback", "Thanks for sharing that.")
-                is_valid = result.get("is_valid", False)
-
-            except Exception as e:
-                feedback = f"⚠️ Error from LLM: {e}"
-                st.error(feedback)
-                feedback = "Thanks for sharing that with me."
-                is_valid = False
-
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": feedback})
-
-            if is_valid:
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg3_partner_intro})
-                st.session_state.partner_stage = 2
-            else:
-                if not st.session_state.get("user_retry", False):
-                    st.session_state.user_retry = True
-                    st.session_state.messages[tab_name].append({
-                        "role": "assistant",
-                        "content": "Can you tell me more about what was really important to you in that situation?"
-                    })
-                else:
-                    st.session_state.messages[tab_name].append({"role": "assistant", "content": msg3_partner_intro})
-                    st.session_state.partner_stage = 2
-
-            display_chat_history(tab_name)
-
-    # STAGE 2: Ask if they can identify partner's interest
-    elif st.session_state.partner_stage == 2:
-        user_response = st.chat_input("Type 1 or 2")
-        if user_response:
-            st.session_state.messages[tab_name].append({"role": "user", "content": user_response})
-            if user_response.strip() == "1":
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": "Great! Please write what you think was important to them."})
-            else:
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": msg4_partner_example})
-            st.session_state.partner_stage = 3
-            display_chat_history(tab_name)
-
-    # STAGE 3: Collect partner's interest
-    elif st.session_state.partner_stage == 3:
-        partner_input = st.chat_input("What do you think was important to them?")
-        if partner_input:
-            st.session_state.partner_interest = partner_input
-            st.session_state.messages[tab_name].append({"role": "user", "content": partner_input})
-
-            # Get LLM feedback on partner interest understanding
-            system_prompt = """
+# Get LLM feedback on partner interest understanding
+PARTNER_INTEREST_CHECK_PROMPT = """
 You are a communication coach helping users understand other people's interests in conflicts.
 
 Your task is to:
@@ -261,35 +135,22 @@ Respond ONLY in JSON format like this:
 {"feedback": "That shows you're really trying to understand their perspective!", "is_valid": true}
             """
 
-            try:
-                response = client.chat.completions.create(
-                    model=st.session_state["openai_model"],
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"I think their interest was: {partner_input}"}
-                    ],
-                    stream=False,
-                )
-                raw_feedback = response.choices[0].message.content.strip()
-                result = json.loads(raw_feedback)
-                feedback = result.get("feedback", "Thanks for thinking about their perspective.")
-                is_valid = result.get("is_valid", False)
-
-            except Exception as e:
-                feedback = f"⚠️ Error from LLM: {e}"
-                st.error(feedback)
-                feedback = "Thanks for thinking about their perspective."
-                is_valid = False
-
-            st.session_state.messages[tab_name].append({"role": "assistant", "content": feedback})
-
-            if is_valid:
-                # Generate final reflection using both interests
-                try:
-                    reflection_prompt = f"""
+# Precomputed feedback for frequent answers to the two interest checks (core/feedback_library.py)
+USER_INTEREST_LIBRARY = LibraryStage("partners_user_interest", inputs=("user_interest",),
+                                     fields=("feedback", "is_valid"), prompt=USER_INTEREST_CHECK_PROMPT)
+PARTNER_INTEREST_LIBRARY = LibraryStage("partners_partner_interest", inputs=("partner_interest",),
+                                        fields=("feedback", "is_valid"), prompt=PARTNER_INTEREST_CHECK_PROMPT)
+
+# -----------------------------
+# Final reflection (after a valid partner interest)
+# -----------------------------
+async def final_reflection(ctx, partner_input: str):
+    # Generate final reflection using both interests
+    try:
+        reflection_prompt = f"""
 The user shared:
-- Their interest: {st.session_state.user_interest}
-- Other person's interest: {st.session_state.partner_interest}
+- Their interest: {ctx.state['user_interest']}
+- Other person's interest: {ctx.state['partner_interest']}
 
 Give them a final reflection that:
 1. Acknowledges both perspectives
@@ -299,41 +160,93 @@ Give them a final reflection that:
 5. MAke them understand the other person perspective that they mentioned what the other persons interest was and how it can help them in the future
 
 Keep it warm, supportive, and under 4 lines.
-                    """
-                    
-                    stream = client.chat.completions.create(
-                        model=st.session_state["openai_model"],
-                        messages=[
-                            {"role": "system", "content": SYSTEM_PROMPT},
-                            {"role": "user", "content": reflection_prompt}
-                        ],
-                        stream=True,
-                    )
-                    final_feedback = st.write_stream(stream)
-                except Exception as e:
-                    final_feedback = f"⚠️ Error from LLM: {e}"
-                    st.error(final_feedback)
-                    final_feedback = msg3_reflection
-
-                st.session_state.messages[tab_name].append({"role": "assistant", "content": final_feedback})
-                st.session_state.partner_stage = 4
-            else:
-                if not st.session_state.get("partner_retry", False):
-                    st.session_state.partner_retry = True
-                    st.session_state.messages[tab_name].append({
-                        "role": "assistant",
-                        "content": "Try to think about what they might have been worried about or what they really needed in that moment."
-                    })
-                else:
-                    # Move on anyway after retry
-                    st.session_state.messages[tab_name].append({"role": "assistant", "content": msg3_reflection})
-                    st.session_state.partner_stage = 4
-
-            display_chat_history(tab_name)
-
-    # STAGE 4+: Open-ended chat
-    elif st.session_state.partner_stage >= 4:
-        handle_user_prompt(client, tab_name)
+        """
+
+        stream = await async_route_client(ctx.client, "reflection").chat.completions.create(
+            model=ctx.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": reflection_prompt}
+            ],
+            stream=True,
+        )
+        ctx.say(await ctx.stream(aiter_text(stream)), shown=True)
+    except Exception as e:
+        ctx.error(f"⚠️ Error from LLM: {e}")
+        ctx.say(msg3_reflection)
+
+final_reflection.texts = (msg3_reflection,)  # fallback above, kept in the flow's content pack
+
+# -----------------------------
+# Conversation script
+# -----------------------------
+# Stage 0: ask if they remember a family disagreement -> 1
+# Stage 1: collect + check the user's interest         -> 2 (one retry if vague)
+# Stage 2: ask if they can name the other's interest   -> 3
+# Stage 3: collect + check the partner's interest      -> 4 with a final reflection (one retry)
+# Stage 4+: open-ended chat
+FLOW = Flow(
+    tab_name="Understanding Partners",
+    header="Understanding Your Partner's Interests",
+    system_prompt=SYSTEM_PROMPT,
+    stage_key="partner_stage",
+    intro=(msg1,),
+    state_defaults={"user_interest": "", "partner_interest": ""},
+    context_budget=CONTEXT_TOKEN_BUDGET,
+    stages={
+        0: Stage(
+            placeholder="Type 1 or 2",
+            choices={"1": Transition(say=(msg2_yes,), to=1)},
+            otherwise=Transition(say=(msg2_no,), to=1),
+        ),
+        1: Stage(
+            placeholder="What was important to you?",
+            store_as="user_interest",
+            otherwise=Transition(hook=validator(
+                USER_INTEREST_CHECK_PROMPT,
+                user_template="My interest was: {text}",
+                default_feedback="Thanks for sharing that.",
+                error_feedback="Thanks for sharing that with me.",
+                on_valid=Transition(say=(msg3_partner_intro,), to=2),
+                on_retry=Transition(say=("Can you tell me more about what was really important to you in that situation?",)),
+                on_give_up=Transition(say=(msg3_partner_intro,), to=2),
+                retry_key="user_retry",
+                library=USER_INTEREST_LIBRARY,
+            )),
+        ),
+        2: Stage(
+            placeholder="Type 1 or 2",
+            choices={"1": Transition(say=("Great! Please write what you think was important to them.",), to=3)},
+            otherwise=Transition(say=(msg4_partner_example,), to=3),
+        ),
+        3: Stage(
+            placeholder="What do you think was important to them?",
+            store_as="partner_interest",
+            otherwise=Transition(hook=validator(
+                PARTNER_INTEREST_CHECK_PROMPT,
+                user_template="I think their interest was: {text}",
+                default_feedback="Thanks for thinking about their perspective.",
+                error_feedback="Thanks for thinking about their perspective.",
+                on_valid=Transition(hook=final_reflection, to=4),
+                on_retry=Transition(say=("Try to think about what they might have been worried about or what they really needed in that moment.",)),
+                # Move on anyway after retry
+                on_give_up=Transition(say=(msg3_reflection,), to=4),
+                retry_key="partner_retry",
+                library=PARTNER_INTEREST_LIBRARY,
+            )),
+        ),
+        4: Stage(
+            placeholder="Chat with Zara (Understanding Partners)",
+            otherwise=Transition(hook=free_chat),
+        ),
+    },
+)
+
+# -----------------------------
+# MAIN RENDER FUNCTION
+# -----------------------------
+def render(client):
+    run_flow(FLOW, client)
 
 
 #In this script, there are two types of prompts used to guide how the AI responds: a general system prompt and specific task prompts. 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""TTL, prompt-version invalidation and eviction in the answer cache (core/answer_cache.py)."""
+
+import numpy as np
+import pytest
+
+from core import answer_cache
+from core.answer_cache import SemanticAnswerCache, prompt_version
+
+V1 = prompt_version("system prompt v1")
+V2 = prompt_version("system prompt v2")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class WordEmbedder:
+    """Bag-of-words vectors over a fixed vocabulary, so paraphrases score by shared words."""
+
+    VOCAB = ("what", "is", "an", "i", "statement", "husband", "says", "no")
+
+    def encode(self, text, normalize_embeddings=True):
+        words = text.split()
+        vector = np.array([words.count(w) for w in self.VOCAB], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, "monotonic", clock)
+    return clock
+
+
+# -----------------------------
+# Exact lookup and TTL
+# -----------------------------
+def test_exact_hit_matches_normalised_question(clock):
+    cache = SemanticAnswerCache()
+    cache.put("Tab", 0, "What is an I-statement?", V1, "An I-statement is...")
+    assert cache.get("Tab", 0, "what is an i statement", V1) == "An I-statement is..."
+    assert cache.get("Tab", 1, "what is an i statement", V1) is None
+    assert cache.counters["hits"] == 1 and cache.counters["misses"] == 1
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    cache.put("Tab", 0, "what is an I-statement", V1, "answer")
+    clock.now += 59
+    assert cache.get("Tab", 0, "what is an I-statement", V1) == "answer"
+    clock.now += 2
+    assert cache.get("Tab", 0, "what is an I-statement", V1) is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_semantic_hit_skips_expired_entry(clock):
+    cache = SemanticAnswerCache(embedder=WordEmbedder(), threshold=0.8, ttl_seconds=60)
+    cache.put("Tab", 0, "what is an I statement", V1, "answer")
+    assert cache.get("Tab", 0, "what is i statement", V1) == "answer"
+    assert cache.counters["semantic_hits"] == 1
+    clock.now += 61
+    assert cache.get("Tab", 0, "what is i statement", V1) is None
+    assert cache.get("Tab", 0, "husband says no", V1) is None
+
+
+# -----------------------------
+# Prompt-version invalidation
+# -----------------------------
+def test_prompt_change_drops_only_that_tab(clock):
+    cache = SemanticAnswerCache()
+    cache.put("Tab", 0, "first question", V1, "old answer")
+    cache.put("Tab", 1, "second question", V1, "old answer")
+    cache.put("Other", 0, "first question", V1, "other answer")
+
+    assert cache.get("Tab", 0, "first question", V2) is None
+    assert cache.get("Tab", 1, "second question", V2) is None
+    assert cache.get("Other", 0, "first question", V1) == "other answer"
+    assert cache.counters["invalidations"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_put_with_new_version_invalidates_before_storing(clock):
+    cache = SemanticAnswerCache()
+    cache.put("Tab", 0, "first question", V1, "old answer")
+    cache.put("Tab", 0, "second question", V2, "new answer")
+    assert cache.get("Tab", 0, "second question", V2) == "new answer"
+    assert cache.get("Tab", 0, "first question", V2) is None
+
+
+# -----------------------------
+# Eviction
+# -----------------------------
+def test_lru_eviction_keeps_recently_used(clock):
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.put("Tab", 0, "one", V1, "1")
+    cache.put("Tab", 0, "two", V1, "2")
+    assert cache.get("Tab", 0, "one", V1) == "1"
+    cache.put("Tab", 0, "three", V1, "3")
+    assert cache.get("Tab", 0, "two", V1) is None
+    assert cache.get("Tab", 0, "one", V1) == "1"
+    assert cache.counters["evictions"] == 1
+
+
+def test_byte_cap_and_empty_answers(clock):
+    cache = SemanticAnswerCache(max_bytes=40)
+    cache.put("Tab", 0, "question", V1, "")
+    assert cache.stats()["entries"] == 0
+    cache.put("Tab", 0, "one", V1, "a" * 30)
+    cache.put("Tab", 0, "two", V1, "b" * 30)
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["bytes"] <= 40
+    assert cache.get("Tab", 0, "two", V1) == "b" * 30
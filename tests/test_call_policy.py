@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""RetryBudget, is_retryable and backoff_delay (core/call_policy.py)."""
+
+import httpx
+import pytest
+
+from core import call_policy
+from core.call_policy import CallPolicy, DeadlineExceeded, RetryBudget, StreamStalled, backoff_delay, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(call_policy.time, "monotonic", clock)
+    return clock
+
+
+def test_budget_starts_full_and_runs_out(clock):
+    budget = RetryBudget(cap=3, minimum_per_second=0)
+    assert [budget.withdraw() for _ in range(4)] == [True, True, True, False]
+    assert budget.stats() == {"tokens": 0, "spent": 3, "refused": 1}
+
+
+def test_calls_earn_a_fraction_of_a_retry(clock):
+    budget = RetryBudget(ratio=0.25, cap=3, minimum_per_second=0)
+    while budget.withdraw():
+        pass
+    for _ in range(3):
+        budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_budget_refills_over_time_up_to_the_cap(clock):
+    budget = RetryBudget(cap=2, minimum_per_second=1.0)
+    while budget.withdraw():
+        pass
+    clock.now += 0.5
+    assert not budget.withdraw()
+    clock.now += 0.5
+    assert budget.withdraw()
+    clock.now += 60
+    assert budget.stats()["tokens"] == 2
+    for _ in range(10):
+        budget.deposit()
+    assert budget.stats()["tokens"] == 2
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("status", [408, 409, 429, 500, 502, 503, 529])
+def test_retryable_statuses(status):
+    assert is_retryable(StatusError(status))
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 413, 422])
+def test_client_errors_are_not_retried(status):
+    assert not is_retryable(StatusError(status))
+
+
+@pytest.mark.parametrize("error", [
+    httpx.ConnectError("refused"),
+    httpx.ReadTimeout("slow"),
+    httpx.ConnectTimeout("slow"),
+    httpx.RemoteProtocolError("closed"),
+    StreamStalled("quiet"),
+])
+def test_transport_errors_are_retried(error):
+    assert is_retryable(error)
+
+
+def test_retryable_by_base_class_name():
+    class APITimeoutError(Exception):
+        pass
+
+    class ProviderTimeout(APITimeoutError):
+        pass
+
+    assert is_retryable(ProviderTimeout())
+
+
+@pytest.mark.parametrize("error", [ValueError("bad"), KeyError("x"), DeadlineExceeded("late")])
+def test_other_errors_are_not_retried(error):
+    assert not is_retryable(error)
+
+
+def test_backoff_is_jittered_within_the_exponential_cap():
+    policy = CallPolicy(deadline=10.0, backoff_base=0.5, backoff_cap=3.0)
+    for retry, ceiling in [(0, 0.5), (1, 1.0), (2, 2.0), (3, 3.0), (8, 3.0)]:
+        delays = [backoff_delay(policy, retry) for _ in range(200)]
+        assert all(0 <= d <= ceiling for d in delays)
+        assert max(delays) > ceiling / 2
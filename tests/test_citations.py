@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Citation normalisation (rag/citations.py)."""
+
+import pytest
+
+from rag.citations import extract_citations
+
+
+@pytest.mark.parametrize("text, keys", [
+    ("2022 SCMR 2123", ["2022 SCMR 2123"]),
+    ("2022 S.C.M.R. 2123", ["2022 SCMR 2123"]),
+    ("2022 scmr 2123", ["2022 SCMR 2123"]),
+    ("PLD 2011 SC 657", ["PLD 2011 SC 657"]),
+    ("P.L.D. 2011 S.C. 657", ["PLD 2011 SC 657"]),
+    ("PLD 2015 Lahore 12", ["PLD 2015 LAH 12"]),
+    ("PLD 2015 Lhr 012", ["PLD 2015 LAH 12"]),
+    ("PLJ 2019 SHC 45", ["PLJ 2019 KAR 45"]),
+    ("C.P. 1418/2023", ["CP 1418/2023"]),
+    ("C.P. No. 1418 of 2023", ["CP 1418/2023"]),
+    ("Civil Petition No. 0077/2020", ["CP 77/2020"]),
+])
+def test_variants_normalise_to_one_key(text, keys):
+    assert extract_citations(text) == keys
+
+
+def test_keys_come_in_order_of_appearance_without_duplicates():
+    text = "Compare C.P. 12/2020 with 2019 CLC 88, then 2019 C.L.C. 88 and PLD 2011 SC 657."
+    assert extract_citations(text) == ["CP 12/2020", "2019 CLC 88", "PLD 2011 SC 657"]
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "What does the court say about khula?",
+    "In 2022 the Supreme Court decided 12 cases.",
+    "PLD SC 657",
+    "SCMR 2022",
+])
+def test_text_without_a_citation(text):
+    assert extract_citations(text) == []
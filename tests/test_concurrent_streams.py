@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stream buffers, cancellation and stage timings (core/concurrent_streams.py)."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from core.concurrent_streams import (StreamCancelled, record_stage_timing, start_stream, start_structured_stream,
+                                     timing_summary)
+from core.telemetry import get_telemetry
+
+
+def chunk(text: str, finish_reason=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason)])
+
+
+def fake_stream(pieces, stall: asyncio.Event = None):
+    """A coroutine returning an async completion stream; waits on `stall` after the pieces, if given."""
+    async def create():
+        async def stream():
+            for piece in pieces:
+                yield chunk(piece)
+                await asyncio.sleep(0)
+            if stall is not None:
+                await stall.wait()
+        return stream()
+    return create
+
+
+async def read(buffer) -> str:
+    return "".join([text async for text in buffer])
+
+
+# -----------------------------
+# Buffers
+# -----------------------------
+def test_stream_buffer_collects_text():
+    async def run():
+        buffer = start_stream(fake_stream(["Hello", ", ", "world"]))
+        return await read(buffer), buffer.finished is not None
+    assert asyncio.run(run()) == ("Hello, world", True)
+
+
+def test_structured_stream_splits_fields():
+    async def run():
+        feedback, reflection = start_structured_stream(
+            fake_stream(['{"feedback": "Good', ' start", ', '"reflection": "Well done"}']), ("feedback", "reflection"))
+        return await read(feedback), await read(reflection)
+    assert asyncio.run(run()) == ("Good start", "Well done")
+
+
+# -----------------------------
+# Cancellation
+# -----------------------------
+def test_cancelled_stream_closes_its_buffer():
+    async def run():
+        buffer = start_stream(fake_stream(["partial"], stall=asyncio.Event()))
+        await asyncio.sleep(0.01)
+        buffer.cancel()
+        with pytest.raises(StreamCancelled):
+            await asyncio.wait_for(read(buffer), 1)
+        return buffer.finished is not None
+    assert asyncio.run(run())
+
+
+def test_cancelling_one_field_of_a_merged_request_closes_the_other():
+    async def run():
+        feedback, reflection = start_structured_stream(
+            fake_stream(['{"feedback": "Good'], stall=asyncio.Event()), ("feedback", "reflection"))
+        await asyncio.sleep(0.01)
+        feedback.cancel()
+        for buffer in (feedback, reflection):
+            with pytest.raises(StreamCancelled):
+                await asyncio.wait_for(read(buffer), 1)
+    asyncio.run(run())
+
+
+# -----------------------------
+# Timings
+# -----------------------------
+def test_stage_timing_is_published():
+    async def run():
+        buffers = [start_stream(fake_stream(["a"])), start_stream(fake_stream(["b"]))]
+        for buffer in buffers:
+            await read(buffer)
+        return buffers
+    buffers = asyncio.run(run())
+    buffers[0].started -= 0.5
+    buffers[1].started -= 0.5
+    wall_started = min(b.started for b in buffers)
+    timing = record_stage_timing("test_stage", "parallel", wall_started, buffers)
+
+    assert timing["saved_seconds"] == pytest.approx(timing["sequential_seconds"] - timing["wall_seconds"], abs=0.002)
+    assert timing["saved_seconds"] >= 0.4
+    assert timing_summary("test_stage")["count"] >= 1
+    assert 'zara_stage_saved_seconds_count{mode="parallel",stage="test_stage"}' in get_telemetry().metrics.render()
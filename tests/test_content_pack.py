@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Content packs and MessageLog persistence records (core/content_pack.py)."""
+
+import json
+
+import pytest
+
+from core.content_pack import MISSING_TEXT, ContentPack, MessageLog, text_ref
+
+PROMPT = "You are a communication coach."
+INTRO = "Welcome! Let's practise I-statements."
+REPLY = "Great, now try the second half."
+
+TRANSCRIPT = [
+    {"role": "system", "content": PROMPT},
+    {"role": "assistant", "content": INTRO},
+    {"role": "user", "content": "I feel ignored when you are late."},
+    {"role": "assistant", "content": REPLY},
+    {"role": "user", "content": INTRO},
+    {"role": "assistant", "content": "A reply only this session has."},
+]
+
+
+@pytest.fixture
+def pack():
+    return ContentPack("Tab", [PROMPT, INTRO, REPLY, INTRO])
+
+
+def restore(pack, records) -> MessageLog:
+    log = MessageLog(pack)
+    for record in records:
+        log.append_record(record)
+    return log
+
+
+# -----------------------------
+# ContentPack
+# -----------------------------
+def test_pack_dedupes_and_versions_by_content(pack):
+    assert len(pack) == 3
+    assert pack.index(INTRO) == 1 and pack.index("unknown") is None
+    assert pack.resolve(text_ref(REPLY)) == 2
+    assert ContentPack("Other", [PROMPT, INTRO, REPLY]).version == pack.version
+    assert ContentPack("Tab", [PROMPT, INTRO, REPLY + "!"]).version != pack.version
+
+
+# -----------------------------
+# MessageLog
+# -----------------------------
+def test_log_reads_like_a_list(pack):
+    log = MessageLog(pack, TRANSCRIPT)
+    assert log == TRANSCRIPT
+    assert log[-1] == TRANSCRIPT[-1] and log[1:3] == TRANSCRIPT[1:3]
+    assert log + [{"role": "user", "content": "x"}] == TRANSCRIPT + [{"role": "user", "content": "x"}]
+    with pytest.raises(IndexError):
+        log[len(TRANSCRIPT)]
+
+
+def test_records_reference_scripted_text_and_keep_own_text(pack):
+    log = MessageLog(pack, TRANSCRIPT)
+    records = [log.record(i) for i in range(len(log))]
+    assert records[1] == {"role": "assistant", "ref": text_ref(INTRO)}
+    assert records[2] == {"role": "user", "content": "I feel ignored when you are late."}
+    # a user typing a scripted text is still stored by reference
+    assert records[4] == {"role": "user", "ref": text_ref(INTRO)}
+    assert records[5] == {"role": "assistant", "content": "A reply only this session has."}
+
+
+def test_record_round_trip_through_json(pack):
+    log = MessageLog(pack, TRANSCRIPT)
+    stored = json.loads(json.dumps([log.record(i) for i in range(len(log))]))
+    restored = restore(pack, stored)
+    assert restored == log
+    assert [restored.record(i) for i in range(len(restored))] == stored
+
+
+def test_round_trip_after_script_edit(pack):
+    log = MessageLog(pack, TRANSCRIPT)
+    stored = [log.record(i) for i in range(len(log))]
+    edited = ContentPack("Tab", [PROMPT, INTRO, "Great, now try the other half."])
+    restored = restore(edited, stored)
+    assert restored[3] == {"role": "assistant", "content": MISSING_TEXT}
+    assert restored[1] == TRANSCRIPT[1] and restored[2] == TRANSCRIPT[2]
+
+
+def test_nbytes_counts_only_session_text(pack):
+    scripted = MessageLog(pack, TRANSCRIPT[:2])
+    own = MessageLog(pack, TRANSCRIPT[:2] + [{"role": "user", "content": "x" * 1000}])
+    assert own.nbytes() - scripted.nbytes() >= 1000
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""fit_messages budget fitting and the rolling summary (core/context_budget.py)."""
+
+import threading
+
+from core.context_budget import MIN_RECENT_MESSAGES, count_message_tokens, fit_messages, summary_record
+
+SYSTEM = {"role": "system", "content": "You are Zara."}
+
+
+def history(turns: int, words: int = 50) -> list:
+    return [SYSTEM] + [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words}
+                       for i in range(turns)]
+
+
+def cost(messages) -> int:
+    return sum(count_message_tokens(m) for m in messages)
+
+
+class Summarizer:
+    """Records its calls; blocks until `release` is set."""
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = fail
+
+    def __call__(self, previous: str, messages: list) -> str:
+        self.calls.append((previous, [m["content"].split()[1] for m in messages]))
+        self.started.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("summary failed")
+        return f"summary {len(self.calls)}"
+
+
+def settle(state: dict, tab: str = "Tab"):
+    future = state["context_state"][tab]["pending"]
+    if future is not None:
+        future.exception(timeout=5)
+
+
+def test_short_history_is_sent_whole():
+    messages = history(4)
+    assert fit_messages("Tab", messages, token_budget=10_000, state={}) == messages
+
+
+def test_long_history_keeps_system_and_recent_turns_within_budget():
+    messages = history(40)
+    budget = cost(messages) // 3
+    fitted = fit_messages("Tab", messages, token_budget=budget, state={})
+    assert fitted[0] == SYSTEM and fitted[-1] == messages[-1]
+    assert fitted[1:] == messages[-(len(fitted) - 1):]
+    assert cost(fitted) <= budget
+    assert len(fitted) - 1 >= MIN_RECENT_MESSAGES
+
+
+def test_recent_turns_are_kept_even_over_budget():
+    messages = history(20, words=500)
+    fitted = fit_messages("Tab", messages, token_budget=10, state={})
+    assert fitted == [SYSTEM] + messages[-MIN_RECENT_MESSAGES:]
+
+
+def test_dropped_turns_are_summarised_in_the_background():
+    messages, state, summarizer = history(40), {}, Summarizer()
+    budget = cost(messages) // 3
+    fitted = fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    dropped = len(messages) - len(fitted)
+    settle(state)
+    assert summarizer.calls == [("", [str(i) for i in range(dropped)])]
+
+    fitted = fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    assert fitted[1] == {"role": "system", "content": "Summary of the earlier conversation:\nsummary 1"}
+    assert cost(fitted) <= budget
+    assert summary_record(state["context_state"]["Tab"])["summarized_upto"] == dropped
+
+
+def test_next_summary_folds_only_new_turns_into_the_previous_one():
+    state, summarizer = {}, Summarizer()
+    messages = history(40)
+    budget = cost(messages) // 3
+    fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    settle(state)
+    first_upto = summary_record(state["context_state"]["Tab"])["summarized_upto"]
+    messages = history(60)
+    fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    settle(state)
+    previous, turns = summarizer.calls[1]
+    assert previous == "summary 1" and turns[0] == str(first_upto)
+
+
+def test_turn_does_not_wait_for_a_pending_summary():
+    state, summarizer = {}, Summarizer()
+    summarizer.release.clear()
+    messages = history(40)
+    budget = cost(messages) // 3
+    fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    assert summarizer.started.wait(5)
+    fitted = fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    assert len(summarizer.calls) == 1, "submitted again while the first was running"
+    assert all("Summary of the earlier" not in m["content"] for m in fitted)
+    assert summary_record(state["context_state"]["Tab"]) == {"summary": "", "summarized_upto": 0}
+    summarizer.release.set()
+    settle(state)
+
+
+def test_failed_summary_keeps_the_previous_one_and_is_retried():
+    state, summarizer = {}, Summarizer(fail=True)
+    messages = history(40)
+    budget = cost(messages) // 3
+    fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    settle(state)
+    fit_messages("Tab", messages, summarizer, token_budget=budget, state=state)
+    settle(state)
+    assert len(summarizer.calls) == 2
+    assert state["context_state"]["Tab"]["summary"] == ""
+
+
+def test_tabs_have_separate_summaries():
+    state, summarizer = {}, Summarizer()
+    messages = history(40)
+    budget = cost(messages) // 3
+    for tab in ("A", "B"):
+        fit_messages(tab, messages, summarizer, token_budget=budget, state=state)
+        settle(state, tab)
+    assert set(state["context_state"]) == {"A", "B"} and len(summarizer.calls) == 2
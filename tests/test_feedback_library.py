@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""consult, within_slo and the validator's use of library entries (core/feedback_library.py)."""
+
+import asyncio
+import dataclasses
+
+import pytest
+
+from core import feedback_library
+from core.feedback_library import (FALLBACK_SIMILARITY, MATCH_SIMILARITY, FeedbackLibrary, LibraryStage, SLOExceeded,
+                                   consult, within_slo)
+from core.flow_engine import Transition, validator
+
+VALIDATOR = LibraryStage("check", inputs=("answer",), fields=("feedback", "is_valid"), prompt="p")
+REFLECTION = LibraryStage("reflect", inputs=("answer",), fields=("feedback", "reflection"), prompt="p", slo=1.0)
+ENTRY = {"text": "i feel upset", "fields": {"feedback": "Nice I-statement!", "is_valid": True}}
+
+
+@pytest.fixture
+def library(monkeypatch):
+    library = FeedbackLibrary()
+    library.result = (None, 0.0, False)
+    library.best = lambda stage, values: library.result
+    monkeypatch.setattr(feedback_library, "get_feedback_library", lambda: library)
+    monkeypatch.setattr(feedback_library, "expected_latency", lambda client, route: None)
+    return library
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+# -----------------------------
+# consult
+# -----------------------------
+def test_miss(library):
+    library.result = (ENTRY, FALLBACK_SIMILARITY - 0.01, False)
+    assert run(consult(VALIDATOR, ("x",), None)) == (None, False)
+    assert library.counters[("check", "miss")] == 1
+
+
+def test_exact_match_serves_the_decision(library):
+    library.result = (ENTRY, 1.0, True)
+    entry, serve_now = run(consult(VALIDATOR, ("I feel upset",), None))
+    assert serve_now and entry["fields"] == ENTRY["fields"]
+
+
+def test_near_match_is_served_without_the_decision(library):
+    library.result = (ENTRY, MATCH_SIMILARITY + 0.01, False)
+    entry, serve_now = run(consult(VALIDATOR, ("I feel a bit upset",), None))
+    assert serve_now
+    assert entry["fields"] == {"feedback": "Nice I-statement!"}
+    assert ENTRY["fields"]["is_valid"] is True  # the library's own entry is untouched
+
+
+def test_looser_match_is_a_fallback(library):
+    library.result = (ENTRY, FALLBACK_SIMILARITY + 0.01, False)
+    entry, serve_now = run(consult(VALIDATOR, ("x",), None))
+    assert not serve_now and entry["fields"] == {"feedback": "Nice I-statement!"}
+
+
+def test_stages_without_decisions_keep_every_field(library):
+    entry_ = {"text": "t", "fields": {"feedback": "f", "reflection": "r"}}
+    library.result = (entry_, MATCH_SIMILARITY + 0.01, False)
+    assert run(consult(REFLECTION, ("x",), None)) == (entry_, True)
+
+
+def test_predicted_slo_miss_is_trusted_only_after_a_recent_lost_race(library, monkeypatch):
+    monkeypatch.setattr(feedback_library, "expected_latency", lambda client, route: 5.0)
+    library.result = (ENTRY, FALLBACK_SIMILARITY + 0.01, False)
+    assert run(consult(REFLECTION, ("x",), None))[1] is False   # no race yet: go live
+    library.count(REFLECTION, "slo_exceeded")
+    assert run(consult(REFLECTION, ("x",), None))[1] is True    # lost just now: serve at once
+    library.count(REFLECTION, "live")
+    assert run(consult(REFLECTION, ("x",), None))[1] is False   # the route recovered
+    library.count(REFLECTION, "slo_exceeded")
+    monkeypatch.setattr(feedback_library, "PROBE_SECONDS", 0.0)
+    assert run(consult(REFLECTION, ("x",), None))[1] is False   # stale: probe with a live call
+
+
+# -----------------------------
+# within_slo
+# -----------------------------
+async def chunks(*items, first_delay=0.0):
+    await asyncio.sleep(first_delay)
+    for item in items:
+        yield item
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_within_slo_passes_a_fast_stream_through():
+    assert run(collect(within_slo(chunks("a", "b", "c"), 1.0))) == ["a", "b", "c"]
+
+
+def test_within_slo_raises_when_the_first_item_is_late():
+    with pytest.raises(SLOExceeded):
+        run(collect(within_slo(chunks("a", first_delay=0.2), 0.05)))
+
+
+def test_within_slo_only_times_the_first_item():
+    async def slow_after_first():
+        yield "a"
+        await asyncio.sleep(0.1)
+        yield "b"
+    assert run(collect(within_slo(slow_after_first(), 0.05))) == ["a", "b"]
+
+
+def test_within_slo_empty_stream():
+    assert run(collect(within_slo(chunks(), 1.0))) == []
+
+
+# -----------------------------
+# Validator hook
+# -----------------------------
+class Ctx:
+    def __init__(self):
+        self.state = {"answer": "I feel a bit upset"}
+        self.said = []
+        self.client = None
+        self.model = "m"
+
+    def say(self, content, shown=False):
+        self.said.append(content)
+
+    async def stream(self, chunks) -> str:
+        return "".join([text async for text in chunks])
+
+    def error(self, message):
+        pass
+
+
+VALID, RETRY, GIVE_UP = Transition(to=2), Transition(say=("again",)), Transition(to=2, say=("moving on",))
+
+
+def make_hook(stage: LibraryStage = VALIDATOR):
+    return validator("prompt", "{text}", "default", "error", VALID, RETRY, GIVE_UP, "retried", library=stage)
+
+
+def test_borrowed_feedback_keeps_the_stage_then_gives_up(library):
+    library.result = (ENTRY, MATCH_SIMILARITY + 0.01, False)
+    hook, ctx = make_hook(), Ctx()
+    assert run(hook(ctx, "I feel a bit upset")) is None
+    assert ctx.said == ["Nice I-statement!"] and ctx.state["retried"]
+    assert run(hook(ctx, "I feel a bit upset")) is GIVE_UP
+
+
+def test_exact_match_decides(library):
+    library.result = (ENTRY, 1.0, True)
+    assert run(make_hook()(Ctx(), "I feel upset")) is VALID
+
+
+def test_slo_miss_serves_the_fallback_without_deciding(library, monkeypatch):
+    async def slow_validator(client, model, prompt, user_content, write_stream):
+        return await write_stream(chunks("late", first_delay=0.2))
+
+    monkeypatch.setattr("core.flow_engine.astream_cached_validator", slow_validator)
+    library.result = (ENTRY, FALLBACK_SIMILARITY + 0.01, False)
+    ctx = Ctx()
+    assert run(make_hook(dataclasses.replace(VALIDATOR, slo=0.05))(ctx, "x")) is None
+    assert ctx.said == ["Nice I-statement!"]
+    assert library.counters[("check", "slo_exceeded")] == 1
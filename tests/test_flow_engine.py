@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Flow compilation, dispatch and background-job turns (core/flow_engine.py)."""
+
+import asyncio
+
+import pytest
+
+from core.flow_engine import CompiledFlow, Flow, JobTurn, Stage, Transition, compile_flow, rerun_stats
+from tabs import TABS, load_tab
+
+
+class Ctx:
+    """A turn context over plain dicts, like the channel's."""
+
+    def __init__(self, flow: Flow, stage: int):
+        self.flow = flow
+        self.tab_name = flow.tab_name
+        self.state = {flow.stage_key: stage}
+        self.messages = [{"role": "system", "content": flow.system_prompt}]
+
+    @property
+    def stage(self) -> int:
+        return self.state[self.flow.stage_key]
+
+    @stage.setter
+    def stage(self, value: int):
+        self.state[self.flow.stage_key] = value
+
+    def say(self, content, role="assistant", shown=False):
+        self.messages.append({"role": role, "content": content})
+
+    def said(self) -> list:
+        return [(m["role"], m["content"]) for m in self.messages[1:]]
+
+
+async def check(ctx, text):
+    ctx.say(f"checked {text}")
+    ctx.state["checked"] = text
+    return Transition(say=("follow-up",), to=3) if text == "good" else None
+
+check.state_keys = ("checked",)
+
+
+def make_flow(**stages) -> Flow:
+    return Flow(
+        tab_name="Test", header="Test", system_prompt="system", stage_key="stage",
+        state_defaults={"answer": ""},
+        stages=stages or {
+            1: Stage(placeholder="1 or 2", choices={"1": Transition(say=("one",), to=2), "Yes": Transition(to=3)},
+                     otherwise=Transition(say=("pardon?",))),
+            2: Stage(placeholder="write", store_as="answer", otherwise=Transition(hook=check, say=("after hook",))),
+            3: Stage(placeholder="free chat"),
+        },
+    )
+
+
+def test_compiled_state_keys():
+    compiled = CompiledFlow(make_flow())
+    assert compiled.state_keys == ("answer", "checked", "stage")
+    assert compiled.final_stage == 3
+
+
+def test_unknown_target_stage_is_rejected():
+    with pytest.raises(ValueError, match="unknown stage 9"):
+        CompiledFlow(make_flow(**{"1": Stage(placeholder="", otherwise=Transition(to=9))}))
+
+
+def test_flow_without_stages_is_rejected():
+    with pytest.raises(ValueError):
+        CompiledFlow(Flow(tab_name="Empty", header="", system_prompt="", stage_key="s", stages={}))
+
+
+@pytest.mark.parametrize("text, expected", [("1", "one"), (" 1 ", "one"), ("yes", None), ("YES ", None), ("what?", "pardon?")])
+def test_choices_are_matched_on_the_normalised_answer(text, expected):
+    transition = CompiledFlow(make_flow()).transition_for(1, text)
+    assert (transition.say[0] if transition.say else None) == expected
+
+
+def test_stages_past_the_last_stay_in_it():
+    compiled = CompiledFlow(make_flow())
+    assert compiled.lookup(7) is compiled.lookup(3)
+
+
+def test_scripted_dispatch():
+    compiled = CompiledFlow(make_flow())
+    ctx = Ctx(compiled.flow, 1)
+    compiled.dispatch(ctx, "1")
+    assert ctx.said() == [("user", "1"), ("assistant", "one")] and ctx.stage == 2
+
+
+def test_unmatched_answer_keeps_the_stage():
+    compiled = CompiledFlow(make_flow())
+    ctx = Ctx(compiled.flow, 1)
+    compiled.dispatch(ctx, "something else")
+    assert ctx.said() == [("user", "something else"), ("assistant", "pardon?")] and ctx.stage == 1
+
+
+def test_hook_turn_must_be_awaited():
+    compiled = CompiledFlow(make_flow())
+    assert compiled.needs_job(2, "anything") and not compiled.needs_job(1, "1")
+    with pytest.raises(ValueError, match="adispatch"):
+        compiled.dispatch(Ctx(compiled.flow, 2), "anything")
+
+
+def test_adispatch_runs_the_hook_then_its_follow_up():
+    compiled = CompiledFlow(make_flow())
+    ctx = Ctx(compiled.flow, 2)
+    asyncio.run(compiled.adispatch(ctx, "good"))
+    assert ctx.said() == [("user", "good"), ("assistant", "checked good"), ("assistant", "after hook"),
+                          ("assistant", "follow-up")]
+    assert ctx.state == {"stage": 3, "answer": "good", "checked": "good"}
+
+
+def test_adispatch_without_follow_up_keeps_the_stage():
+    compiled = CompiledFlow(make_flow())
+    ctx = Ctx(compiled.flow, 2)
+    asyncio.run(compiled.adispatch(ctx, "meh"))
+    assert ctx.stage == 2 and ctx.said()[-1] == ("assistant", "after hook")
+
+
+def test_job_turn_changes_the_session_only_on_apply():
+    compiled = CompiledFlow(make_flow())
+    session = {"openai_model": "m", "stage": 2, "answer": "", "unrelated": 1,
+               "messages": {"Test": [{"role": "system", "content": "system"}]}}
+    turn = JobTurn(compiled, None, session)
+    asyncio.run(compiled.adispatch(turn, "good"))
+    assert session["stage"] == 2 and len(session["messages"]["Test"]) == 1
+    turn.apply(session)
+    assert session["stage"] == 3 and session["answer"] == "good" and session["checked"] == "good"
+    assert [m["content"] for m in session["messages"]["Test"]][1:] == ["good", "checked good", "after hook", "follow-up"]
+    assert session["unrelated"] == 1
+
+
+def test_job_turn_stream_collects_and_clears_live_text():
+    turn = JobTurn(CompiledFlow(make_flow()), None, {"openai_model": "m", "stage": 1, "messages": {"Test": []}})
+    seen = []
+
+    async def chunks():
+        for text in ("a", "b"):
+            yield text
+            seen.append(turn.live)
+
+    assert asyncio.run(turn.stream(chunks())) == "ab"
+    assert seen == ["a", "ab"] and turn.live is None
+
+
+def test_rerun_stats_leave_out_poll_reruns():
+    state = {"_flow_stats": {"runs": 9, "turns": 2, "waits": 5}}
+    assert rerun_stats(state) == {"runs": 9, "turns": 2, "waits": 5, "runs_per_turn": 2.0, "waits_per_turn": 2.5}
+    assert rerun_stats({"_flow_stats": {"runs": 3, "turns": 0}})["runs_per_turn"] is None
+
+
+@pytest.mark.parametrize("tab", TABS, ids=lambda tab: tab.module)
+def test_every_tab_compiles(tab):
+    compiled = compile_flow(load_tab(tab.label).FLOW)
+    assert compile_flow(load_tab(tab.label).FLOW) is compiled
+    assert compiled.flow.stage_key in compiled.state_keys
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Provider selection and failover in the LLM router (core/llm_router.py)."""
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from core.llm_router import GROQ_FAST_MODEL, OPENAI_FAST_MODEL, LLMRouter
+
+SCHEMA = {"type": "json_schema", "json_schema": {"name": "check", "schema": {"type": "object"}}}
+
+
+def completion(text: str, model: str):
+    message = SimpleNamespace(content=text)
+    return SimpleNamespace(id="cmpl", model=model, usage=None,
+                           choices=[SimpleNamespace(message=message, finish_reason="stop")])
+
+
+class FakeProvider:
+    """SDK-shaped client that records each request and answers with its provider name, or raises `error`."""
+
+    def __init__(self, name: str, error: Exception = None):
+        self.name = name
+        self.error = error
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        if self.error is not None:
+            raise self.error
+        return completion(f"from {self.name}", kwargs["model"])
+
+
+class AsyncFakeProvider(FakeProvider):
+    async def create(self, **kwargs):
+        return FakeProvider.create(self, **kwargs)
+
+
+class FakeGateway:
+    """The gateway interface the router uses, with a provider configured only when it has a key."""
+
+    def __init__(self, openai_key: str = "sk-test", groq_key: str = "", groq_error: Exception = None):
+        self.keys = {"openai": openai_key, "groq": groq_key}
+        self.clients = {"openai": FakeProvider("openai"), "groq": FakeProvider("groq", groq_error)}
+        self.async_clients = {"openai": AsyncFakeProvider("openai"), "groq": AsyncFakeProvider("groq", groq_error)}
+
+    def has_provider(self, provider: str) -> bool:
+        return bool(self.keys.get(provider))
+
+    def client(self, provider: str):
+        assert self.has_provider(provider), f"{provider} called without a key"
+        return self.clients[provider]
+
+    def async_client(self, provider: str):
+        assert self.has_provider(provider), f"{provider} called without a key"
+        return self.async_clients[provider]
+
+
+def ask(router, route: str, **kwargs):
+    return router.create(route, model="gpt-5", messages=[{"role": "user", "content": "hi"}], **kwargs)
+
+
+# -----------------------------
+# Without GROQ_API_KEY
+# -----------------------------
+@pytest.mark.parametrize("route, model", [
+    ("validation", OPENAI_FAST_MODEL),
+    ("summary", OPENAI_FAST_MODEL),
+    ("chat", "gpt-5"),
+    ("reflection", "gpt-5"),
+])
+def test_every_route_uses_openai_without_groq_key(route, model):
+    gateway = FakeGateway()
+    router = LLMRouter(gateway)
+    response = ask(router, route)
+    assert response.choices[0].message.content == "from openai"
+    assert [r["model"] for r in gateway.clients["openai"].requests] == [model]
+    assert gateway.clients["groq"].requests == []
+    assert router.stats()[f"{route}/openai"]["failovers"] == 0
+
+
+def test_async_route_uses_openai_without_groq_key():
+    gateway = FakeGateway()
+    client = LLMRouter(gateway).route_async("validation")
+    response = asyncio.run(client.chat.completions.create(model="gpt-5", messages=[]))
+    assert response.choices[0].message.content == "from openai"
+    assert gateway.async_clients["openai"].requests[0]["model"] == OPENAI_FAST_MODEL
+
+
+def test_no_provider_at_all_is_an_error():
+    with pytest.raises(ValueError, match="No provider"):
+        ask(LLMRouter(FakeGateway(openai_key="")), "chat")
+
+
+# -----------------------------
+# With GROQ_API_KEY
+# -----------------------------
+def test_validation_prefers_groq_when_configured():
+    gateway = FakeGateway(groq_key="gsk-test")
+    response = ask(LLMRouter(gateway), "validation")
+    assert response.choices[0].message.content == "from groq"
+    assert gateway.clients["groq"].requests[0]["model"] == GROQ_FAST_MODEL
+    assert gateway.clients["openai"].requests == []
+
+
+def test_groq_failure_fails_over_to_openai():
+    gateway = FakeGateway(groq_key="gsk-test", groq_error=httpx.ConnectError("refused"))
+    router = LLMRouter(gateway)
+    response = ask(router, "validation")
+    assert response.choices[0].message.content == "from openai"
+    stats = router.stats()
+    assert stats["validation/groq"]["errors"] == 1
+    assert stats["validation/openai"]["failovers"] == 1
+
+
+def test_groq_structured_stream_is_sent_whole():
+    gateway = FakeGateway(groq_key="gsk-test")
+    stream = ask(LLMRouter(gateway), "validation", stream=True, response_format=SCHEMA)
+    chunks = list(stream)
+    assert gateway.clients["groq"].requests[0]["stream"] is False
+    assert [c.choices[0].delta.content for c in chunks] == ["from groq"]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Metadata filters and reciprocal rank fusion in the hybrid retriever (rag/retriever.py)."""
+
+import pytest
+
+from rag import retriever
+from rag.corpus import Chunk
+from rag.retriever import HybridRetriever, infer_filters
+
+CHUNKS = [
+    Chunk("c0", "Child Custody and Guardianship", "Ayesha v. Bilal (LHC 2019)",
+          "Custody of the minor was given to the mother under the welfare of the minor principle."),
+    Chunk("c1", "Child Custody and Guardianship", "Sana v. Kamran (SC 2021)",
+          "The father sought custody and visitation; welfare of the minor remained paramount."),
+    Chunk("c2", "Marriage and Divorce", "Rukhsana v. Tariq (LHC 2021)",
+          "Khula was granted after the wife returned the dower and reconciliation failed."),
+    Chunk("c3", "Inheritance and Succession", "Estate of Qadir (SHC 2015)",
+          "The daughters' inheritance share was protected against the brothers' claim."),
+    Chunk("c4", "Marriage and Divorce", "Nadia v. Imran (SC 2010)",
+          "Maintenance was awarded to the wife during the iddat period after divorce."),
+]
+
+
+class FakeVectorIndex:
+    """Dense ranking fixed by the test: `order` lists chunk ids best first."""
+
+    model_name = "fake-model"
+
+    def __init__(self, order, fail=False):
+        self.order = order
+        self.fail = fail
+        self.row_of = {chunk.id: row for row, chunk in enumerate(CHUNKS)}
+        self.rows_seen = None
+
+    def search(self, vector, top_k, rows=None):
+        if self.fail:
+            raise RuntimeError("index unavailable")
+        self.rows_seen = rows
+        ranked = [self.row_of[i] for i in self.order if rows is None or self.row_of[i] in rows]
+        return [(1.0 - 0.1 * rank, CHUNKS[row]) for rank, row in enumerate(ranked[:top_k])]
+
+
+@pytest.fixture(autouse=True)
+def no_embedder(monkeypatch):
+    monkeypatch.setattr(retriever, "_query_vector", lambda model_name, query: None)
+
+
+def ids(passages):
+    return [p.chunk.id for p in passages]
+
+
+# -----------------------------
+# Filters
+# -----------------------------
+def test_candidates_combine_court_topic_and_years():
+    search = HybridRetriever(CHUNKS)
+    assert search.candidates() is None
+    assert search.candidates(court="lhc") == {0, 2}
+    assert search.candidates(court={"SC", "SHC"}, topic="marriage") == {4}
+    assert search.candidates(topic="Marriage and Divorce", year_from=2015) == {2}
+    assert search.candidates(year_from=2015, year_to=2019) == {0, 3}
+
+
+def test_filters_restrict_both_rankings():
+    dense = FakeVectorIndex(["c1", "c0", "c2"])
+    results = HybridRetriever(CHUNKS, dense).search("custody welfare of the minor", top_k=3, court="LHC")
+    assert ids(results) == ["c0", "c2"]   # c2 comes from the dense ranking alone; c1 is not in LHC
+    assert dense.rows_seen == [0, 2]
+
+
+def test_filters_that_match_nothing_return_nothing():
+    dense = FakeVectorIndex(["c0"])
+    assert HybridRetriever(CHUNKS, dense).search("custody", court="FSC") == []
+    assert dense.rows_seen is None
+
+
+def test_infer_filters_from_question():
+    assert infer_filters("Lahore High Court custody cases from 2019") == \
+        {"court": {"LHC"}, "year_from": 2019, "year_to": 2019}
+    assert infer_filters("SC or SHC rulings between 2010 and 2015") == {"court": {"SC", "SHC"}}
+    assert infer_filters("what is khula") == {}
+
+
+# -----------------------------
+# Fusion
+# -----------------------------
+def test_rrf_rewards_agreement_between_rankers():
+    search = HybridRetriever(CHUNKS, FakeVectorIndex(["c1", "c3", "c0"]), rrf_k=60)
+    bm25_ranked = [row for row, _ in search.bm25.top_k("custody welfare of the minor", 10)]
+    results = search.search("custody welfare of the minor", top_k=3)
+
+    top = results[0]
+    expected = 1 / (60 + bm25_ranked.index(1) + 1) + 1 / (60 + 1)
+    assert top.chunk.id == "c1" and top.score == pytest.approx(expected)
+    assert top.bm25 > 0 and top.dense == pytest.approx(1.0)
+    # c3 is only in the dense ranking; c0 is high in both and beats it
+    assert ids(results).index("c0") < ids(results).index("c3")
+    assert [p.score for p in results] == sorted((p.score for p in results), reverse=True)
+
+
+def test_dense_failure_falls_back_to_bm25():
+    search = HybridRetriever(CHUNKS, FakeVectorIndex(["c3"], fail=True))
+    results = search.search("khula dower", top_k=2)
+    assert ids(results) == ["c2"]
+    assert results[0].dense == 0.0 and results[0].score == pytest.approx(1 / 61)
+    assert results[0].coverage == pytest.approx(1.0)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Eviction, rehydration and their races in SessionMemoryManager (core/session_memory.py)."""
+
+import os
+import threading
+
+import pytest
+
+from core import session_memory
+from core.content_pack import ContentPack, MessageLog
+from core.session_memory import SessionMemoryManager
+
+PACK = ContentPack("test", ["Welcome to the training!", "1 - Go on"])
+
+
+class Job:
+    def __init__(self):
+        self.done = False
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return SessionMemoryManager(str(tmp_path), budget=10 ** 6, idle_seconds=10 ** 6)
+
+
+def fill(manager, state, text="x" * 200):
+    transcripts = manager.enter(state)
+    log = MessageLog(PACK)
+    log.append({"role": "assistant", "content": "Welcome to the training!"})
+    log.append({"role": "user", "content": text})
+    transcripts["Tab"] = log
+    transcripts["Plain"] = [{"role": "user", "content": text}]
+    manager.leave(state)
+    return transcripts
+
+
+def another_run(manager):
+    """A script run of some other session, whose leave() sweeps."""
+    state = {}
+    manager.enter(state)
+    manager.leave(state)
+
+
+def snapshots(manager) -> list:
+    return sorted(os.listdir(manager.snapshot_dir)) if os.path.isdir(manager.snapshot_dir) else []
+
+
+def test_idle_session_is_evicted_and_rehydrated(manager):
+    state = {}
+    transcripts = fill(manager, state)
+    before = {tab: list(log) for tab, log in transcripts.items()}
+    manager.idle_seconds = 0
+    another_run(manager)  # another session's run triggers the sweep
+    assert not transcripts
+    assert f"{state['_memory_key']}.json.z" in snapshots(manager)
+
+    restored = manager.enter(state)
+    assert restored is transcripts
+    assert {tab: list(log) for tab, log in restored.items()} == before
+    assert isinstance(restored["Tab"], MessageLog) and restored["Tab"].pack is PACK
+    assert f"{state['_memory_key']}.json.z" not in snapshots(manager)
+    assert manager.stats()["rehydrations"] == 1
+
+
+def test_running_session_is_never_evicted(manager):
+    state = {}
+    transcripts = fill(manager, state)
+    manager.enter(state)
+    manager.budget = 0
+    another_run(manager)
+    assert transcripts
+
+
+def test_session_with_a_running_job_is_kept_until_the_job_ends(manager):
+    state, job = {}, Job()
+    transcripts = fill(manager, state)
+    manager.hold(state, job)
+    manager.budget = 0
+    other = {}
+    fill(manager, other)
+    assert transcripts, "evicted while its job was running"
+    job.done = True
+    manager.enter(other)
+    manager.leave(other)
+    assert not transcripts
+
+
+def test_lru_eviction_stops_once_under_budget(manager):
+    states = [{} for _ in range(3)]
+    logs = [fill(manager, state) for state in states]
+    per_session = manager.stats()["resident_bytes"] // 3
+    manager.budget = per_session * 2 + per_session // 2
+    fill(manager, {}, text="y")  # a small fourth session's run sweeps
+    assert [bool(log) for log in logs] == [False, True, True]
+
+
+def test_session_that_comes_back_during_the_write_stays_resident(manager, monkeypatch):
+    state = {}
+    transcripts = fill(manager, state)
+    manager.idle_seconds = 0
+    real_compress = session_memory.zlib.compress
+
+    def compress_while_the_session_returns(data, level):
+        # The session's own run starts between the sweep and the commit, on another thread
+        returning = threading.Thread(target=manager.enter, args=(state,))
+        returning.start()
+        returning.join()
+        return real_compress(data, level)
+
+    monkeypatch.setattr(session_memory.zlib, "compress", compress_while_the_session_returns)
+    another_run(manager)
+    assert transcripts, "evicted while running"
+    assert f"{state['_memory_key']}.json.z" not in snapshots(manager)
+
+
+def test_lock_is_free_while_a_snapshot_is_written(manager, monkeypatch):
+    fill(manager, {})
+    manager.idle_seconds = 0
+    real_compress = session_memory.zlib.compress
+    lock_was_free = []
+
+    def compress(data, level):
+        lock_was_free.append(manager._lock.acquire(blocking=False))
+        if lock_was_free[-1]:
+            manager._lock.release()
+        return real_compress(data, level)
+
+    monkeypatch.setattr(session_memory.zlib, "compress", compress)
+    another_run(manager)
+    assert lock_was_free and all(lock_was_free)
+
+
+def test_lost_snapshot_starts_the_tabs_over(manager):
+    state = {}
+    fill(manager, state)
+    manager.idle_seconds = 0
+    another_run(manager)
+    for name in snapshots(manager):
+        os.remove(os.path.join(manager.snapshot_dir, name))
+    manager.idle_seconds = 10 ** 6
+    assert manager.enter(state) == {}
+    assert manager.stats()["lost"] == 1
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""SQLite backend, write-behind queue and session server (core/session_store.py)."""
+
+import threading
+
+import pytest
+
+from core import session_store
+from core.session_store import HTTPSessionStore, SQLiteSessionStore, WriteBehindStore, serve_session_store
+
+TOKEN = "abcdefghijklmnop1234"
+
+
+def message(seq: int) -> dict:
+    return {"role": "user" if seq % 2 else "assistant", "content": f"message {seq}"}
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+
+
+class FlakyBackend:
+    """Fails the first `failures` writes, then records what it is given."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, ops):
+        self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("backend down")
+        self.batches.append(list(ops))
+
+    def load(self, token):
+        return None
+
+
+def test_sqlite_round_trip(backend):
+    ops = [{"op": "message", "token": TOKEN, "tab": "Tab", "seq": seq, "message": message(seq)} for seq in (2, 1, 3)]
+    ops += [{"op": "state", "token": TOKEN, "key": "stage", "value": 1},
+            {"op": "state", "token": TOKEN, "key": "stage", "value": 2},
+            {"op": "state", "token": TOKEN, "key": "answers", "value": {"i": "I feel"}}]
+    backend.write(ops)
+    assert backend.load(TOKEN) == {"messages": {"Tab": [message(1), message(2), message(3)]},
+                                   "state": {"stage": 2, "answers": {"i": "I feel"}}}
+    assert backend.load("unknown-token-123456") is None
+    assert backend.stats() == {"sessions": 1, "messages": 3}
+
+
+def test_sqlite_batch_is_all_or_nothing(backend):
+    with pytest.raises(TypeError):
+        backend.write([{"op": "message", "token": TOKEN, "tab": "Tab", "seq": 1, "message": message(1)},
+                       {"op": "state", "token": TOKEN, "key": "bad", "value": object()}])
+    assert backend.load(TOKEN) is None
+
+
+def test_load_sees_everything_queued_before_it(backend):
+    store = WriteBehindStore(backend, batch_delay=0.01)
+    for seq in range(1, 51):
+        store.append_message(TOKEN, "Tab", seq, message(seq))
+    store.set_state(TOKEN, "stage", 3)
+    snapshot = store.load(TOKEN)  # a reconnect right after the last write
+    assert snapshot["messages"]["Tab"] == [message(seq) for seq in range(1, 51)]
+    assert snapshot["state"] == {"stage": 3}
+    assert store.stats()["pending"] == 0
+
+
+def test_writes_are_batched():
+    backend = FlakyBackend()
+    backend.release.clear()
+    store = WriteBehindStore(backend, max_batch=10, batch_delay=0.5)
+    for seq in range(25):
+        store.append_message(TOKEN, "Tab", seq, message(seq))
+    backend.release.set()
+    assert store.flush()
+    assert sum(len(batch) for batch in backend.batches) == 25
+    assert max(len(batch) for batch in backend.batches) <= 10
+    assert len(backend.batches) < 25
+
+
+def test_failed_batch_is_retried_in_order(monkeypatch):
+    monkeypatch.setattr(session_store, "RETRY_DELAY", 0.01)
+    backend = FlakyBackend(failures=2)
+    store = WriteBehindStore(backend, batch_delay=0.01)
+    for seq in range(5):
+        store.append_message(TOKEN, "Tab", seq, message(seq))
+    store.flush()  # released while the backend is down rather than held
+    for _ in range(100):
+        if store.flush() and store.stats()["pending"] == 0 and backend.batches:
+            break
+    written = [op["seq"] for batch in backend.batches for op in batch]
+    assert written == [0, 1, 2, 3, 4]
+    assert store.stats()["errors"] == 2
+
+
+def test_flush_does_not_hang_while_the_backend_is_down(monkeypatch):
+    monkeypatch.setattr(session_store, "RETRY_DELAY", 0.05)
+    store = WriteBehindStore(FlakyBackend(failures=10 ** 6), batch_delay=0.01)
+    store.append_message(TOKEN, "Tab", 1, message(1))
+    assert store.flush(timeout=2.0)
+
+
+def test_http_server_and_client(backend):
+    server = serve_session_store(backend, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = HTTPSessionStore(f"http://127.0.0.1:{server.server_address[1]}")
+        client.write([{"op": "message", "token": TOKEN, "tab": "Tab", "seq": 1, "message": message(1)},
+                      {"op": "state", "token": TOKEN, "key": "stage", "value": 2}])
+        assert client.load(TOKEN) == {"messages": {"Tab": [message(1)]}, "state": {"stage": 2}}
+        assert client.load("unknown-token-123456") is None
+        assert client.load("bad token") is None
+        assert client.stats()["sessions"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
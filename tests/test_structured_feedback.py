@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""FeedbackStreamParser and parse_feedback_json (core/structured_feedback.py)."""
+
+import json
+
+import pytest
+
+from core.structured_feedback import FeedbackStreamParser, parse_feedback_json
+
+
+def feed_all(parser: FeedbackStreamParser, chunks) -> str:
+    return "".join(parser.feed(chunk) for chunk in chunks)
+
+
+def chunked(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+REPLY = json.dumps({"feedback": 'Good "I" statement!\nKeep the focus on how you feel. 😊 café', "is_valid": True})
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, len(REPLY)])
+def test_any_chunking_decodes_the_same_feedback(size):
+    parser = FeedbackStreamParser()
+    assert feed_all(parser, chunked(REPLY, size)) == json.loads(REPLY)["feedback"]
+    assert parser.closed
+    assert parser.result() == json.loads(REPLY)
+
+
+def test_nothing_is_emitted_before_the_field_starts():
+    parser = FeedbackStreamParser()
+    assert parser.feed('{"is_valid": false, "feed') == ""
+    assert parser.feed('back": "Try ') == "Try "
+    assert parser.feed('again"}') == "again"
+    assert parser.result() == {"is_valid": False, "feedback": "Try again"}
+
+
+def test_escape_split_across_chunks_waits_for_the_rest():
+    parser = FeedbackStreamParser()
+    assert parser.feed('{"feedback": "a\\') == "a"
+    assert parser.feed('nb\\u00') == "\nb"
+    assert parser.feed('e9"}') == "é"
+
+
+def test_surrogate_pair_split_across_chunks():
+    parser = FeedbackStreamParser()
+    assert parser.feed('{"feedback": "\\ud83d') == ""
+    assert parser.feed('\\ude0a"') == "😊"
+
+
+def test_text_after_the_closing_quote_is_not_emitted():
+    parser = FeedbackStreamParser()
+    assert parser.feed('{"feedback": "done", "other": "not shown"}') == "done"
+    assert parser.feed(" more") == ""
+
+
+def test_other_field():
+    parser = FeedbackStreamParser("reflection")
+    assert feed_all(parser, chunked('{"feedback": "x", "reflection": "Well done"}', 4)) == "Well done"
+
+
+def test_truncated_reply_is_salvaged_when_is_valid_came_first():
+    parser = FeedbackStreamParser()
+    feed_all(parser, ['{"is_valid": true, "feedback": "Nice, but the rep', 'ly was cut'])
+    assert not parser.closed
+    assert parser.result() == {"feedback": "Nice, but the reply was cut", "is_valid": True}
+
+
+def test_truncated_reply_without_is_valid_raises():
+    parser = FeedbackStreamParser()
+    parser.feed('{"feedback": "cut off')
+    with pytest.raises(ValueError):
+        parser.result()
+
+
+@pytest.mark.parametrize("text", [
+    '```json\n{"feedback": "ok", "is_valid": true}\n```',
+    'Here you go: {"feedback": "ok", "is_valid": true} Hope it helps.',
+    '  {"feedback": "ok", "is_valid": true}  ',
+])
+def test_parse_feedback_json_tolerates_fences_and_stray_text(text):
+    assert parse_feedback_json(text) == {"feedback": "ok", "is_valid": True}
+
+
+def test_parse_feedback_json_rejects_text_without_an_object():
+    with pytest.raises(ValueError):
+        parse_feedback_json("I think this is a valid statement.")